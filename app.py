@@ -5,8 +5,10 @@ import pandas as pd
 import json
 import os
 import glob
+import time
 from dotenv import load_dotenv
 from utils import filter_duplicates, save_results_to_json, save_results_to_database,get_latest_json,convert_latest_json_to_gsheet,enrich_with_firecrawl, summarize_filtered_papers, filter_top_papers,convert_latest_json_to_gdoc,innovative_filtered_papers
+from search_index import search_papers, list_sources
 
 # ===================== PAGE CONFIG =====================
 st.set_page_config(page_title="Paper Search App", layout="wide")
@@ -27,9 +29,10 @@ load_dotenv(ENV_PATH)
 
 
 # ===================== TABS =====================
-tab1, tab2 = st.tabs([
+tab1, tab2, tab3 = st.tabs([
     "🌐 All APIs + Scholar",
-    "📁 Danh sách kết quả"
+    "📁 Danh sách kết quả",
+    "🔎 Tra cứu bài báo đã lưu"
 ])
 
 # ===================== TAB 1 =====================
@@ -138,3 +141,49 @@ with tab2:
                     key=filename
                 )
             st.markdown("---")
+
+
+
+# ===================== TAB 3 =====================
+with tab3:
+    st.subheader("🔎 Tra cứu toàn bộ bài báo đã thu thập")
+
+    query_tab3 = st.text_input("Từ khóa (tiêu đề, abstract, tác giả, điểm sáng tạo):", key="query_tab3")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        date_field_tab3 = st.selectbox(
+            "Lọc theo ngày",
+            options=["pub_date", "saved_date"],
+            format_func=lambda x: "Ngày xuất bản" if x == "pub_date" else "Ngày thu thập",
+            key="date_field_tab3"
+        )
+        use_date_tab3 = st.checkbox("Giới hạn khoảng ngày", key="use_date_tab3")
+        date_range_tab3 = st.date_input("Khoảng ngày", value=[], key="date_range_tab3") if use_date_tab3 else []
+    with col2:
+        sources_tab3 = st.multiselect("Nguồn", options=list_sources(), key="sources_tab3")
+        min_score_tab3 = st.slider("Score tối thiểu", min_value=0, max_value=10, value=0, key="min_score_tab3")
+    with col3:
+        limit_tab3 = st.number_input("Số kết quả tối đa", min_value=1, max_value=500, value=50, key="limit_tab3")
+
+    if query_tab3.strip():
+        date_from = date_range_tab3[0].isoformat() if len(date_range_tab3) > 0 else None
+        date_to = date_range_tab3[1].isoformat() if len(date_range_tab3) > 1 else None
+
+        start = time.perf_counter()
+        hits = search_papers(
+            query_tab3,
+            date_from=date_from,
+            date_to=date_to,
+            date_field=date_field_tab3,
+            sources=sources_tab3 or None,
+            min_score=min_score_tab3 or None,
+            limit=limit_tab3
+        )
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        st.caption(f"Tìm thấy {len(hits)} kết quả trong {elapsed_ms:.1f} ms")
+        if hits:
+            st.dataframe(pd.DataFrame(hits).drop(columns=["key", "rank"]))
+        else:
+            st.info("ℹ️ Không có bài báo nào khớp. Nếu index còn trống, chạy `python search_index.py` để index các file cũ.")
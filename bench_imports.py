@@ -0,0 +1,71 @@
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+
+# Các module mặc định được đo: utils (test.py, app.py) và run (GitHub Actions, daemon)
+DEFAULT_MODULES = ["utils", "run"]
+# Thư viện nặng chỉ nên được import khi dùng tới, không phải lúc khởi động
+HEAVY_MODULES = ["pandas", "google.genai", "googleapiclient", "google.oauth2", "selenium", "gspread"]
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_importtime(stderr):
+    """Dòng `import time: self | cumulative | module` của -X importtime → [(module, self_us, cumulative_us)]."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def measure(module):
+    """Import `module` trong 1 process Python mới, trả về (tổng thời gian import module (µs), các dòng importtime)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Import {module} lỗi:\n{result.stderr.strip().splitlines()[-1]}")
+    rows = parse_importtime(result.stderr)
+    total = next((cumulative for name, _, cumulative in reversed(rows) if name == module), 0)
+    return total, rows
+
+
+def bench(module, runs=5, top=10):
+    """Đo `runs` lần (cold start, mỗi lần 1 process), in trung vị và các module tốn thời gian nhất."""
+    samples = [measure(module) for _ in range(runs)]
+    totals = sorted(total for total, _ in samples)
+    _, rows = min(samples, key=lambda sample: sample[0])
+    loaded = {name for name, _, _ in rows}
+    heavy = [name for name in HEAVY_MODULES if name in loaded]
+
+    print(f"\n📦 import {module}: trung vị {statistics.median(totals) / 1000:.1f} ms "
+          f"(min {totals[0] / 1000:.1f}, max {totals[-1] / 1000:.1f}, {runs} lần)")
+    print(f"   Thư viện nặng đã import: {', '.join(heavy) if heavy else 'không có'}")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda row: -row[1])[:top]:
+        print(f"   {self_us / 1000:8.1f} ms  (tổng {cumulative_us / 1000:8.1f} ms)  {name}")
+    return statistics.median(totals) / 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đo thời gian import khi khởi động (python -X importtime)")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES, help="Module cần đo (mặc định: utils run)")
+    parser.add_argument("--runs", type=int, default=5, help="Số lần đo mỗi module")
+    parser.add_argument("--top", type=int, default=10, help="Số module tốn thời gian nhất được in ra")
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="Thoát mã 1 nếu trung vị của module nào vượt ngưỡng này (dùng trong CI)")
+    args = parser.parse_args()
+
+    failed = []
+    for module in args.modules:
+        median_ms = bench(module, args.runs, args.top)
+        if args.max_ms is not None and median_ms > args.max_ms:
+            failed.append(module)
+    if failed:
+        print(f"\n❌ Vượt {args.max_ms} ms: {', '.join(failed)}")
+        sys.exit(1)
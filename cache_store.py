@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import threading
+
+
+# ==============================
+# Cache lưu bền (file JSON) có TTL, negative cache và LRU
+# ==============================
+class PersistentCache:
+    """
+    Cache key → value lưu trong một file JSON.
+
+    - Mỗi entry có hạn dùng (TTL). Entry hết hạn coi như không có.
+    - Lỗi cũng được cache (negative cache) với TTL ngắn hơn, tăng gấp đôi sau mỗi
+      lần lỗi liên tiếp (backoff) đến tối đa `max_failure_ttl`.
+    - Giới hạn số entry `max_entries`, vượt quá thì xóa entry lâu không dùng nhất (LRU).
+    """
+
+    def __init__(self, path, ttl=90 * 86400, failure_ttl=86400, max_failure_ttl=30 * 86400,
+                 max_entries=5000):
+        self.path = path
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.max_failure_ttl = max_failure_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._entries = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"⚠️ File cache bị lỗi, tạo cache mới: {self.path} ({e})")
+            return {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, key):
+        """
+        Trả về entry còn hạn dạng {"ok": bool, "value": ...} hoặc None nếu chưa có/hết hạn.
+        "ok" = False nghĩa là lần trước bị lỗi (negative cache).
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry or entry["expires_at"] <= now:
+                return None
+            entry["last_access"] = now
+            self._dirty = True
+            return {"ok": entry["ok"], "value": entry.get("value")}
+
+    def get(self, key, default=None):
+        """Chỉ trả về giá trị của entry thành công còn hạn."""
+        entry = self.lookup(key)
+        return entry["value"] if entry and entry["ok"] else default
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        with self._lock:
+            self._entries[key] = {
+                "ok": True,
+                "value": value,
+                "expires_at": now + (ttl or self.ttl),
+                "last_access": now,
+                "failures": 0,
+            }
+            self._dirty = True
+            self._evict()
+
+    def set_failure(self, key, error=None):
+        now = time.time()
+        with self._lock:
+            old = self._entries.get(key) or {}
+            failures = old.get("failures", 0) + 1 if not old.get("ok", False) else 1
+            ttl = min(self.failure_ttl * 2 ** (failures - 1), self.max_failure_ttl)
+            self._entries[key] = {
+                "ok": False,
+                "value": error,
+                "expires_at": now + ttl,
+                "last_access": now,
+                "failures": failures,
+            }
+            self._dirty = True
+            self._evict()
+
+    def _evict(self):
+        overflow = len(self._entries) - self.max_entries
+        if overflow <= 0:
+            return
+        # Ưu tiên xóa entry đã hết hạn, sau đó đến entry lâu không dùng nhất
+        now = time.time()
+        oldest = sorted(
+            self._entries.items(),
+            key=lambda kv: (kv[1]["expires_at"] > now, kv[1]["last_access"])
+        )[:overflow]
+        for key, _ in oldest:
+            del self._entries[key]
+
+    def save(self):
+        """Ghi cache ra file (ghi file tạm rồi đổi tên để không làm hỏng file khi lỗi)."""
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
@@ -0,0 +1,161 @@
+import os
+import re
+import json
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+
+
+DATABASE_DIR = "database"
+CHECKPOINT_DIR = "checkpoints"
+STAGE_DIR = "stages"
+# File đánh dấu lần chạy đang chờ batch job (trong thư mục checkpoint của chủ đề)
+PENDING_MARKER = "pending"
+# Checkpoint theo bước của các lần chạy cũ hơn số ngày này bị xóa
+CHECKPOINT_KEEP_DAYS = int(os.getenv("CHECKPOINT_KEEP_DAYS", "3"))
+
+
+# ==============================
+# Checkpoint để chạy tiếp pipeline từ lần chạy trước
+# ==============================
+def get_checkpoint_path(name, db_dir=DATABASE_DIR):
+    return os.path.join(db_dir, CHECKPOINT_DIR, f"{name}.json")
+
+
+def load_checkpoint(name, db_dir=DATABASE_DIR):
+    """Trả về dữ liệu đã lưu của checkpoint `name`, None nếu chưa có hoặc file lỗi."""
+    path = get_checkpoint_path(name, db_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        print(f"⚠️ Bỏ qua checkpoint lỗi {path}: {e}")
+        return None
+
+
+def save_checkpoint(name, data, db_dir=DATABASE_DIR):
+    """
+    Ghi checkpoint (ghi ra file tạm rồi đổi tên để không bao giờ để lại file ghi dở).
+    Mỗi lần ghi dùng 1 file tạm riêng, nên các chủ đề chạy song song không giẫm lên nhau.
+    """
+    path = get_checkpoint_path(name, db_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def clear_checkpoint(name, db_dir=DATABASE_DIR):
+    path = get_checkpoint_path(name, db_dir)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+# ==============================
+# Checkpoint theo từng bước của 1 lần chạy (ngày, chủ đề, bước)
+# ==============================
+def topic_slug(topic):
+    return re.sub(r"[^a-z0-9]+", "_", topic.lower()).strip("_") or "topic"
+
+
+class StageCheckpoints:
+    """
+    Lưu đầu ra của từng bước tại database/checkpoints/stages/<ngày>/<chủ đề>/<bước>.json.
+    Lần chạy bị lỗi giữa chừng thì lần chạy lại trong ngày đọc đầu ra các bước đã xong và chỉ
+    chạy lại từ bước lỗi. Bước trong `force` (và mọi bước sau nó, vì đầu vào đã đổi) luôn chạy lại.
+    Khi cả lần chạy xong thì gọi complete() để lần chạy sau tìm bài mới từ đầu.
+
+    Lần chạy dừng vì batch job Gemini chưa xong (mark_pending) được tiếp tục cả khi đã sang
+    ngày khác: dùng lại đầu ra các bước của ngày đó → cùng tập request → poll đúng job cũ
+    thay vì collect lại và gửi job mới (job cũ đã tính phí mà không bao giờ được lấy kết quả).
+    """
+
+    def __init__(self, topic, stages, force=(), run_date=None, db_dir=DATABASE_DIR):
+        self.stages = list(stages)
+        self.db_dir = db_dir
+        self.run_date = run_date or self._pending_run_date(topic) or datetime.now().strftime("%Y-%m-%d")
+        self.prefix = f"{STAGE_DIR}/{self.run_date}/{topic_slug(topic)}"
+        unknown = set(force) - set(self.stages) - {"all"}
+        if unknown:
+            raise ValueError(f"Bước không tồn tại: {', '.join(sorted(unknown))}")
+        if "all" in force:
+            self.forced = set(self.stages)
+        else:
+            first = min((self.stages.index(stage) for stage in force), default=len(self.stages))
+            self.forced = set(self.stages[first:])
+
+    def _pending_run_date(self, topic):
+        """Ngày gần nhất trước hôm nay có lần chạy của chủ đề đang chờ batch job, None nếu không có."""
+        root = os.path.join(self.db_dir, CHECKPOINT_DIR, STAGE_DIR)
+        if not os.path.isdir(root):
+            return None
+        today = datetime.now().strftime("%Y-%m-%d")
+        for run_date in sorted(os.listdir(root), reverse=True):
+            if run_date < today and os.path.exists(
+                os.path.join(root, run_date, topic_slug(topic), f"{PENDING_MARKER}.json")
+            ):
+                print(f"♻️ [{topic}] Tiếp tục lần chạy ngày {run_date} đang chờ batch job")
+                return run_date
+        return None
+
+    def _name(self, stage):
+        return f"{self.prefix}/{stage}"
+
+    def mark_pending(self):
+        """Lần chạy dừng vì batch job chưa xong: lần chạy sau (kể cả ngày khác) tiếp tục từ đây."""
+        save_checkpoint(self._name(PENDING_MARKER), {
+            "marked_at": datetime.now().isoformat(timespec="seconds"),
+        }, self.db_dir)
+
+    def load(self, stage):
+        """(True, đầu ra) nếu bước đã xong ở lần chạy trước trong ngày, ngược lại (False, None)."""
+        if stage in self.forced:
+            return False, None
+        data = load_checkpoint(self._name(stage), self.db_dir)
+        if data is None:
+            return False, None
+        print(f"♻️ Bỏ qua bước '{stage}': dùng checkpoint lúc {data.get('completed_at')}")
+        return True, data["output"]
+
+    def save(self, stage, output):
+        save_checkpoint(self._name(stage), {
+            "stage": stage,
+            "completed_at": datetime.now().isoformat(timespec="seconds"),
+            "output": output,
+        }, self.db_dir)
+        # Đã chạy lại xong thì các lần gọi load sau đó dùng được đầu ra mới
+        self.forced.discard(stage)
+
+    def run(self, stage, fn):
+        """Đầu ra của bước `stage`: lấy từ checkpoint nếu có, không thì gọi fn() rồi lưu lại."""
+        done, output = self.load(stage)
+        if not done:
+            output = fn()
+            self.save(stage, output)
+        return output
+
+    def complete(self):
+        """Cả lần chạy đã xong: xóa checkpoint các bước của chủ đề trong ngày."""
+        shutil.rmtree(os.path.join(self.db_dir, CHECKPOINT_DIR, self.prefix), ignore_errors=True)
+
+
+def prune_stage_checkpoints(keep_days=CHECKPOINT_KEEP_DAYS, db_dir=DATABASE_DIR):
+    """Xóa checkpoint theo bước của các ngày cũ (lần chạy lỗi không bao giờ được chạy lại)."""
+    root = os.path.join(db_dir, CHECKPOINT_DIR, STAGE_DIR)
+    if not os.path.isdir(root):
+        return 0
+    cutoff = (datetime.now() - timedelta(days=keep_days)).strftime("%Y-%m-%d")
+    removed = 0
+    for run_date in os.listdir(root):
+        if run_date < cutoff:
+            shutil.rmtree(os.path.join(root, run_date), ignore_errors=True)
+            removed += 1
+    return removed
@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import random
+import signal
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Lịch chạy dạng cron 5 trường (phút giờ ngày tháng thứ), theo giờ UTC như schedule.yml
+DAEMON_SCHEDULE = os.getenv("DAEMON_SCHEDULE", "0 2,5,8,11,14,17,20,23 * * *")
+# Mỗi lần chạy lệch ngẫu nhiên 0..DAEMON_JITTER giây để không dồn request đúng đầu giờ
+DAEMON_JITTER = int(os.getenv("DAEMON_JITTER", "300"))
+DAEMON_HOST = os.getenv("DAEMON_HOST", "127.0.0.1")
+DAEMON_PORT = int(os.getenv("DAEMON_PORT", "8080"))  # 0 = không mở endpoint
+
+
+# ==============================
+# Cron
+# ==============================
+CRON_FIELDS = [("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 7)]
+
+
+def _parse_field(text, low, high):
+    values = set()
+    for part in text.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(v) for v in part.split("-", 1))
+        else:
+            start = end = int(part)
+            if step > 1:
+                end = high
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f"Giá trị cron ngoài khoảng {low}-{high}: {text}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def parse_cron(expr):
+    """
+    Cron 5 trường: hỗ trợ *, a-b, a,b, */n, a-b/n. Thứ 0 và 7 đều là Chủ nhật.
+    Như cron chuẩn: nếu cả ngày-trong-tháng và thứ đều bị giới hạn thì khớp 1 trong 2 là đủ.
+    """
+    parts = expr.split()
+    if len(parts) != 5:
+        raise ValueError(f"Cron cần 5 trường: {expr!r}")
+    fields = {name: _parse_field(part, low, high) for part, (name, low, high) in zip(parts, CRON_FIELDS)}
+    if 7 in fields["weekday"]:
+        fields["weekday"] = (fields["weekday"] - {7}) | {0}
+    fields["any_day"] = parts[2] == "*"
+    fields["any_weekday"] = parts[4] == "*"
+    return fields
+
+
+def _day_matches(cron, moment):
+    day_ok = moment.day in cron["day"]
+    weekday_ok = (moment.weekday() + 1) % 7 in cron["weekday"]  # Python: thứ 2 = 0; cron: Chủ nhật = 0
+    if cron["any_day"] or cron["any_weekday"]:
+        return day_ok and weekday_ok
+    return day_ok or weekday_ok
+
+
+def next_fire(cron, after):
+    """Thời điểm khớp cron đầu tiên sau `after` (chính xác đến phút)."""
+    moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    limit = moment + timedelta(days=366 * 5)
+    while moment < limit:
+        if moment.month not in cron["month"]:
+            moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+        elif not _day_matches(cron, moment):
+            moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+        elif moment.hour not in cron["hour"]:
+            moment = moment.replace(minute=0) + timedelta(hours=1)
+        elif moment.minute not in cron["minute"]:
+            moment += timedelta(minutes=1)
+        else:
+            return moment
+    raise ValueError("Cron không bao giờ khớp")
+
+
+# ==============================
+# Trạng thái & endpoint health/status
+# ==============================
+class DaemonState:
+    def __init__(self, schedule):
+        self.schedule = schedule
+        self.started_at = datetime.now(timezone.utc)
+        self.status = "starting"
+        self.runs = 0
+        self.failures = 0
+        self.next_run = None
+        self.last_run = None
+        self._lock = threading.Lock()
+
+    def update(self, **fields):
+        with self._lock:
+            for key, value in fields.items():
+                setattr(self, key, value)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "status": self.status,
+                "schedule": self.schedule,
+                "started_at": self.started_at.isoformat(timespec="seconds"),
+                "uptime_s": round((datetime.now(timezone.utc) - self.started_at).total_seconds()),
+                "runs": self.runs,
+                "failures": self.failures,
+                "next_run": self.next_run.isoformat(timespec="seconds") if self.next_run else None,
+                "last_run": self.last_run,
+            }
+
+
+def start_status_server(state, host=DAEMON_HOST, port=DAEMON_PORT):
+    """GET /health (sống hay không) và /status (chi tiết lần chạy gần nhất), chạy trong thread nền."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/health":
+                body = {"ok": state.status != "stopped", "status": state.status}
+                code = 200 if body["ok"] else 503
+            elif self.path == "/status":
+                body, code = state.to_dict(), 200
+            else:
+                body, code = {"error": "not found"}, 404
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="daemon-status").start()
+    print(f"🩺 Health/status: http://{host}:{server.server_address[1]}/status")
+    return server
+
+
+# ==============================
+# Vòng lặp lịch chạy
+# ==============================
+def serve(job, schedule=DAEMON_SCHEDULE, jitter=DAEMON_JITTER, host=DAEMON_HOST, port=DAEMON_PORT,
+          run_now=False, on_shutdown=None):
+    """
+    Chạy `job()` theo lịch cron trong cùng 1 process, để pool HTTP, pool Chrome, cache và index
+    trong bộ nhớ được dùng lại giữa các lần chạy.
+
+    SIGTERM/SIGINT: không bắt đầu lần chạy mới, đợi lần đang chạy xong rồi dừng
+    (nhận tín hiệu lần 2 thì thoát ngay). `on_shutdown()` dùng để đóng pool/lưu cache.
+    """
+    cron = parse_cron(schedule)
+    state = DaemonState(schedule)
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        print(f"🛑 Nhận tín hiệu {signum}: dừng sau lần chạy hiện tại...")
+        stop.set()
+        signal.signal(signum, signal.SIG_DFL)
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, request_stop)
+
+    server = start_status_server(state, host, port) if port else None
+    try:
+        first = True
+        while not stop.is_set():
+            now = datetime.now(timezone.utc)
+            fire = now if (first and run_now) else next_fire(cron, now) + timedelta(seconds=random.uniform(0, jitter))
+            first = False
+            state.update(status="idle", next_run=fire)
+            print(f"⏰ Lần chạy tiếp theo: {fire.isoformat(timespec='seconds')}")
+            if stop.wait(max(0.0, (fire - datetime.now(timezone.utc)).total_seconds())):
+                break
+
+            started = datetime.now(timezone.utc)
+            state.update(status="running", next_run=None)
+            start = time.perf_counter()
+            result, error = None, None
+            try:
+                result = job()
+            except Exception as e:
+                error = str(e)
+                print(f"❌ Lần chạy lỗi: {e}")
+            state.update(
+                runs=state.runs + 1,
+                failures=state.failures + (error is not None),
+                last_run={
+                    "started_at": started.isoformat(timespec="seconds"),
+                    "duration_s": round(time.perf_counter() - start, 1),
+                    "result": result,
+                    "error": error,
+                },
+            )
+    finally:
+        state.update(status="stopping")
+        if on_shutdown:
+            on_shutdown()
+        state.update(status="stopped")
+        if server:
+            server.shutdown()
+        print("👋 Daemon đã dừng.")
@@ -0,0 +1,209 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from run_report import report_add, report_set
+from paper_schema import normalize_paper, missing_fields, is_missing, extract_doi, extract_arxiv_id
+from search_api import lookup_openalex_by_doi, lookup_arxiv_by_id, lookup_openalex_by_title
+
+
+# ==============================
+# Executor chạy song song có giới hạn cho Firecrawl
+# ==============================
+class EnrichmentExecutor:
+    """
+    Chạy nhiều lời gọi scrape song song với số luồng tối đa `max_workers`.
+
+    - Giới hạn đồng thời tự điều chỉnh (AIMD): gặp 429 → giảm một nửa và chờ backoff,
+      thành công liên tiếp → tăng dần lại đến `max_workers`.
+    - Mỗi request có deadline riêng (`deadline` giây, truyền vào hàm scrape qua `timeout`).
+    - Kết quả trả về đúng thứ tự đầu vào.
+    """
+
+    def __init__(self, max_workers=4, min_workers=1, deadline=60, max_retries=3, backoff=5):
+        self.max_workers = max(1, max_workers)
+        self.min_workers = max(1, min(min_workers, self.max_workers))
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self._limit = self.max_workers
+        self._active = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self):
+        return self._limit
+
+    def _acquire(self):
+        with self._cond:
+            while self._active >= self._limit:
+                self._cond.wait()
+            self._active += 1
+
+    def _release(self, rate_limited):
+        with self._cond:
+            self._active -= 1
+            if rate_limited:
+                self._successes = 0
+                new_limit = max(self.min_workers, self._limit // 2)
+                if new_limit < self._limit:
+                    print(f"⚠️ Firecrawl trả về 429 → giảm số luồng còn {new_limit}")
+                self._limit = new_limit
+            else:
+                self._successes += 1
+                if self._successes >= self._limit and self._limit < self.max_workers:
+                    self._limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+    def _run_one(self, fn, item):
+        for attempt in range(self.max_retries + 1):
+            self._acquire()
+            rate_limited = False
+            try:
+                result = fn(item, timeout=self.deadline)
+                rate_limited = result.get("status_code") == 429
+            finally:
+                self._release(rate_limited)
+
+            if not rate_limited:
+                return result
+            report_add("enrichment", "rate_limited")
+            if attempt < self.max_retries:
+                time.sleep(self.backoff * (2 ** attempt))
+        return result
+
+    def map(self, fn, items):
+        """
+        Gọi fn(item, timeout=deadline) cho từng item, song song.
+        fn trả về dict; nếu dict có "status_code" == 429 thì item được thử lại sau backoff.
+        """
+        items = list(items)
+        if not items:
+            return []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(self._run_one, fn, item) for item in items]
+            return [f.result() for f in futures]
+
+
+# ==============================
+# Planner: chỉ bổ sung field còn thiếu
+# ==============================
+def plan_enrichment(papers):
+    """
+    Xem từng bài báo (theo schema chung) còn thiếu field nào.
+
+    Returns:
+        list: [(paper, [field thiếu])] cho các bài cần bổ sung và có link.
+              Bài đã đủ dữ liệu được bỏ qua và tính vào "skipped_complete".
+    """
+    plan = []
+    for paper in papers:
+        normalize_paper(paper)
+        missing = missing_fields(paper)
+        if not missing:
+            report_add("enrichment", "skipped_complete")
+            continue
+        if is_missing(paper.get("link")):
+            report_add("enrichment", "skipped_no_link")
+            continue
+        plan.append((paper, missing))
+    return plan
+
+
+def apply_enrichment(paper, fields, values):
+    """
+    Ghi kết quả bổ sung vào bài báo: chỉ ghi các field trong `fields` (field còn thiếu)
+    và chỉ khi giá trị mới hợp lệ, nên dữ liệu sẵn có không bao giờ bị ghi đè.
+
+    Returns:
+        list: Các field đã được bổ sung.
+    """
+    filled = []
+    for field in fields:
+        value = values.get(field)
+        if is_missing(paper.get(field)) and not is_missing(value):
+            paper[field] = value
+            filled.append(field)
+    return filled
+
+
+def firecrawl_values(data):
+    """Đổi kết quả Firecrawl ({"abstract", "pubdate"}) sang tên field chuẩn."""
+    return {"abstract": data.get("abstract"), "pub_date": data.get("pubdate")}
+
+
+# ==============================
+# Cascade: tra metadata API rẻ trước, Firecrawl sau cùng
+# ==============================
+def tier_openalex_doi(plan):
+    """OpenAlex filter=doi:a|b|c, 50 DOI mỗi request."""
+    dois = {i: extract_doi(paper) for i, (paper, _) in enumerate(plan)}
+    found = lookup_openalex_by_doi([d for d in dois.values() if d])
+    return {i: found[doi] for i, doi in dois.items() if doi in found}
+
+
+def tier_arxiv_id(plan):
+    """arXiv id_list=a,b,c cho các bài có link arxiv.org."""
+    ids = {i: extract_arxiv_id(paper) for i, (paper, _) in enumerate(plan)}
+    found = lookup_arxiv_by_id([a for a in ids.values() if a])
+    return {i: found[arxiv_id] for i, arxiv_id in ids.items() if arxiv_id in found}
+
+
+def tier_openalex_title(plan, max_lookups=20):
+    """OpenAlex theo tiêu đề (1 request/bài) cho bài không có DOI."""
+    found = {}
+    for i, (paper, _) in enumerate(plan):
+        if len(found) >= max_lookups or extract_doi(paper) or is_missing(paper.get("title")):
+            continue
+        record = lookup_openalex_by_title(paper["title"])
+        if record:
+            found[i] = record
+    return found
+
+
+METADATA_TIERS = [
+    ("openalex_doi", tier_openalex_doi),
+    ("arxiv_id", tier_arxiv_id),
+    ("openalex_title", tier_openalex_title),
+]
+
+
+def run_enrichment_cascade(plan, tiers=METADATA_TIERS):
+    """
+    Chạy lần lượt các tier tra cứu rẻ trên những bài còn thiếu field.
+    Sau mỗi tier, bài đã đủ dữ liệu được loại khỏi plan; bài mới đủ một phần
+    được chuyển sang tier sau với danh sách field còn thiếu.
+
+    Returns:
+        list: Plan còn lại [(paper, [field thiếu])] cho tier cuối (Firecrawl).
+    """
+    for name, tier in tiers:
+        if not plan:
+            break
+        start = time.perf_counter()
+        try:
+            found = tier(plan)
+        except Exception as e:
+            print(f"⚠️ Tier {name} lỗi: {e}")
+            found = {}
+        report_set("enrichment_tiers", f"{name}_latency_s", round(time.perf_counter() - start, 3))
+
+        remaining = []
+        for i, (paper, fields) in enumerate(plan):
+            if i in found:
+                apply_enrichment(paper, fields, found[i])
+            still_missing = missing_fields(paper, fields)
+            if still_missing:
+                remaining.append((paper, still_missing))
+            else:
+                mark_satisfied(paper, name)
+        plan = remaining
+    return plan
+
+
+def mark_satisfied(paper, tier_name):
+    """Ghi nhận tier đã bổ sung đủ dữ liệu cho bài báo vào báo cáo."""
+    report_add("enrichment_tiers", tier_name)
+    report_set("enrichment_by_paper", (paper.get("title") or "Untitled")[:60], tier_name)
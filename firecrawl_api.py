@@ -0,0 +1,273 @@
+import os
+import re
+import time
+import requests
+from dateutil import parser
+from dotenv import load_dotenv
+from paper_schema import canonicalize_url
+from search_api import http
+from run_report import report_add, report_max
+
+load_dotenv()
+FIRECRAWL_API_KEY = os.getenv("FIRECRAWL_API_KEY")
+# Cho phép trỏ sang server khác (self-host hoặc server giả lập khi test)
+FIRECRAWL_API_URL = os.getenv("FIRECRAWL_API_URL", "https://api.firecrawl.dev").rstrip("/")
+FIRECRAWL_TIMEOUT = int(os.getenv("FIRECRAWL_TIMEOUT", "60"))
+
+NOT_AVAILABLE = {"abstract": "Not Available", "pubdate": "Not Available"}
+
+# Chỉ lấy nội dung chính; ưu tiên vùng abstract/ngày xuất bản, bỏ menu, footer, tài liệu tham khảo
+SCRAPE_OPTIONS = {
+    "formats": ["markdown"],
+    "onlyMainContent": True,
+    "includeTags": [
+        "h1", "[class*='abstract']", "[id*='abstract']", "section.abstract",
+        "time", "[class*='publish']", "[class*='date']", "[class*='history']",
+    ],
+    "excludeTags": [
+        "nav", "header", "footer", "aside", "script", "style", "form", "figure",
+        "[class*='reference']", "[id*='reference']", "[class*='cookie']", "[class*='related']",
+    ],
+}
+# Bản dự phòng khi includeTags không khớp gì trên trang
+FALLBACK_SCRAPE_OPTIONS = {k: v for k, v in SCRAPE_OPTIONS.items() if k != "includeTags"}
+# Chỉ scrape lại (tốn thêm credit) khi nội dung rút gọn gần như rỗng; trang có nội dung mà không
+# có abstract (paywall, trang giới thiệu, 404 trả về 200) thì lần 2 cũng không khá hơn
+FALLBACK_MIN_CHARS = int(os.getenv("FIRECRAWL_FALLBACK_MIN_CHARS", "200"))
+
+
+def _headers():
+    if not FIRECRAWL_API_KEY:
+        raise ValueError("Thiếu FIRECRAWL_API_KEY, hãy set trong biến môi trường.")
+    return {"Authorization": f"Bearer {FIRECRAWL_API_KEY}"}
+
+
+def _needs_fallback(markdown):
+    return len((markdown or "").strip()) < FALLBACK_MIN_CHARS
+
+
+def _error_result(e):
+    status_code = e.response.status_code if getattr(e, "response", None) is not None else None
+    return {**NOT_AVAILABLE, "status_code": status_code, "error": str(e)}
+
+
+# ==============================
+# Trích xuất abstract & pubdate từ markdown
+# ==============================
+ABSTRACT_START = re.compile(r"abstract|tóm tắt", re.IGNORECASE)
+ABSTRACT_END = re.compile(r"keywords|introduction|references", re.IGNORECASE)
+# "Published: 2025-01-20", "Published 20 Jan 2025", "Ngày xuất bản: 20 Jan 2025"
+PUBDATE_PATTERN = re.compile(
+    r"(?:published|ngày xuất bản)[:\s]+(\d{4}-\d{2}-\d{2}|\d{1,2}\s\w+\s\d{4})", re.IGNORECASE
+)
+
+
+def _iter_lines(content):
+    """Duyệt từng dòng mà không tách cả tài liệu (dừng sớm thì không tốn phần còn lại)."""
+    start = 0
+    length = len(content)
+    while start < length:
+        end = content.find("\n", start)
+        if end == -1:
+            end = length
+        yield content[start:end]
+        start = end + 1
+
+
+def _parse_pubdate(content):
+    match = PUBDATE_PATTERN.search(content)
+    if not match:
+        return None
+    try:
+        return str(parser.parse(match.group(1)).date())
+    except (ValueError, OverflowError):
+        return None
+
+
+def extract_abstract_and_pubdate(content):
+    """
+    Trích xuất abstract và pubdate từ nội dung markdown của một trang.
+    Pubdate tìm trên cả nội dung (nhãn và ngày có thể nằm ở 2 dòng, vd. "Published:\n2025-01-20");
+    abstract duyệt từng dòng và dừng ngay khi gặp Keywords / Introduction.
+    """
+    if not content:
+        return dict(NOT_AVAILABLE)
+
+    pubdate = _parse_pubdate(content)
+    abstract_lines = []
+    capture = False
+
+    for line in _iter_lines(content):
+        # Bắt đầu từ Abstract / Tóm tắt
+        if ABSTRACT_START.search(line):
+            capture = True
+            continue
+        # Nếu gặp Keywords / Introduction thì dừng lại
+        if capture and ABSTRACT_END.search(line):
+            break
+        if capture:
+            abstract_lines.append(line.strip())
+
+    abstract = " ".join(abstract_lines).strip()
+    return {"abstract": abstract, "pubdate": pubdate or "Not Available"}
+
+
+def extract_and_measure(content):
+    """Trích xuất và ghi lại kích thước payload, thời gian trích xuất của trang vào báo cáo."""
+    start = time.perf_counter()
+    result = extract_abstract_and_pubdate(content)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    size = len((content or "").encode("utf-8"))
+    report_add("scrape_pages", "pages")
+    report_add("scrape_pages", "payload_bytes", size)
+    report_add("scrape_pages", "extract_ms", round(elapsed_ms, 3))
+    report_max("scrape_pages", "max_payload_bytes", size)
+    return result
+
+
+# ==============================
+# Scrape từng URL
+# ==============================
+def fetch_abstract_and_pubdate_firecrawl(url, timeout=FIRECRAWL_TIMEOUT):
+    """
+    Dùng Firecrawl Scrape API, trích xuất toàn bộ abstract và pubdate.
+    Khi lỗi HTTP, kết quả có thêm "status_code" (vd. 429) để executor biết cần giảm tải.
+    """
+    api_url = f"{FIRECRAWL_API_URL}/v1/scrape"
+    # Lần 1: chỉ lấy vùng abstract/ngày; includeTags không khớp gì (nội dung gần như rỗng)
+    # thì lấy cả nội dung chính
+    for options in (SCRAPE_OPTIONS, FALLBACK_SCRAPE_OPTIONS):
+        try:
+            resp = http.post(api_url, json={"url": url, **options}, headers=_headers(), timeout=timeout)
+            resp.raise_for_status()
+            data = resp.json()
+        except requests.exceptions.RequestException as e:
+            print(f"[Firecrawl Error] {e}")
+            return _error_result(e)
+
+        markdown = data.get("data", {}).get("markdown", "")
+        if options is FALLBACK_SCRAPE_OPTIONS or not _needs_fallback(markdown):
+            break
+        report_add("scrape_pages", "fallback_scrapes")
+    return extract_and_measure(markdown)
+
+
+# ==============================
+# Batch scrape: 1 job cho nhiều URL
+# ==============================
+def _page_result(page):
+    """Chuyển 1 document của batch job thành kết quả giống fetch_abstract_and_pubdate_firecrawl."""
+    metadata = page.get("metadata") or {}
+    status_code = metadata.get("statusCode")
+    if metadata.get("error") or (status_code and status_code >= 400):
+        error = metadata.get("error") or f"HTTP {status_code}"
+        return {**NOT_AVAILABLE, "status_code": status_code, "error": error}
+    return extract_and_measure(page.get("markdown", ""))
+
+
+def batch_fetch_abstract_and_pubdate_firecrawl(urls, on_result=None, poll_interval=2,
+                                               job_timeout=600, timeout=FIRECRAWL_TIMEOUT,
+                                               options=SCRAPE_OPTIONS):
+    """
+    Gửi toàn bộ URL thành 1 batch scrape job rồi poll cho đến khi xong.
+    Mỗi trang được trích xuất ngay khi xuất hiện trong kết quả poll (không chờ cả job),
+    và `on_result(url, result)` được gọi cho từng URL nếu có.
+    Trang không khớp includeTags (nội dung gần như rỗng) được gom lại chạy thêm 1 job
+    với FALLBACK_SCRAPE_OPTIONS.
+
+    Returns:
+        dict | None: {url: result} cho mọi URL đầu vào; None nếu không tạo được job
+        (để caller quay về chế độ scrape từng URL).
+    """
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return {}
+
+    try:
+        resp = http.post(
+            f"{FIRECRAWL_API_URL}/v1/batch/scrape",
+            json={"urls": urls, **options, "ignoreInvalidURLs": True},
+            headers=_headers(),
+            timeout=timeout,
+        )
+        resp.raise_for_status()
+        job = resp.json()
+    except requests.exceptions.RequestException as e:
+        print(f"[Firecrawl Batch Error] {e}")
+        return None
+    if not job.get("success") or not job.get("id"):
+        print(f"[Firecrawl Batch Error] Không tạo được job: {job}")
+        return None
+
+    status_url = f"{FIRECRAWL_API_URL}/v1/batch/scrape/{job['id']}"
+    by_key = {canonicalize_url(u): u for u in urls}
+    results = {}
+    needs_fallback = []
+
+    def collect(pages):
+        for page in pages:
+            metadata = page.get("metadata") or {}
+            source = metadata.get("sourceURL") or metadata.get("url") or ""
+            url = by_key.get(canonicalize_url(source))
+            if not url or url in results:
+                continue
+            results[url] = _page_result(page)
+            if "includeTags" in options and "error" not in results[url] and _needs_fallback(page.get("markdown")):
+                needs_fallback.append(url)
+            elif on_result:
+                on_result(url, results[url])
+
+    for url in job.get("invalidURLs") or []:
+        if url in by_key.values() and url not in results:
+            results[url] = {**NOT_AVAILABLE, "status_code": 400, "error": "Invalid URL"}
+            if on_result:
+                on_result(url, results[url])
+
+    deadline = time.monotonic() + job_timeout
+    status = None
+    while time.monotonic() < deadline:
+        try:
+            resp = http.get(status_url, headers=_headers(), timeout=timeout)
+            resp.raise_for_status()
+            status = resp.json()
+        except requests.exceptions.RequestException as e:
+            print(f"[Firecrawl Batch Error] {e}")
+            time.sleep(poll_interval)
+            continue
+
+        collect(status.get("data") or [])
+        if status.get("status") in ("completed", "failed", "cancelled"):
+            break
+        time.sleep(poll_interval)
+
+    # Kết quả lớn được chia trang qua "next"
+    next_url = status.get("next") if status and status.get("status") == "completed" else None
+    while next_url and len(results) < len(urls):
+        try:
+            resp = http.get(next_url, headers=_headers(), timeout=timeout)
+            resp.raise_for_status()
+            page_data = resp.json()
+        except requests.exceptions.RequestException as e:
+            print(f"[Firecrawl Batch Error] {e}")
+            break
+        collect(page_data.get("data") or [])
+        next_url = page_data.get("next")
+
+    # URL không có kết quả (job lỗi/hết giờ) → đánh dấu lỗi tạm thời để lần sau thử lại
+    for url in urls:
+        if url not in results:
+            results[url] = {**NOT_AVAILABLE, "status_code": None, "error": "Không có kết quả từ batch job"}
+            if on_result:
+                on_result(url, results[url])
+
+    if needs_fallback:
+        report_add("scrape_pages", "fallback_scrapes", len(needs_fallback))
+        fallback = batch_fetch_abstract_and_pubdate_firecrawl(
+            needs_fallback, on_result, poll_interval, job_timeout, timeout, FALLBACK_SCRAPE_OPTIONS
+        )
+        for url in needs_fallback:
+            if fallback is not None:
+                results[url] = fallback[url]
+            elif on_result:
+                on_result(url, results[url])
+    return results
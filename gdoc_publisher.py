@@ -0,0 +1,335 @@
+import os
+import re
+import math
+from datetime import datetime, timedelta
+from run_report import report_add
+from publish_snapshot import snapshot_entries, load_snapshot, save_snapshot, diff_snapshot
+
+
+SNAPSHOT_SINK = "gdoc"
+DAY_RANGE_PREFIX = "papers-day-"
+PAPER_RANGE_PREFIX = "papers-paper-"
+# Named range 1 ký tự ở cuối block ngày cuối cùng: vị trí chèn ngày mới, không phải đọc body
+END_RANGE_NAME = "papers-end"
+# Ngày cũ hơn số ngày này là "đã chốt": named range của ngày và của từng bài bị xóa, nên số
+# named range (và kích thước lần đọc DOC_FIELDS) không tăng theo độ dài tài liệu
+GDOC_OPEN_DAYS = int(os.getenv("GDOC_OPEN_DAYS", "2"))
+# Chỉ đọc named range; body chỉ được đọc khi tài liệu chưa có END_RANGE_NAME hoặc ghi lại ngày đã chốt
+DOC_FIELDS = "namedRanges"
+LEGACY_FIELDS = "body.content(startIndex,endIndex,paragraph(elements(textRun(content))))"
+# Dòng header của 1 ngày (không khớp các dòng "Ngày xuất bản: ..." của từng bài)
+DAY_HEADER_PATTERN = re.compile(r"^\s*Ngày \d{4}-\d{2}-\d{2}\s*$")
+
+HEADER_STYLE = {
+    "textStyle": {"bold": True, "foregroundColor": {"color": {"rgbColor": {"red": 1, "green": 0, "blue": 0}}}},
+    "fields": "bold,foregroundColor",
+}
+TITLE_STYLE = {
+    "textStyle": {"bold": True, "foregroundColor": {"color": {"rgbColor": {"red": 0, "green": 0, "blue": 0}}}},
+    "fields": "bold,foregroundColor",
+}
+
+
+def utf16_len(text):
+    """Docs API đánh chỉ số theo UTF-16 code unit (emoji, ký tự ngoài BMP chiếm 2)."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _text(value, default):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return default
+    if isinstance(value, list):
+        return ", ".join(str(v) for v in value) or default
+    return str(value).strip() or default
+
+
+def day_range_name(date_str):
+    return f"{DAY_RANGE_PREFIX}{date_str}"
+
+
+def paper_range_name(date_str, index):
+    return f"{PAPER_RANGE_PREFIX}{date_str}-{index}"
+
+
+def render_paper(index, paper):
+    return format_paper(index, paper)[0]
+
+
+# ==============================
+# Dựng nội dung của 1 ngày
+# ==============================
+def format_paper(index, paper):
+    """Đoạn văn bản của 1 bài báo và vị trí (tương đối) của tiêu đề để in đậm."""
+    prefix = f"{index}. "
+    title = _text(paper.get("title"), "Không có tiêu đề")
+    text = (
+        f"{prefix}{title}\n"
+        f"Tác giả: {_text(paper.get('authors'), 'Không rõ tác giả')}\n"
+        f"Ngày xuất bản: {_text(paper.get('pub_date'), 'Không rõ ngày')}\n\n"
+        f"Innovative: {_text(paper.get('innovative'), '')}\n\n"
+    )
+    return text, (utf16_len(prefix), utf16_len(prefix) + utf16_len(title))
+
+
+def build_papers_text(papers, first_index, start):
+    """
+    Văn bản của các bài (đánh số từ `first_index`) để chèn tại `start`.
+
+    Returns:
+        tuple: (text, style_requests, [(start, end) của từng bài])
+    """
+    parts, styles, spans = [], [], []
+    offset = start
+    for i, paper in enumerate(papers, first_index):
+        text, (title_start, title_end) = format_paper(i, paper)
+        styles.append({"updateTextStyle": {
+            "range": {"startIndex": offset + title_start, "endIndex": offset + title_end},
+            **TITLE_STYLE,
+        }})
+        parts.append(text)
+        spans.append((offset, offset + utf16_len(text)))
+        offset += utf16_len(text)
+    return "".join(parts), styles, spans
+
+
+def build_day_block(papers, date_str, start):
+    """
+    Văn bản của cả ngày (header + các bài) để chèn tại `start`, cùng các request định dạng
+    với chỉ số tuyệt đối tính từ `start`.
+
+    Returns:
+        tuple: (text, style_requests, [(start, end) của từng bài])
+    """
+    day_header = f" Ngày {date_str}"
+    header = f"\n{day_header}\n\n"
+    styles = [{"updateTextStyle": {
+        "range": {"startIndex": start + 1, "endIndex": start + 1 + utf16_len(day_header)},
+        **HEADER_STYLE,
+    }}]
+    text, paper_styles, spans = build_papers_text(papers, 1, start + utf16_len(header))
+    return header + text, styles + paper_styles, spans
+
+
+def create_range_request(name, start, end):
+    return {"createNamedRange": {"name": name, "range": {"startIndex": start, "endIndex": end}}}
+
+
+# ==============================
+# Tìm vùng của ngày trong tài liệu
+# ==============================
+def find_named_range(doc, name):
+    """(start, end, named_range_id) của named range `name`, None nếu chưa có."""
+    group = (doc.get("namedRanges") or {}).get(name)
+    for named_range in (group or {}).get("namedRanges", []):
+        ranges = named_range.get("ranges") or []
+        if ranges:
+            return ranges[0]["startIndex"], ranges[-1]["endIndex"], named_range.get("namedRangeId")
+    return None
+
+
+def find_day_range(doc, date_str):
+    return find_named_range(doc, day_range_name(date_str))
+
+
+def range_date(name):
+    """Ngày của named range ngày/bài (papers-day-<ngày>, papers-paper-<ngày>-<i>), None nếu không phải."""
+    for prefix in (DAY_RANGE_PREFIX, PAPER_RANGE_PREFIX):
+        if name.startswith(prefix):
+            return name[len(prefix):len(prefix) + 10]
+    return None
+
+
+def open_days_cutoff():
+    """Ngày nhỏ hơn giá trị này đã chốt (xem GDOC_OPEN_DAYS)."""
+    return (datetime.now() - timedelta(days=GDOC_OPEN_DAYS)).strftime("%Y-%m-%d")
+
+
+def finalize_requests(doc, date_str):
+    """Xóa named range của các ngày đã chốt (trừ ngày đang ghi); nội dung giữ nguyên."""
+    cutoff = open_days_cutoff()
+    requests = []
+    for name, group in (doc.get("namedRanges") or {}).items():
+        day = range_date(name)
+        if day and day < cutoff and day != date_str:
+            requests.extend({"deleteNamedRange": {"namedRangeId": named_range["namedRangeId"]}}
+                            for named_range in group.get("namedRanges", []))
+    if requests:
+        report_add("gdoc_publish", "ranges_finalized", len(requests))
+    return requests
+
+
+def end_requests(doc, end):
+    """Đặt lại END_RANGE_NAME vào ký tự cuối của block ngày cuối cùng (`end`: chỉ số sau khi sửa)."""
+    requests = []
+    found = find_named_range(doc, END_RANGE_NAME)
+    if found:
+        requests.append({"deleteNamedRange": {"namedRangeId": found[2]}})
+    if end > 1:
+        requests.append(create_range_request(END_RANGE_NAME, end - 1, end))
+    return requests
+
+
+def fetch_content(service, document_id):
+    """Đọc nội dung body (chỉ khi không tránh được: tài liệu cũ hoặc ngày đã chốt)."""
+    doc = service.documents().get(documentId=document_id, fields=LEGACY_FIELDS).execute()
+    report_add("gdoc_publish", "api_calls")
+    report_add("gdoc_publish", "body_reads")
+    return doc.get("body", {}).get("content", [])
+
+
+def find_legacy_day_range(content, date_str):
+    """
+    Block ngày không có named range (tài liệu cũ, hoặc ngày đã chốt): quét header "Ngày <date>" như trước.
+    """
+    def first_text(el):
+        elements = el.get("paragraph", {}).get("elements") or [{}]
+        return elements[0].get("textRun", {}).get("content", "")
+
+    for i, el in enumerate(content):
+        if f" Ngày {date_str}" in first_text(el):
+            end = content[-1]["endIndex"] - 1
+            for following in content[i + 1:]:
+                if DAY_HEADER_PATTERN.match(first_text(following)):
+                    end = following["startIndex"] - 1
+                    break
+            # Mỗi block bắt đầu bằng "\n" ngay trước dòng header
+            return max(el.get("startIndex", 1) - 1, 1), end, None
+    return None
+
+
+# ==============================
+# Ghi lại cả ngày bằng 1 lần batchUpdate
+# ==============================
+def rewrite_day_in_gdoc(service, document_id, doc, papers, date_str):
+    """
+    Thay toàn bộ nội dung của ngày `date_str` bằng `papers` trong 1 lần batchUpdate: xóa vùng cũ,
+    chèn văn bản mới, định dạng, tạo lại named range của ngày và của từng bài.
+    Ngày mới được chèn ở cuối block ngày cuối cùng (END_RANGE_NAME).
+    """
+    requests = finalize_requests(doc, date_str)
+    anchor = find_named_range(doc, END_RANGE_NAME)
+    content = None
+    found = find_day_range(doc, date_str)
+    # Tài liệu cũ chưa có END_RANGE_NAME, hoặc ngày đã chốt (không còn named range) → quét header
+    if found is None and (anchor is None or date_str < open_days_cutoff()):
+        content = fetch_content(service, document_id)
+        found = find_legacy_day_range(content, date_str)
+
+    if anchor:
+        old_end = anchor[1]
+    else:
+        content = content if content is not None else fetch_content(service, document_id)
+        # Trước ký tự xuống dòng cuối cùng của tài liệu
+        old_end = content[-1]["endIndex"] - 1 if content else 1
+
+    paper_prefix = paper_range_name(date_str, "")
+    for name, group in (doc.get("namedRanges") or {}).items():
+        if name.startswith(paper_prefix):
+            requests.extend({"deleteNamedRange": {"namedRangeId": named_range["namedRangeId"]}}
+                            for named_range in group.get("namedRanges", []))
+
+    removed = 0
+    if found:
+        start, end, named_range_id = found
+        if named_range_id:
+            requests.append({"deleteNamedRange": {"namedRangeId": named_range_id}})
+        if end > start:
+            requests.append({"deleteContentRange": {"range": {"startIndex": start, "endIndex": end}}})
+            removed = end - start
+    else:
+        start = old_end
+
+    text, styles, spans = build_day_block(papers, date_str, start)
+    requests.append({"insertText": {"location": {"index": start}, "text": text}})
+    requests.extend(styles)
+    requests.append(create_range_request(day_range_name(date_str), start, start + utf16_len(text)))
+    requests.extend(create_range_request(paper_range_name(date_str, i), span_start, span_end)
+                    for i, (span_start, span_end) in enumerate(spans, 1))
+    # Mọi thay đổi nằm trước điểm cuối cũ → điểm cuối dịch đúng bằng phần tăng thêm
+    requests.extend(end_requests(doc, old_end + utf16_len(text) - removed))
+    report_add("gdoc_publish", "full_rewrites")
+    return requests
+
+
+# ==============================
+# Chỉ ghi phần thay đổi so với lần publish trước
+# ==============================
+def update_day_in_gdoc(doc, papers, date_str, updated, appended):
+    """
+    Request cho các bài đổi nội dung (`updated`) và bài mới (`appended`, chỉ số 0-based).
+    Sửa từ cuối tài liệu lên đầu nên chỉ số đọc được từ `doc` luôn còn đúng.
+
+    Returns:
+        list | None: None nếu thiếu named range cần dùng (tài liệu bị sửa tay) → ghi lại cả ngày.
+    """
+    day = find_day_range(doc, date_str)
+    anchor = find_named_range(doc, END_RANGE_NAME)
+    paper_ranges = {i: find_named_range(doc, paper_range_name(date_str, i + 1)) for i in updated}
+    if day is None or anchor is None or not all(paper_ranges.values()):
+        return None
+    start, end, day_range_id = day
+
+    requests = finalize_requests(doc, date_str)
+    growth = 0
+    if appended:
+        # Bài mới nối vào cuối vùng của ngày, đánh số tiếp theo các bài đã có
+        text, styles, spans = build_papers_text([papers[i] for i in appended], appended[0] + 1, end)
+        requests.append({"insertText": {"location": {"index": end}, "text": text}})
+        requests.extend(styles)
+        requests.extend(create_range_request(paper_range_name(date_str, i + 1), span_start, span_end)
+                        for i, (span_start, span_end) in zip(appended, spans))
+        growth += utf16_len(text)
+
+    for i in sorted(updated, reverse=True):
+        paper_start, paper_end, _ = paper_ranges[i]
+        text, (title_start, title_end) = format_paper(i + 1, papers[i])
+        # Giữ lại số thứ tự ở đầu và "\n" ở cuối: chỉ sửa bên trong named range nên range tự co giãn theo
+        body_start = paper_start + title_start
+        body = text[len(f"{i + 1}. "):-1]
+        requests.append({"deleteContentRange": {"range": {"startIndex": body_start, "endIndex": paper_end - 1}}})
+        requests.append({"insertText": {"location": {"index": body_start}, "text": body}})
+        requests.append({"updateTextStyle": {
+            "range": {"startIndex": body_start, "endIndex": paper_start + title_end},
+            **TITLE_STYLE,
+        }})
+        growth += utf16_len(body) - (paper_end - 1 - body_start)
+
+    if appended:
+        # Chèn ở đúng mép cuối không mở rộng named range của ngày → tạo lại với điểm cuối mới
+        requests.append({"deleteNamedRange": {"namedRangeId": day_range_id}})
+        requests.append(create_range_request(day_range_name(date_str), start, end + growth))
+    requests.extend(end_requests(doc, anchor[1] + growth))
+    report_add("gdoc_publish", "papers_inserted", len(appended))
+    report_add("gdoc_publish", "papers_updated", len(updated))
+    return requests
+
+
+def publish_day_to_gdoc(service, document_id, papers, date_str):
+    """
+    Publish ngày `date_str` lên Google Docs, chỉ gửi phần khác so với snapshot lần publish trước
+    (database/published/gdoc/<document_id>/<ngày>.json):
+    - không có gì đổi → không gọi API;
+    - chỉ thêm/sửa bài → 1 documents.get (DOC_FIELDS) + 1 batchUpdate chỉ chứa các bài đó;
+    - còn lại (chưa có snapshot, bài bị xóa/đổi thứ tự) → ghi lại cả ngày.
+    DOC_FIELDS chỉ chứa named range của các ngày chưa chốt (GDOC_OPEN_DAYS) và END_RANGE_NAME,
+    nên lần đọc không lớn dần theo tài liệu.
+    """
+    entries = snapshot_entries(papers, render_paper)
+    diff = diff_snapshot(load_snapshot(SNAPSHOT_SINK, document_id, date_str), entries, document_id)
+    if diff is not None and not any(diff):
+        report_add("gdoc_publish", "days_unchanged")
+        print(f"⏩ Google Docs: ngày {date_str} không có thay đổi")
+        return 0
+
+    doc = service.documents().get(documentId=document_id, fields=DOC_FIELDS).execute()
+    report_add("gdoc_publish", "api_calls")
+
+    requests = update_day_in_gdoc(doc, papers, date_str, *diff) if diff else None
+    if requests is None:
+        requests = rewrite_day_in_gdoc(service, document_id, doc, papers, date_str)
+
+    service.documents().batchUpdate(documentId=document_id, body={"requests": requests}).execute()
+    report_add("gdoc_publish", "api_calls")
+    report_add("gdoc_publish", "requests", len(requests))
+    save_snapshot(SNAPSHOT_SINK, document_id, date_str, {"target": document_id, "papers": entries})
+    return len(requests)
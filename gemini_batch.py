@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from checkpoint import load_checkpoint, save_checkpoint
+from run_report import report_add, report_set
+
+
+GEMINI_BATCH_POLL_INTERVAL = int(os.getenv("GEMINI_BATCH_POLL_INTERVAL", "30"))
+# Chờ tối đa bao lâu trong 1 lần chạy; quá hạn thì lần chạy sau (cron, 3 giờ/lần) tiếp tục poll job cũ
+# từ checkpoint. Giữ ngắn để không giữ runner GitHub Actions chỉ để chờ job
+GEMINI_BATCH_TIMEOUT = int(os.getenv("GEMINI_BATCH_TIMEOUT", "300"))
+BATCH_JOBS_CHECKPOINT = "gemini_batch_jobs"
+# Job chưa được lấy kết quả sau số ngày này bị bỏ khỏi checkpoint (Gemini cũng chỉ giữ batch job ~48 giờ)
+GEMINI_BATCH_KEEP_DAYS = int(os.getenv("GEMINI_BATCH_KEEP_DAYS", "3"))
+
+DONE_STATES = {
+    "JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED",
+    "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED",
+}
+SUCCESS_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED"}
+# Các chủ đề chạy song song cùng đọc-sửa-ghi checkpoint BATCH_JOBS_CHECKPOINT
+_jobs_lock = threading.Lock()
+
+
+class BatchJobPending(Exception):
+    """Job chưa xong khi hết GEMINI_BATCH_TIMEOUT; job vẫn chạy và được ghi trong checkpoint."""
+
+
+def _state(job):
+    state = getattr(job, "state", None)
+    return getattr(state, "name", None) or str(state or "")
+
+
+def batch_fingerprint(requests):
+    """Cùng tập request (cùng id, cùng prompt) → cùng fingerprint, để lần chạy sau tìm lại job cũ."""
+    payload = json.dumps([[str(r["id"]), r["contents"]] for r in requests], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _inlined_request(request):
+    inlined = {"contents": request["contents"], "metadata": {"id": str(request["id"])}}
+    if request.get("config") is not None:
+        inlined["config"] = request["config"]
+    return inlined
+
+
+def submit_batch_job(client, model, requests, display_name="paper-collector"):
+    """Gửi mọi request thành 1 batch job (inline), trả về tên job."""
+    job = client.batches.create(
+        model=model,
+        src=[_inlined_request(r) for r in requests],
+        config={"display_name": display_name},
+    )
+    print(f"📦 Đã tạo Gemini batch job {job.name} ({len(requests)} request)")
+    report_add("gemini_batch", "jobs_submitted")
+    report_add("gemini_batch", "requests", len(requests))
+    return job.name
+
+
+def wait_for_batch_job(client, name, poll_interval=GEMINI_BATCH_POLL_INTERVAL, timeout=GEMINI_BATCH_TIMEOUT):
+    """Poll đến khi job kết thúc. Returns: job, hoặc None nếu hết thời gian chờ."""
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.batches.get(name=name)
+        state = _state(job)
+        if state in DONE_STATES:
+            return job
+        if time.monotonic() >= deadline:
+            return None
+        print(f"⏳ Batch job {name}: {state}")
+        time.sleep(poll_interval)
+
+
+def batch_job_results(job, requests):
+    """
+    Ghép kết quả inline của job với request theo metadata["id"]
+    (không có metadata thì theo thứ tự gửi).
+
+    Returns:
+        dict: {id: (response, error)} cho mọi request.
+    """
+    ids = {str(r["id"]): r["id"] for r in requests}
+    dest = getattr(job, "dest", None)
+    responses = (getattr(dest, "inlined_responses", None) or []) if dest else []
+
+    results = {}
+    for position, item in enumerate(responses):
+        key = (getattr(item, "metadata", None) or {}).get("id")
+        if key is None and position < len(requests):
+            key = str(requests[position]["id"])
+        if key not in ids:
+            continue
+        if getattr(item, "error", None) or getattr(item, "response", None) is None:
+            results[ids[key]] = (None, RuntimeError(f"Batch item lỗi: {getattr(item, 'error', None)}"))
+        else:
+            results[ids[key]] = (item.response, None)
+
+    for request in requests:
+        if request["id"] not in results:
+            results[request["id"]] = (None, RuntimeError("Batch job không trả kết quả cho request này"))
+    return results
+
+
+def _job_name(entry):
+    # Checkpoint cũ chỉ lưu tên job (str)
+    return entry.get("name") if isinstance(entry, dict) else entry
+
+
+def prune_batch_jobs(keep_days=GEMINI_BATCH_KEEP_DAYS):
+    """
+    Bỏ khỏi checkpoint các job gửi quá `keep_days` ngày mà chưa được lấy kết quả (job đã lấy
+    kết quả được bỏ ngay trong run_batch_job). Entry kiểu cũ (không có ngày gửi) được tính từ hôm nay.
+
+    Returns:
+        int: Số job đã bỏ.
+    """
+    cutoff = (datetime.now() - timedelta(days=keep_days)).isoformat(timespec="seconds")
+    with _jobs_lock:
+        jobs = load_checkpoint(BATCH_JOBS_CHECKPOINT) or {}
+        kept = {}
+        for fingerprint, entry in jobs.items():
+            if not isinstance(entry, dict):
+                entry = {"name": entry, "submitted_at": datetime.now().isoformat(timespec="seconds")}
+            if entry.get("submitted_at", "") >= cutoff:
+                kept[fingerprint] = entry
+            else:
+                print(f"🗑️ Bỏ Gemini batch job {entry.get('name')} gửi lúc {entry.get('submitted_at')}")
+        if kept != jobs:
+            save_checkpoint(BATCH_JOBS_CHECKPOINT, kept)
+    removed = len(jobs) - len(kept)
+    if removed:
+        report_add("gemini_batch", "jobs_pruned", removed)
+    return removed
+
+
+def _forget_job(fingerprint):
+    """Bỏ job khỏi checkpoint (đọc-sửa-ghi dưới _jobs_lock); lỗi ghi chỉ cảnh báo."""
+    with _jobs_lock:
+        jobs = load_checkpoint(BATCH_JOBS_CHECKPOINT) or {}
+        if jobs.pop(fingerprint, None) is None:
+            return
+        try:
+            save_checkpoint(BATCH_JOBS_CHECKPOINT, jobs)
+        except Exception as e:
+            print(f"⚠️ Không cập nhật được checkpoint batch job: {e}")
+
+
+def run_batch_job(client, model, requests, on_result=None, poll_interval=GEMINI_BATCH_POLL_INTERVAL,
+                  timeout=GEMINI_BATCH_TIMEOUT):
+    """
+    Chạy các request (dạng của GeminiExecutor) qua Gemini Batch API.
+    Tên job được ghi vào checkpoint theo fingerprint của tập request, nên nếu lần chạy
+    trước đã gửi đúng tập request này thì chỉ poll tiếp job cũ chứ không gửi lại
+    (StageCheckpoints giữ nguyên đầu vào của lần chạy đang chờ, kể cả sang ngày khác).
+
+    Returns:
+        dict | None: {id: (response, error)}; None nếu không tạo được job hoặc job thất bại
+        (caller quay về chạy online).
+
+    Raises:
+        BatchJobPending: Job chưa xong sau `timeout` giây.
+    """
+    requests = list(requests)
+    if not requests:
+        return {}
+
+    fingerprint = batch_fingerprint(requests)
+    start = time.perf_counter()
+    try:
+        with _jobs_lock:
+            jobs = load_checkpoint(BATCH_JOBS_CHECKPOINT) or {}
+            name = _job_name(jobs.get(fingerprint))
+            if name:
+                print(f"♻️ Tiếp tục poll Gemini batch job {name}")
+                report_add("gemini_batch", "jobs_resumed")
+            else:
+                try:
+                    name = submit_batch_job(client, model, requests)
+                except Exception as e:
+                    print(f"[Gemini Batch Error] Không tạo được batch job: {e}")
+                    return None
+                jobs[fingerprint] = {"name": name, "submitted_at": datetime.now().isoformat(timespec="seconds")}
+                try:
+                    save_checkpoint(BATCH_JOBS_CHECKPOINT, jobs)
+                except Exception as e:
+                    # Job đã gửi (đã tính phí): vẫn poll trong lần chạy này, chỉ là lần sau không resume được
+                    print(f"⚠️ Không lưu được checkpoint cho batch job {name}: {e}")
+        try:
+            job = wait_for_batch_job(client, name, poll_interval, timeout)
+        except Exception as e:
+            print(f"[Gemini Batch Error] {e}")
+            _forget_job(fingerprint)
+            return None
+    finally:
+        report_add("gemini_batch", "wait_s", round(time.perf_counter() - start, 1))
+
+    if job is None:
+        raise BatchJobPending(f"Gemini batch job {name} chưa xong")
+
+    # Job đã kết thúc (thành công hay không) → không poll lại lần sau
+    _forget_job(fingerprint)
+    state = _state(job)
+    report_set("gemini_batch", "last_state", state)
+    if state not in SUCCESS_STATES:
+        print(f"⚠️ Gemini batch job {name} kết thúc với trạng thái {state}")
+        return None
+
+    results = batch_job_results(job, requests)
+    for request_id, (response, error) in results.items():
+        report_add("gemini_batch", "failed_items" if error else "succeeded_items")
+        if on_result:
+            on_result(request_id, response, error)
+    return results
@@ -0,0 +1,333 @@
+import json
+import math
+from run_report import report_add
+from publish_snapshot import snapshot_entries, load_snapshot, save_snapshot, diff_snapshot
+
+
+SNAPSHOT_SINK = "gsheet"
+DAY_METADATA_KEY = "papers_day"
+# Chỉ lấy id, tên và số hàng của các sheet
+SHEET_FIELDS = "sheets(properties(sheetId,title,gridProperties(rowCount)))"
+BLANK_ROWS_BETWEEN_DAYS = 2
+DATA_ROW_HEIGHT = 378  # ~10cm
+
+DAY_HEADER_FORMAT = {
+    "textFormat": {"bold": True, "foregroundColor": {"red": 1, "green": 0, "blue": 0}, "fontSize": 13},
+    "horizontalAlignment": "CENTER",
+    "backgroundColor": {"red": 0.85, "green": 0.93, "blue": 1.0},
+}
+COLUMN_HEADER_FORMAT = {
+    "textFormat": {"bold": True},
+    "horizontalAlignment": "CENTER",
+    "backgroundColor": {"red": 0.95, "green": 0.95, "blue": 0.95},
+    "wrapStrategy": "WRAP",
+}
+DATA_FORMAT = {"textFormat": {"bold": False}, "horizontalAlignment": "CENTER", "wrapStrategy": "WRAP"}
+SOLID = {"style": "SOLID", "width": 1}
+
+
+def _cell_text(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    if isinstance(value, list):
+        return ", ".join(str(v) for v in value)
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def _cell(value, fmt):
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and not math.isnan(value):
+        entered = {"numberValue": value}
+    else:
+        entered = {"stringValue": _cell_text(value)}
+    return {"userEnteredValue": entered, "userEnteredFormat": fmt}
+
+
+def collect_columns(papers):
+    """Các cột theo thứ tự xuất hiện đầu tiên (giống cột của pd.DataFrame(papers))."""
+    return list(dict.fromkeys(key for paper in papers for key in paper))
+
+
+def row_text(paper, columns):
+    """Nội dung 1 hàng dưới dạng chuỗi, dùng để so với snapshot."""
+    return "\t".join(_cell_text(paper.get(column)) for column in columns)
+
+
+# ==============================
+# Dựng các request cho 1 ngày
+# ==============================
+def data_row(paper, columns):
+    return {"values": [_cell(paper.get(column), DATA_FORMAT) for column in columns]}
+
+
+def build_day_rows(papers, columns, date_str):
+    """RowData của cả block: hàng tiêu đề ngày, hàng tên cột, rồi mỗi bài 1 hàng."""
+    rows = [
+        {"values": [_cell(f"📅 Ngày {date_str}", DAY_HEADER_FORMAT)]
+         + [{"userEnteredFormat": DAY_HEADER_FORMAT}] * (len(columns) - 1)},
+        {"values": [_cell(column, COLUMN_HEADER_FORMAT) for column in columns]},
+    ]
+    rows.extend(data_row(paper, columns) for paper in papers)
+    return rows
+
+
+def column_widths(papers, columns):
+    """Độ rộng cột theo nội dung của block (80-400px)."""
+    widths = []
+    for column in columns:
+        longest = max([len(column)] + [len(_cell_text(paper.get(column))) for paper in papers])
+        widths.append(max(80, min(longest * 10, 400)))
+    return widths
+
+
+def borders_request(sheet_id, start, end, columns):
+    """Viền cho phần bảng (hàng tên cột + dữ liệu) của block [start, end)."""
+    return {"updateBorders": {
+        "range": {"sheetId": sheet_id, "startRowIndex": start + 1, "endRowIndex": end,
+                  "startColumnIndex": 0, "endColumnIndex": len(columns)},
+        "top": SOLID, "bottom": SOLID, "left": SOLID, "right": SOLID,
+        "innerHorizontal": SOLID, "innerVertical": SOLID,
+    }}
+
+
+def row_height_request(sheet_id, start, end):
+    return {"updateDimensionProperties": {
+        "range": {"sheetId": sheet_id, "dimension": "ROWS", "startIndex": start, "endIndex": end},
+        "properties": {"pixelSize": DATA_ROW_HEIGHT},
+        "fields": "pixelSize",
+    }}
+
+
+def width_requests(sheet_id, widths, published_widths=None):
+    """Đặt độ rộng cột; nếu biết độ rộng đã publish thì chỉ gửi các cột cần rộng hơn."""
+    published_widths = published_widths or []
+    return [
+        {"updateDimensionProperties": {
+            "range": {"sheetId": sheet_id, "dimension": "COLUMNS", "startIndex": index, "endIndex": index + 1},
+            "properties": {"pixelSize": width},
+            "fields": "pixelSize",
+        }}
+        for index, width in enumerate(widths)
+        if index >= len(published_widths) or width > published_widths[index]
+    ]
+
+
+def metadata_request(sheet_id, start, end, date_str):
+    # Metadata gắn vào đúng các hàng của block: Sheets tự dời khi chèn/xóa hàng phía trên
+    return {"createDeveloperMetadata": {"developerMetadata": {
+        "metadataKey": DAY_METADATA_KEY,
+        "metadataValue": date_str,
+        "location": {"dimensionRange": {"sheetId": sheet_id, "dimension": "ROWS",
+                                        "startIndex": start, "endIndex": end}},
+        "visibility": "DOCUMENT",
+    }}}
+
+
+def delete_metadata_request(metadata_id):
+    return {"deleteDeveloperMetadata": {
+        "dataFilter": {"developerMetadataLookup": {"metadataId": metadata_id}}
+    }}
+
+
+def make_room_request(sheet_id, start, rows, row_count):
+    """Chèn `rows` hàng trống tại `start`; nếu `start` ở ngoài lưới thì nới lưới ra."""
+    if start < row_count:
+        return {"insertDimension": {"range": {"sheetId": sheet_id, "dimension": "ROWS",
+                                              "startIndex": start, "endIndex": start + rows},
+                                    "inheritFromBefore": False}}
+    return {"appendDimension": {"sheetId": sheet_id, "dimension": "ROWS", "length": start + rows - row_count}}
+
+
+def build_block_requests(sheet_id, start, papers, columns, date_str):
+    """Ghi giá trị + mọi định dạng của block bắt đầu ở hàng `start` (0-based)."""
+    end = start + len(papers) + 2
+    requests = [
+        {"updateCells": {
+            "start": {"sheetId": sheet_id, "rowIndex": start, "columnIndex": 0},
+            "rows": build_day_rows(papers, columns, date_str),
+            "fields": "userEnteredValue,userEnteredFormat",
+        }},
+        borders_request(sheet_id, start, end, columns),
+    ]
+    if len(columns) > 1:
+        requests.append({"mergeCells": {
+            "range": {"sheetId": sheet_id, "startRowIndex": start, "endRowIndex": start + 1,
+                      "startColumnIndex": 0, "endColumnIndex": len(columns)},
+            "mergeType": "MERGE_ALL",
+        }})
+    if papers:
+        requests.append(row_height_request(sheet_id, start + 2, end))
+    requests.extend(width_requests(sheet_id, column_widths(papers, columns)))
+    requests.append(metadata_request(sheet_id, start, end, date_str))
+    return requests
+
+
+# ==============================
+# Tìm vùng của các ngày
+# ==============================
+def find_day_blocks(service, spreadsheet_id, sheet_id):
+    """{date: (start, end, metadata_id)} từ developer metadata của sheet (1 lần search)."""
+    response = service.spreadsheets().developerMetadata().search(
+        spreadsheetId=spreadsheet_id,
+        body={"dataFilters": [{"developerMetadataLookup": {"metadataKey": DAY_METADATA_KEY}}]},
+    ).execute()
+    report_add("gsheet_publish", "api_calls")
+
+    blocks = {}
+    for match in response.get("matchedDeveloperMetadata", []):
+        metadata = match.get("developerMetadata", {})
+        location = metadata.get("location", {}).get("dimensionRange", {})
+        if location.get("sheetId", 0) != sheet_id:
+            continue
+        blocks[metadata.get("metadataValue")] = (
+            location.get("startIndex", 0), location.get("endIndex", 0), metadata.get("metadataId"),
+        )
+    return blocks
+
+
+def find_legacy_day_block(service, spreadsheet_id, sheet_title, date_str):
+    """
+    Sheet cũ (chưa có metadata): đọc riêng cột A một lần để tìm block của ngày và hàng trống đầu tiên.
+
+    Returns:
+        tuple: ((start, end) | None, số hàng đã dùng)
+    """
+    response = service.spreadsheets().values().get(
+        spreadsheetId=spreadsheet_id, range=f"'{sheet_title}'!A:A"
+    ).execute()
+    report_add("gsheet_publish", "api_calls")
+    column = [row[0] if row else "" for row in response.get("values", [])]
+
+    for start, value in enumerate(column):
+        if value.startswith(f"📅 Ngày {date_str}"):
+            end = start + 1
+            while end < len(column) and not column[end].startswith("📅 Ngày"):
+                end += 1
+            return (start, end), len(column)
+    return None, len(column)
+
+
+# ==============================
+# Ghi lại cả block của ngày
+# ==============================
+def rewrite_day_in_gsheet(service, spreadsheet_id, properties, blocks, papers, columns, date_str):
+    """Request xóa block cũ của ngày (nếu có) rồi ghi lại cả block."""
+    sheet_id = properties["sheetId"]
+    row_count = properties.get("gridProperties", {}).get("rowCount", 0)
+
+    requests = []
+    existing = blocks.get(date_str)
+    if existing:
+        start, end, metadata_id = existing
+        requests.append(delete_metadata_request(metadata_id))
+    elif blocks:
+        start = max(block_end for _, block_end, _ in blocks.values()) + BLANK_ROWS_BETWEEN_DAYS
+        end = None
+    else:
+        legacy, used_rows = find_legacy_day_block(service, spreadsheet_id, properties["title"], date_str)
+        if legacy:
+            start, end = legacy
+        else:
+            start, end = (used_rows + BLANK_ROWS_BETWEEN_DAYS if used_rows else 0), None
+
+    if end is not None:
+        # Thay block cũ: xóa các hàng cũ rồi chèn đúng số hàng mới tại cùng vị trí
+        requests.append({"unmergeCells": {"range": {"sheetId": sheet_id, "startRowIndex": start,
+                                                    "endRowIndex": end}}})
+        requests.append({"deleteDimension": {"range": {"sheetId": sheet_id, "dimension": "ROWS",
+                                                       "startIndex": start, "endIndex": end}}})
+        row_count -= end - start
+    requests.append(make_room_request(sheet_id, start, len(papers) + 2, row_count))
+    requests.extend(build_block_requests(sheet_id, start, papers, columns, date_str))
+    report_add("gsheet_publish", "full_rewrites")
+    return requests
+
+
+# ==============================
+# Chỉ ghi các hàng thay đổi so với lần publish trước
+# ==============================
+def update_day_in_gsheet(properties, block, snapshot, papers, columns, date_str, updated, appended):
+    """
+    Request cho các hàng đổi nội dung (`updated`) và hàng mới nối vào cuối block (`appended`).
+
+    Returns:
+        list | None: None nếu block trên sheet không khớp snapshot (bị sửa tay) → ghi lại cả block.
+    """
+    if block is None or block[1] - block[0] != len(snapshot["papers"]) + 2:
+        return None
+    sheet_id = properties["sheetId"]
+    start, end, metadata_id = block
+
+    requests = [
+        {"updateCells": {
+            "start": {"sheetId": sheet_id, "rowIndex": start + 2 + i, "columnIndex": 0},
+            "rows": [data_row(papers[i], columns)],
+            "fields": "userEnteredValue,userEnteredFormat",
+        }}
+        for i in updated
+    ]
+    if appended:
+        new_end = end + len(appended)
+        row_count = properties.get("gridProperties", {}).get("rowCount", 0)
+        requests.extend([
+            make_room_request(sheet_id, end, len(appended), row_count),
+            {"updateCells": {
+                "start": {"sheetId": sheet_id, "rowIndex": end, "columnIndex": 0},
+                "rows": [data_row(papers[i], columns) for i in appended],
+                "fields": "userEnteredValue,userEnteredFormat",
+            }},
+            borders_request(sheet_id, start, new_end, columns),
+            row_height_request(sheet_id, end, new_end),
+            # Hàng chèn ở mép cuối không thuộc metadata cũ → gắn lại metadata cho cả block
+            delete_metadata_request(metadata_id),
+            metadata_request(sheet_id, start, new_end, date_str),
+        ])
+    requests.extend(width_requests(sheet_id, column_widths(papers, columns), snapshot.get("widths")))
+    report_add("gsheet_publish", "papers_inserted", len(appended))
+    report_add("gsheet_publish", "papers_updated", len(updated))
+    return requests
+
+
+def publish_day_to_gsheet(service, spreadsheet_id, papers, date_str):
+    """
+    Publish ngày `date_str` lên sheet đầu tiên, chỉ gửi phần khác so với snapshot lần publish trước
+    (database/published/gsheet/<spreadsheet_id>/<ngày>.json):
+    - không có gì đổi → không gọi API;
+    - chỉ thêm/sửa bài → batchUpdate chỉ chứa các hàng đó;
+    - còn lại (chưa có snapshot, đổi cột, bài bị xóa/đổi thứ tự) → ghi lại cả block.
+    Số lần gọi API không phụ thuộc kích thước sheet: 1 get (chỉ properties của sheet),
+    1 search developer metadata, 1 batchUpdate.
+    """
+    if not papers:
+        return 0
+    columns = collect_columns(papers)
+    entries = snapshot_entries(papers, lambda _, paper: row_text(paper, columns))
+    snapshot = load_snapshot(SNAPSHOT_SINK, spreadsheet_id, date_str)
+    diff = diff_snapshot(snapshot, entries, spreadsheet_id) if snapshot and snapshot.get("columns") == columns else None
+    if diff is not None and not any(diff):
+        report_add("gsheet_publish", "days_unchanged")
+        print(f"⏩ Google Sheet: ngày {date_str} không có thay đổi")
+        return 0
+
+    spreadsheet = service.spreadsheets().get(spreadsheetId=spreadsheet_id, fields=SHEET_FIELDS).execute()
+    report_add("gsheet_publish", "api_calls")
+    properties = spreadsheet["sheets"][0]["properties"]
+    blocks = find_day_blocks(service, spreadsheet_id, properties["sheetId"])
+
+    requests = None
+    if diff:
+        requests = update_day_in_gsheet(properties, blocks.get(date_str), snapshot, papers, columns, date_str, *diff)
+    if requests is None:
+        requests = rewrite_day_in_gsheet(service, spreadsheet_id, properties, blocks, papers, columns, date_str)
+
+    service.spreadsheets().batchUpdate(spreadsheetId=spreadsheet_id, body={"requests": requests}).execute()
+    report_add("gsheet_publish", "api_calls")
+    report_add("gsheet_publish", "requests", len(requests))
+    save_snapshot(SNAPSHOT_SINK, spreadsheet_id, date_str, {
+        "target": spreadsheet_id,
+        "columns": columns,
+        "widths": column_widths(papers, columns),
+        "papers": entries,
+    })
+    return len(requests)
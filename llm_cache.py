@@ -0,0 +1,83 @@
+import os
+import re
+import json
+import hashlib
+from cache_store import PersistentCache
+from run_report import RUN_REPORT, report_add, report_set
+
+
+DATABASE_DIR = "database"
+LLM_CACHE_FILE = "llm_cache.json"
+_llm_cache = None
+
+
+# ==============================
+# Cache kết quả Gemini theo (model, phiên bản prompt, temperature, abstract)
+# ==============================
+def get_llm_cache():
+    """Cache kết quả LLM, lưu ở database/llm_cache.json (tối đa 20000 entry, LRU)."""
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = PersistentCache(
+            os.path.join(DATABASE_DIR, LLM_CACHE_FILE),
+            ttl=180 * 86400,
+            max_entries=20000,
+        )
+    return _llm_cache
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_abstract(abstract):
+    """Bỏ khác biệt về hoa/thường và khoảng trắng để cùng 1 abstract cho cùng 1 key."""
+    return re.sub(r"\s+", " ", (abstract or "")).strip().lower()
+
+
+def prompt_version(prompt, abstract=None):
+    """
+    Phiên bản của prompt template = hash của prompt sau khi thay abstract bằng placeholder.
+    Sửa prompt (hoặc đổi từ khóa chủ đề) → phiên bản mới → kết quả cũ tự hết hiệu lực.
+    """
+    template = prompt.replace(abstract, "{abstract}") if abstract else prompt
+    return _sha256(template)[:12]
+
+
+def llm_cache_key(model, prompt, abstract, temperature):
+    """Key = hash(model, phiên bản prompt, temperature, hash abstract đã chuẩn hóa)."""
+    return _sha256(json.dumps([
+        model,
+        prompt_version(prompt, abstract),
+        temperature,
+        _sha256(normalize_abstract(abstract)),
+    ]))
+
+
+def _update_hit_rate():
+    stats = RUN_REPORT.get("llm_cache", {})
+    total = stats.get("hits", 0) + stats.get("misses", 0)
+    if total:
+        report_set("llm_cache", "hit_rate", round(stats.get("hits", 0) / total, 3))
+
+
+def get_cached_llm_result(key):
+    """Trả về kết quả đã cache hoặc None; ghi nhận hit/miss và số token tiết kiệm được."""
+    entry = get_llm_cache().get(key)
+    if entry is None:
+        report_add("llm_cache", "misses")
+        _update_hit_rate()
+        return None
+    report_add("llm_cache", "hits")
+    report_add("llm_cache", "tokens_saved", entry.get("tokens", 0))
+    _update_hit_rate()
+    return entry["value"]
+
+
+def store_llm_result(key, value, tokens=0):
+    """Lưu kết quả thành công (không cache kết quả lỗi) kèm số token đã tốn."""
+    get_llm_cache().set(key, {"value": value, "tokens": tokens})
+
+
+def save_llm_cache():
+    get_llm_cache().save()
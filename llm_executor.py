@@ -0,0 +1,235 @@
+import os
+import re
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from run_report import report_add, report_max
+
+
+# Hạn mức của API key (mặc định theo free tier của gemini-2.5-flash)
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "10"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "250000"))
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "4"))
+# Số token dự phòng cho phần trả lời khi ước lượng trước một request
+RESPONSE_TOKEN_ALLOWANCE = 512
+
+
+def estimate_tokens(text):
+    """Ước lượng số token (~4 ký tự/token) để chia lô, không tốn request."""
+    return len(text or "") // 4 + 1
+
+
+def response_tokens(response):
+    """Tổng token (prompt + trả lời + thinking) của 1 response, 0 nếu không có usage_metadata."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return 0
+    return sum(
+        getattr(usage, field, 0) or 0
+        for field in ("prompt_token_count", "candidates_token_count", "thoughts_token_count")
+    )
+
+
+def is_rate_limited(error):
+    """429 / RESOURCE_EXHAUSTED từ google-genai (APIError.code) hoặc từ thông báo lỗi."""
+    return getattr(error, "code", None) == 429 or "RESOURCE_EXHAUSTED" in str(error)
+
+
+def retry_delay(error):
+    """Đọc RetryInfo.retryDelay (vd. "23s") trong lỗi 429 nếu server có gửi kèm."""
+    match = re.search(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s", str(error))
+    return float(match.group(1)) if match else None
+
+
+# ==============================
+# Ngân sách request/phút và token/phút
+# ==============================
+class RateBudget:
+    """
+    Cửa sổ trượt 60 giây: tối đa `rpm` request và `tpm` token.
+    Mỗi request giữ chỗ theo số token ước lượng, sau khi có usage_metadata thì cập nhật số thật.
+    """
+
+    def __init__(self, rpm=GEMINI_RPM, tpm=GEMINI_TPM, window=60):
+        self.rpm = max(1, rpm)
+        self.tpm = max(1, tpm)
+        self.window = window
+        self._events = deque()  # [thời điểm, số token]
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        while self._events and self._events[0][0] + self.window <= now:
+            self._events.popleft()
+
+    def _try_reserve(self, tokens):
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            used = sum(t for _, t in self._events)
+            # Request lớn hơn cả tpm vẫn được chạy khi cửa sổ trống, để không bị kẹt mãi
+            if len(self._events) < self.rpm and (used + tokens <= self.tpm or not self._events):
+                entry = [now, tokens]
+                self._events.append(entry)
+                return entry, 0
+            return None, self._events[0][0] + self.window - now
+
+    async def acquire(self, tokens):
+        while True:
+            entry, wait = self._try_reserve(tokens)
+            if entry is not None:
+                return entry
+            report_add("llm_executor", "budget_waits")
+            await asyncio.sleep(max(wait, 0.05))
+
+    def settle(self, entry, tokens):
+        with self._lock:
+            entry[1] = tokens
+
+
+# ==============================
+# Executor bất đồng bộ cho Gemini
+# ==============================
+class GeminiExecutor:
+    """
+    Chạy nhiều request Gemini song song bằng client bất đồng bộ (`client.aio`).
+
+    - Bị giới hạn đồng thời bởi RateBudget (RPM/TPM) và số request đang chạy.
+    - Số request đồng thời tự điều chỉnh (AIMD): gặp 429/RESOURCE_EXHAUSTED → giảm một nửa,
+      tạm dừng mọi request (theo retryDelay của server hoặc backoff lũy thừa) rồi thử lại;
+      thành công liên tiếp → tăng dần lại đến `max_concurrency`.
+    - Kết quả được trả về ngay khi từng request xong (stream / on_result), không chờ cả lô.
+
+    Mỗi request là dict {"id", "contents", "config", ["tokens"]}.
+    """
+
+    def __init__(self, client, model, rpm=GEMINI_RPM, tpm=GEMINI_TPM, max_concurrency=GEMINI_CONCURRENCY,
+                 min_concurrency=1, max_retries=4, backoff=10):
+        self.client = client
+        self.model = model
+        self.budget = RateBudget(rpm, tpm)
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self._limit = self.max_concurrency
+        self._active = 0
+        self._successes = 0
+        self._cooldown_until = 0.0
+        self._cond = None
+        self._cond_loop = None
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    @property
+    def limit(self):
+        return self._limit
+
+    async def _acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._active < self._limit)
+            self._active += 1
+            report_max("llm_executor", "max_in_flight", self._active)
+
+    async def _release(self, rate_limited):
+        async with self._cond:
+            self._active -= 1
+            if rate_limited:
+                self._successes = 0
+                new_limit = max(self.min_concurrency, self._limit // 2)
+                if new_limit < self._limit:
+                    print(f"⚠️ Gemini trả về 429 → giảm số request đồng thời còn {new_limit}")
+                self._limit = new_limit
+            else:
+                self._successes += 1
+                if self._successes >= self._limit and self._limit < self.max_concurrency:
+                    self._limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+    async def _wait_cooldown(self):
+        delay = self._cooldown_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _run_one(self, request):
+        tokens = request.get("tokens") or estimate_tokens(request["contents"]) + RESPONSE_TOKEN_ALLOWANCE
+        error = None
+        for attempt in range(self.max_retries + 1):
+            await self._wait_cooldown()
+            await self._acquire()
+            entry = await self.budget.acquire(tokens)
+            rate_limited = False
+            try:
+                response = await self.client.aio.models.generate_content(
+                    model=request.get("model", self.model),
+                    contents=request["contents"],
+                    config=request.get("config"),
+                )
+                self.budget.settle(entry, response_tokens(response) or tokens)
+                report_add("llm_executor", "calls")
+                return request["id"], response, None
+            except Exception as e:
+                error = e
+                rate_limited = is_rate_limited(e)
+                if not rate_limited:
+                    report_add("llm_executor", "errors")
+                    return request["id"], None, e
+            finally:
+                await self._release(rate_limited)
+
+            report_add("llm_executor", "rate_limited")
+            if attempt < self.max_retries:
+                # Quota là chung cho cả key → tạm dừng mọi request, có jitter để không dồn lại cùng lúc
+                delay = retry_delay(error) or self.backoff * (2 ** attempt)
+                delay += random.uniform(0, 1)
+                self._cooldown_until = max(self._cooldown_until, time.monotonic() + delay)
+        return request["id"], None, error
+
+    async def stream(self, requests):
+        """
+        Async generator: yield (id, response, error) theo thứ tự request hoàn thành.
+        error khác None nghĩa là request đó thất bại (đã hết lượt thử lại nếu do 429).
+        """
+        if self._cond_loop is not asyncio.get_running_loop():
+            self._cond = asyncio.Condition()
+            self._cond_loop = asyncio.get_running_loop()
+        tasks = [asyncio.ensure_future(self._run_one(request)) for request in requests]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _get_loop(self):
+        """Event loop riêng chạy nền, dùng lại giữa các lần gọi để client.aio giữ được kết nối."""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True, name="gemini-executor").start()
+            return self._loop
+
+    def run(self, requests, on_result=None):
+        """
+        Dùng từ code đồng bộ: chạy mọi request, gọi `on_result(id, response, error)`
+        ngay khi từng request xong.
+
+        Returns:
+            dict: {id: (response, error)}
+        """
+        requests = list(requests)
+        results = {}
+        if not requests:
+            return results
+
+        async def consume():
+            async for request_id, response, error in self.stream(requests):
+                results[request_id] = (response, error)
+                if on_result:
+                    on_result(request_id, response, error)
+
+        asyncio.run_coroutine_threadsafe(consume(), self._get_loop()).result()
+        return results
@@ -0,0 +1,303 @@
+import os
+import re
+import glob
+import json
+import zlib
+import time
+import tempfile
+import threading
+import numpy as np
+from paper_schema import normalize_key, is_missing
+from run_report import report_add, report_set
+
+
+RESULTS_DIR = "results"
+DATABASE_DIR = "database"
+NOVELTY_VECTORS_FILE = "novelty_vectors.f32"
+NOVELTY_META_FILE = "novelty_meta.json"
+
+# Số chiều của vector băm (hashing trick); đổi giá trị này cần build lại index
+NOVELTY_DIM = int(os.getenv("NOVELTY_DIM", "2048"))
+# Độ tương đồng cosine với lịch sử ≥ ngưỡng → coi là gần trùng, ưu tiên xuống cuối trước khi gọi LLM
+NOVELTY_CUTOFF = float(os.getenv("NOVELTY_CUTOFF", "0.8"))
+NOVELTY_ENABLED = os.getenv("NOVELTY_ENABLED", "1") != "0"
+# Số dòng của ma trận lịch sử được nhân mỗi lượt (giới hạn bộ nhớ khi index lớn)
+QUERY_CHUNK_ROWS = 8192
+# Các field score_novelty gắn vào bài: chỉ dùng trong lần chạy (pre-rank), bị bỏ khi lưu kết quả
+NOVELTY_FIELDS = ("history_similarity", "novelty_score", "near_duplicate", "similar_to")
+
+STOPWORDS = {
+    "the", "and", "for", "with", "this", "that", "from", "are", "was", "were", "been", "which",
+    "these", "those", "their", "its", "has", "have", "into", "also", "can", "using", "based",
+    "paper", "study", "results", "proposed", "method", "methods", "approach", "show", "shows",
+}
+_index = None
+_index_lock = threading.Lock()
+
+
+# ==============================
+# Vector hóa văn bản (hashed TF)
+# ==============================
+def _tokens(text):
+    words = [w for w in re.findall(r"[a-z0-9]+", (text or "").lower()) if len(w) > 2 and w not in STOPWORDS]
+    # Từ đơn + cặp từ liền nhau (bắt được cụm như "eddy current")
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def text_vectors(texts, dim=NOVELTY_DIM):
+    """
+    Băm từ/cặp từ của mỗi văn bản vào `dim` chiều (crc32 → ổn định giữa các lần chạy),
+    TF dạng log (1 + log tf), chuẩn hóa L2.
+
+    Returns:
+        np.ndarray: Ma trận float32 (len(texts), dim).
+    """
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        counts = {}
+        for token in _tokens(text):
+            h = zlib.crc32(token.encode("utf-8"))
+            counts[h % dim] = counts.get(h % dim, 0) + 1
+        if not counts:
+            continue
+        cols = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        vectors[row, cols] = 1 + np.log(tf)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def paper_text(paper):
+    abstract = paper.get("abstract")
+    abstract = "" if is_missing(abstract) else abstract
+    return f"{paper.get('title') or ''} {abstract}"
+
+
+# ==============================
+# Index lịch sử (memmap trên đĩa)
+# ==============================
+class NoveltyIndex:
+    """
+    Index vector của mọi bài báo đã lưu, dùng để đo mức "mới" so với lịch sử.
+
+    - Vector TF (đã chuẩn hóa) được ghi nối đuôi vào file float32 thô và đọc lại bằng
+      np.memmap, nên thêm bài mới không phải ghi lại cả index.
+    - Document frequency theo từng chiều được cộng dồn trong file meta; trọng số IDF
+      được áp lúc truy vấn nên luôn khớp với lịch sử hiện tại.
+    - Các chủ đề chạy song song dùng chung 1 index: ghi file và đọc memmap đều qua self._lock.
+    """
+
+    def __init__(self, db_dir=DATABASE_DIR, dim=NOVELTY_DIM):
+        self.vectors_path = os.path.join(db_dir, NOVELTY_VECTORS_FILE)
+        self.meta_path = os.path.join(db_dir, NOVELTY_META_FILE)
+        self.dim = dim
+        self.keys = []
+        self.titles = []
+        self.df = np.zeros(dim, dtype=np.int64)
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            return
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except Exception as e:
+            print(f"⚠️ Lỗi khi đọc novelty index {self.meta_path}: {e}")
+            return
+        if meta.get("dim") != self.dim:
+            print(f"⚠️ Novelty index có dim={meta.get('dim')} ≠ {self.dim}, build lại từ results/")
+            return
+        self.keys = meta.get("keys", [])
+        self.titles = meta.get("titles", [])
+        self.df = np.asarray(meta.get("df", [0] * self.dim), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _matrix(self, rows):
+        if not rows:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+
+    def _idf(self, rows):
+        n_docs = max(rows, 1)
+        return np.log((1 + n_docs) / (1 + self.df)).astype(np.float32) + 1
+
+    def add(self, papers):
+        """
+        Thêm các bài chưa có trong index (theo key chuẩn hóa) và ghi xuống đĩa ngay.
+
+        Returns:
+            int: Số bài đã thêm.
+        """
+        with self._lock:
+            known = set(self.keys)
+            new_papers = []
+            for paper in papers:
+                key = normalize_key(paper)
+                if key and key not in known and paper_text(paper).strip():
+                    known.add(key)
+                    new_papers.append((key, paper))
+            if not new_papers:
+                return 0
+
+            vectors = text_vectors([paper_text(p) for _, p in new_papers], self.dim)
+            os.makedirs(os.path.dirname(self.vectors_path) or ".", exist_ok=True)
+            with open(self.vectors_path, "ab") as f:
+                # Bỏ phần ghi dở của lần trước (nếu có) để file luôn khớp với meta
+                f.truncate(len(self.keys) * self.dim * 4)
+                f.write(vectors.tobytes())
+
+            self.keys.extend(key for key, _ in new_papers)
+            self.titles.extend((p.get("title") or "Untitled")[:200] for _, p in new_papers)
+            self.df += (vectors > 0).sum(axis=0)
+            self._save_meta()
+            return len(new_papers)
+
+    def _save_meta(self):
+        # File tạm riêng cho mỗi lần ghi, cùng thư mục để os.replace là atomic
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{NOVELTY_META_FILE}.", suffix=".tmp",
+                                        dir=os.path.dirname(self.meta_path) or ".")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim, "keys": self.keys, "titles": self.titles, "df": self.df.tolist()},
+                          f, ensure_ascii=False)
+            os.replace(tmp_path, self.meta_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def query(self, texts, k=1):
+        """
+        Tìm k bài gần nhất trong lịch sử cho nhiều văn bản cùng lúc (cosine trên TF-IDF).
+        Ma trận lịch sử được nhân theo từng khối QUERY_CHUNK_ROWS dòng.
+
+        Returns:
+            list: Với mỗi văn bản, danh sách [(similarity, index)] giảm dần (rỗng nếu index trống).
+        """
+        if not texts:
+            return []
+        if not self.keys or k <= 0:
+            return [[] for _ in texts]
+
+        # Chụp số dòng + IDF cùng lúc: add() ở luồng khác chỉ nối thêm dòng sau `rows`
+        with self._lock:
+            rows = len(self.keys)
+            idf = self._idf(rows)
+            matrix = self._matrix(rows)
+        queries = text_vectors(texts, self.dim) * idf
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        best_sims = np.full((len(texts), 0), -1.0, dtype=np.float32)
+        best_ids = np.zeros((len(texts), 0), dtype=np.int64)
+        for start in range(0, rows, QUERY_CHUNK_ROWS):
+            chunk = np.asarray(matrix[start:start + QUERY_CHUNK_ROWS]) * idf
+            chunk /= np.maximum(np.linalg.norm(chunk, axis=1, keepdims=True), 1e-12)
+            sims = queries @ chunk.T
+            # Gộp top-k của khối này với top-k các khối trước
+            chunk_ids = np.broadcast_to(np.arange(start, start + len(chunk)), (len(texts), len(chunk)))
+            sims = np.concatenate([best_sims, sims], axis=1)
+            ids = np.concatenate([best_ids, chunk_ids], axis=1)
+            top = min(k, sims.shape[1])
+            part = np.argpartition(-sims, top - 1, axis=1)[:, :top]
+            best_sims = np.take_along_axis(sims, part, axis=1)
+            best_ids = np.take_along_axis(ids, part, axis=1)
+
+        order = np.argsort(-best_sims, axis=1)
+        best_sims = np.take_along_axis(best_sims, order, axis=1)
+        best_ids = np.take_along_axis(best_ids, order, axis=1)
+        return [
+            [(float(s), int(i)) for s, i in zip(row_sims, row_ids)]
+            for row_sims, row_ids in zip(best_sims, best_ids)
+        ]
+
+
+def get_novelty_index():
+    """
+    Index dùng chung của process. File index không được commit (.gitignore) vì tăng mãi theo lịch sử:
+    checkout mới (GitHub Actions) thì build lại từ các file trong results/.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = NoveltyIndex()
+            if not len(_index) and glob.glob(os.path.join(RESULTS_DIR, "*.json")):
+                rebuild_novelty_index()
+        return _index
+
+
+def strip_novelty_fields(paper):
+    """Bản sao của bài không có các field nội bộ của score_novelty (NOVELTY_FIELDS)."""
+    return {key: value for key, value in paper.items() if key not in NOVELTY_FIELDS}
+
+
+def add_to_novelty_index(papers):
+    """Được gọi từ save_results_to_json: chỉ thêm các bài mới của lần chạy."""
+    return get_novelty_index().add(papers)
+
+
+def rebuild_novelty_index(results_dir=RESULTS_DIR, db_dir=DATABASE_DIR, dim=NOVELTY_DIM):
+    """Build lại toàn bộ index từ các file kết quả đã lưu (dữ liệu cũ hoặc khi đổi NOVELTY_DIM)."""
+    global _index
+    for path in (os.path.join(db_dir, NOVELTY_VECTORS_FILE), os.path.join(db_dir, NOVELTY_META_FILE)):
+        if os.path.exists(path):
+            os.remove(path)
+    index = NoveltyIndex(db_dir, dim)
+    total = 0
+    for file_path in sorted(glob.glob(os.path.join(results_dir, "*.json"))):
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                total += index.add(json.load(f))
+        except Exception as e:
+            print(f"⚠️ Bỏ qua file {file_path}: {e}")
+    _index = index
+    print(f"✅ Đã build novelty index với {total} bài báo từ {results_dir}/")
+    return total
+
+
+# ==============================
+# Chấm điểm mới so với lịch sử
+# ==============================
+def score_novelty(papers, cutoff=NOVELTY_CUTOFF, index=None):
+    """
+    Gán cho mỗi bài:
+        - "history_similarity": độ tương đồng lớn nhất với một bài đã lưu trước đó,
+        - "novelty_score": 1 - history_similarity,
+        - "similar_to" (chỉ khi ≥ cutoff): tiêu đề bài cũ gần nhất.
+    Bài ≥ cutoff được đánh dấu "near_duplicate" để pre-rank xếp xuống sau các bài mới.
+    Các field này chỉ dùng trong lần chạy; save_results_to_json bỏ chúng đi (strip_novelty_fields).
+
+    Returns:
+        list: Các bài theo thứ tự cũ, bài mới trước, bài gần trùng sau.
+    """
+    index = index or get_novelty_index()
+    if not papers or not len(index):
+        return papers
+
+    start = time.perf_counter()
+    nearest = index.query([paper_text(p) for p in papers], k=1)
+    fresh, repeats = [], []
+    for paper, matches in zip(papers, nearest):
+        similarity, row = matches[0] if matches else (0.0, None)
+        paper["history_similarity"] = round(similarity, 4)
+        paper["novelty_score"] = round(1 - similarity, 4)
+        if similarity >= cutoff:
+            paper["near_duplicate"] = True
+            paper["similar_to"] = index.titles[row]
+            repeats.append(paper)
+        else:
+            fresh.append(paper)
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    report_set("novelty", "history_size", len(index))
+    report_add("novelty", "near_duplicates", len(repeats))
+    report_add("novelty", "elapsed_ms", round(elapsed_ms, 2))
+    print(f"🧭 Novelty: {len(repeats)}/{len(papers)} bài gần trùng lịch sử (≥ {cutoff}, {elapsed_ms:.1f} ms)")
+    return fresh + repeats
+
+
+if __name__ == "__main__":
+    rebuild_novelty_index()
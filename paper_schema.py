@@ -0,0 +1,110 @@
+import re
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+
+# Tham số query chỉ dùng để tracking, không ảnh hưởng nội dung trang
+TRACKING_PARAMS = {"fbclid", "gclid", "mc_cid", "mc_eid"}
+
+# ==============================
+# Schema chung cho bản ghi bài báo
+# ==============================
+# Mọi adapter (OpenAlex, arXiv, Crossref, Scholar) đều trả về các field này
+PAPER_FIELDS = ("source", "title", "abstract", "authors", "link", "citations", "status", "pub_date")
+# Các field có thể bổ sung bằng enrichment (Firecrawl, metadata API...)
+ENRICHABLE_FIELDS = ("abstract", "pub_date")
+# Tên field cũ → tên chuẩn
+LEGACY_FIELDS = {"pubdate": "pub_date"}
+MISSING_VALUES = {"", "not available", "no title", "none"}
+
+DOI_PATTERN = re.compile(r"\b(10\.\d{4,9}/[^\s\"'<>#?]+)", re.IGNORECASE)
+ARXIV_PATTERN = re.compile(r"arxiv\.org/(?:abs|pdf)/([a-z\-]+/\d{7}|\d{4}\.\d{4,5})", re.IGNORECASE)
+
+
+def normalize_key(paper):
+    """
+    Chuẩn hóa key để so sánh trùng lặp:
+    - Ưu tiên DOI (lowercase, bỏ khoảng trắng).
+    - Nếu không có DOI → dùng link.
+    - Nếu không có link → dùng title.
+    """
+    doi = (paper.get("doi") or "").strip().lower()
+    link = (paper.get("link") or "").strip().lower()
+    title = (paper.get("title") or "").strip().lower()
+
+    if doi:
+        return doi
+    elif link:
+        return link
+    elif title:
+        return title
+    return ""
+
+
+def canonicalize_url(url):
+    """
+    Chuẩn hóa URL để dùng làm key cache:
+    - Bỏ khoảng trắng, fragment (#...) và các tham số tracking (utm_*, fbclid, ...).
+    - Scheme/host viết thường, bỏ "www." và cổng mặc định, bỏ "/" ở cuối path.
+    - Link DOI (dx.doi.org, http://doi.org) quy về https://doi.org/<doi viết thường>.
+    """
+    url = (url or "").strip()
+    if not url or url == "Not Available":
+        return ""
+    if "://" not in url:
+        url = f"https://{url}"
+
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+
+    path = parts.path.rstrip("/")
+    if host in ("doi.org", "dx.doi.org"):
+        return f"https://doi.org{path.lower()}"
+
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    ))
+    scheme = "https" if parts.scheme.lower() in ("http", "https") else parts.scheme.lower()
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def is_missing(value):
+    """Giá trị rỗng/placeholder ("Not Available", "Error: ...") coi như chưa có."""
+    if value is None:
+        return True
+    text = str(value).strip()
+    return text.lower() in MISSING_VALUES or text.startswith("Error:")
+
+
+def normalize_paper(paper):
+    """Đưa các field tên cũ (vd. "pubdate") về tên chuẩn, không ghi đè giá trị đã có."""
+    for legacy, field in LEGACY_FIELDS.items():
+        if legacy in paper:
+            value = paper.pop(legacy)
+            if is_missing(paper.get(field)) and not is_missing(value):
+                paper[field] = value
+    return paper
+
+
+def missing_fields(paper, fields=ENRICHABLE_FIELDS):
+    """Danh sách field còn thiếu của một bài báo."""
+    return [field for field in fields if is_missing(paper.get(field))]
+
+
+def extract_doi(paper):
+    """Lấy DOI (viết thường) từ field "doi" hoặc từ link (doi.org/..., link nhà xuất bản có DOI)."""
+    for value in (paper.get("doi"), paper.get("link")):
+        match = DOI_PATTERN.search(str(value or ""))
+        if match:
+            return match.group(1).rstrip(".,;)").lower()
+    return None
+
+
+def extract_arxiv_id(paper):
+    """Lấy arXiv id (không kèm version) từ link arxiv.org/abs|pdf/..."""
+    match = ARXIV_PATTERN.search(str(paper.get("link") or ""))
+    return match.group(1) if match else None
@@ -0,0 +1,126 @@
+import os
+import time
+import asyncio
+from run_report import report_add, report_set
+
+
+# Số phần tử tối đa chờ giữa 2 stage: stage sau chậm thì stage trước phải đợi (backpressure)
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "50"))
+
+_DONE = object()
+
+
+class Stage:
+    """
+    1 bước của pipeline: `fn(list phần tử) → list phần tử` (hàm đồng bộ có sẵn, chạy trong thread).
+    Phần tử được gom thành lô tối đa `batch_size`, hoặc ít hơn nếu đã chờ `max_wait` giây
+    kể từ phần tử đầu tiên của lô. `workers` lô của cùng stage có thể chạy song song.
+    """
+
+    def __init__(self, name, fn, batch_size=1, max_wait=1.0, workers=1):
+        self.name = name
+        self.fn = fn
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.workers = workers
+
+
+async def _next_batch(stage, queue):
+    """Lô tiếp theo của stage; (lô, True) khi luồng vào đã hết."""
+    item = await queue.get()
+    if item is _DONE:
+        return [], True
+    batch = [item]
+    deadline = time.monotonic() + stage.max_wait
+    while len(batch) < stage.batch_size:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            item = await asyncio.wait_for(queue.get(), remaining)
+        except asyncio.TimeoutError:
+            break
+        if item is _DONE:
+            return batch, True
+        batch.append(item)
+    return batch, False
+
+
+async def _run_source(name, fetch, queue):
+    start = time.perf_counter()
+    try:
+        items = await asyncio.to_thread(fetch)
+    except Exception as e:
+        print(f"❌ Nguồn {name} lỗi: {e}")
+        report_add("pipeline", "source_errors")
+        return
+    report_set("pipeline", f"{name}_ready_s", round(time.perf_counter() - start, 2))
+    print(f"📥 {name}: {len(items)} bài → pipeline")
+    for item in items:
+        await queue.put(item)
+
+
+async def _run_stage(stage, inbox, outbox, finished):
+    """Worker của 1 stage. Worker cuối cùng nhận hết luồng thì báo hết cho stage sau."""
+    while True:
+        batch, done = await _next_batch(stage, inbox)
+        if batch:
+            start = time.perf_counter()
+            try:
+                results = await asyncio.to_thread(stage.fn, batch)
+            except Exception as e:
+                print(f"❌ Stage {stage.name} lỗi với lô {len(batch)} bài: {e}")
+                report_add("pipeline", f"{stage.name}_errors")
+                results = []
+            report_add("pipeline", f"{stage.name}_busy_s", round(time.perf_counter() - start, 3))
+            report_add("pipeline", f"{stage.name}_batches")
+            for item in results:
+                await outbox.put(item)
+        if done:
+            finished[stage.name] += 1
+            if finished[stage.name] < stage.workers:
+                await inbox.put(_DONE)  # để các worker khác của stage cũng dừng
+            else:
+                await outbox.put(_DONE)
+            return
+
+
+async def _collect(queue, results):
+    while True:
+        item = await queue.get()
+        if item is _DONE:
+            return
+        results.append(item)
+
+
+async def stream(sources, stages, queue_size=PIPELINE_QUEUE_SIZE):
+    """
+    Cho từng phần tử chảy qua các stage ngay khi nguồn trả về, thay vì đợi tất cả các nguồn xong.
+
+    Parameters:
+        sources (dict): {tên: hàm không tham số trả về list} — chạy song song.
+        stages (list[Stage]): Các bước, theo thứ tự.
+
+    Returns:
+        list: Phần tử ra khỏi stage cuối cùng.
+    """
+    queues = [asyncio.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    finished = {stage.name: 0 for stage in stages}
+    results = []
+
+    async def feed():
+        await asyncio.gather(*(_run_source(name, fetch, queues[0]) for name, fetch in sources.items()))
+        await queues[0].put(_DONE)
+
+    tasks = [feed(), _collect(queues[-1], results)]
+    for i, stage in enumerate(stages):
+        tasks.extend(_run_stage(stage, queues[i], queues[i + 1], finished) for _ in range(stage.workers))
+    start = time.perf_counter()
+    await asyncio.gather(*tasks)
+    report_set("pipeline", "elapsed_s", round(time.perf_counter() - start, 2))
+    return results
+
+
+def run_pipeline(sources, stages, queue_size=PIPELINE_QUEUE_SIZE):
+    """Bản đồng bộ của stream()."""
+    return asyncio.run(stream(sources, stages, queue_size))
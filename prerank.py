@@ -0,0 +1,128 @@
+import os
+import re
+import math
+import time
+import numpy as np
+from run_report import report_add
+
+
+PRERANK_TOP_K = int(os.getenv("PRERANK_TOP_K", "40"))
+# Chỉ giữ bài có điểm BM25 > ngưỡng (0 = phải khớp ít nhất 1 từ khóa/từ đồng nghĩa)
+PRERANK_MIN_SCORE = float(os.getenv("PRERANK_MIN_SCORE", "0"))
+
+# Từ đồng nghĩa / viết tắt mặc định (key viết thường): chỉ dùng khi chủ đề không khai báo
+# "synonyms" trong topics.json
+TOPIC_SYNONYMS = {
+    "pulsed eddy current": [
+        "pec", "pulse eddy current", "pulsed eddy-current", "transient eddy current",
+        "pulsed eddy current testing", "pect", "eddy current", "electromagnetic nondestructive",
+    ],
+}
+
+# Trọng số: cụm từ khóa đầy đủ > từ đồng nghĩa/viết tắt > từng từ lẻ
+PHRASE_WEIGHT = 1.0
+SYNONYM_WEIGHT = 0.8
+WORD_WEIGHT = 0.2
+STOPWORDS = {"and", "or", "of", "the", "for", "in", "on", "a", "an", "to", "with"}
+
+
+def _normalize(text):
+    return " ".join(re.findall(r"\w+", (text or "").lower()))
+
+
+def build_query_terms(keywords, synonyms=None):
+    """
+    Tạo danh sách term có trọng số từ từ khóa chủ đề.
+    "Pulsed Eddy Current (PEC)" → "pulsed eddy current" (cụm), "pec" (viết tắt trong ngoặc),
+    các từ đồng nghĩa và từng từ lẻ (trọng số thấp).
+
+    Parameters:
+        synonyms (list | None): Từ đồng nghĩa/viết tắt của chủ đề ("synonyms" trong topics.json);
+            None → tra TOPIC_SYNONYMS theo từng cụm từ khóa.
+    """
+    terms = {}
+
+    def add(term, weight):
+        term = _normalize(term)
+        if term and weight > terms.get(term, 0):
+            terms[term] = weight
+
+    for keyword in keywords:
+        phrase = re.sub(r"\(.*?\)", " ", keyword)
+        add(phrase, PHRASE_WEIGHT)
+        for acronym in re.findall(r"\((.*?)\)", keyword):
+            add(acronym, SYNONYM_WEIGHT)
+        if synonyms is None:
+            for synonym in TOPIC_SYNONYMS.get(_normalize(phrase), []):
+                add(synonym, SYNONYM_WEIGHT)
+        for word in _normalize(phrase).split():
+            if word not in STOPWORDS and len(word) > 2:
+                add(word, WORD_WEIGHT)
+    for synonym in synonyms or []:
+        add(synonym, SYNONYM_WEIGHT)
+    return terms
+
+
+def bm25_scores(documents, terms, k1=1.5, b=0.75):
+    """
+    BM25 của mỗi document với tập term (cụm từ) có trọng số.
+    Số lần xuất hiện của mọi term trong 1 document được đếm trong 1 lượt regex
+    (alternation của các term, dài trước ngắn sau) vào ma trận tần suất (document × term);
+    idf, chuẩn hóa độ dài và điểm được tính trên cả ma trận bằng numpy.
+
+    Returns:
+        np.ndarray: Điểm float64, cùng thứ tự với documents.
+    """
+    if not documents or not terms:
+        return np.zeros(len(documents))
+
+    columns = {term: j for j, term in enumerate(terms)}
+    pattern = re.compile(r"\b(" + "|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True)) + r")\b")
+
+    tf = np.zeros((len(documents), len(columns)))
+    for row, doc in enumerate(documents):
+        for match in pattern.finditer(doc):
+            tf[row, columns[match.group(1)]] += 1
+    lengths = np.array([doc.count(" ") + 1 for doc in documents], dtype=float)
+    weights = np.array([terms[term] for term in columns])
+
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log(1 + (len(documents) - df + 0.5) / (df + 0.5))
+    norm = k1 * (1 - b + b * lengths / lengths.mean())
+    return (tf * (k1 + 1) / (tf + norm[:, None])) @ (weights * idf)
+
+
+def prerank_papers(papers, keywords, top_k=PRERANK_TOP_K, min_score=PRERANK_MIN_SCORE, synonyms=None,
+                   batch_size=1):
+    """
+    Xếp hạng cục bộ (BM25 trên title + abstract) trước khi gửi cho LLM.
+    Chỉ giữ tối đa top_k bài có điểm > min_score (điểm chỉ dùng để xếp hạng, không ghi vào bài
+    nên không lọt vào file kết quả). Bài đã được score_novelty đánh dấu "near_duplicate" luôn
+    xếp sau các bài mới.
+
+    Returns:
+        list: Các bài được giữ, sắp xếp theo điểm giảm dần.
+    """
+    start = time.perf_counter()
+    terms = build_query_terms(keywords, synonyms)
+    # Title được lặp 2 lần để từ khóa trong tiêu đề nặng hơn trong abstract
+    documents = [_normalize(f"{p.get('title', '')} {p.get('title', '')} {p.get('abstract', '')}") for p in papers]
+    scores = bm25_scores(documents, terms)
+
+    ranked = sorted(
+        np.flatnonzero(scores > min_score),
+        key=lambda i: (not papers[i].get("near_duplicate"), scores[i]),
+        reverse=True,
+    )
+    kept = [papers[i] for i in (ranked[:top_k] if top_k else ranked)]
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    dropped = len(papers) - len(kept)
+    report_add("prerank", "candidates", len(papers))
+    report_add("prerank", "kept", len(kept))
+    report_add("prerank", "llm_abstracts_avoided", dropped)
+    report_add("prerank", "llm_calls_avoided",
+               math.ceil(len(papers) / batch_size) - math.ceil(len(kept) / batch_size))
+    report_add("prerank", "elapsed_ms", round(elapsed_ms, 2))
+    print(f"🔎 Pre-rank: giữ {len(kept)}/{len(papers)} bài ({elapsed_ms:.1f} ms)")
+    return kept
@@ -0,0 +1,94 @@
+import os
+import glob
+import json
+import hashlib
+from datetime import datetime, timedelta
+from paper_schema import normalize_key
+
+
+DATABASE_DIR = "database"
+SNAPSHOT_DIR = "published"
+# Snapshot của các ngày cũ hơn số ngày này bị xóa (workflow commit database/ sau mỗi lần chạy)
+SNAPSHOT_KEEP_DAYS = int(os.getenv("SNAPSHOT_KEEP_DAYS", "7"))
+
+
+def content_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def snapshot_entries(papers, render):
+    """[{key, hash}] theo thứ tự hiển thị; `render(index, paper)` là nội dung thực sự được ghi lên đích."""
+    return [
+        {"key": normalize_key(paper) or f"#{index}", "hash": content_hash(render(index, paper))}
+        for index, paper in enumerate(papers, 1)
+    ]
+
+
+# ==============================
+# Snapshot những gì đã publish của từng ngày
+# ==============================
+def get_snapshot_path(sink, target, date_str, db_dir=DATABASE_DIR):
+    return os.path.join(db_dir, SNAPSHOT_DIR, sink, target, f"{date_str}.json")
+
+
+def load_snapshot(sink, target, date_str, db_dir=DATABASE_DIR):
+    """Snapshot của ngày `date_str` trên tài liệu/sheet `target` của `sink` ("gdoc"/"gsheet"), None nếu chưa có hoặc file lỗi."""
+    path = get_snapshot_path(sink, target, date_str, db_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        print(f"⚠️ Bỏ qua snapshot lỗi {path}: {e}")
+        return None
+
+
+def save_snapshot(sink, target, date_str, snapshot, db_dir=DATABASE_DIR):
+    """Ghi snapshot (file tạm rồi đổi tên) sau khi batchUpdate thành công."""
+    path = get_snapshot_path(sink, target, date_str, db_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def prune_snapshots(keep_days=SNAPSHOT_KEEP_DAYS, db_dir=DATABASE_DIR):
+    """
+    Xóa snapshot của các ngày cũ. File kết quả chỉ được nối thêm trong đúng ngày của nó, nên
+    snapshot cũ chỉ còn dùng khi outbox giao lại muộn; thiếu snapshot thì ngày đó được ghi lại cả ngày.
+    """
+    root = os.path.join(db_dir, SNAPSHOT_DIR)
+    cutoff = (datetime.now() - timedelta(days=keep_days)).strftime("%Y-%m-%d")
+    removed = 0
+    for path in glob.glob(os.path.join(root, "*", "*", "*.json")):
+        if os.path.basename(path)[:10] < cutoff:
+            os.remove(path)
+            removed += 1
+    for target_dir in glob.glob(os.path.join(root, "*", "*")):
+        if os.path.isdir(target_dir) and not os.listdir(target_dir):
+            os.rmdir(target_dir)
+    return removed
+
+
+def diff_snapshot(snapshot, entries, target):
+    """
+    So sánh danh sách sắp publish với snapshot đã publish.
+
+    File kết quả của 1 ngày chỉ được nối thêm (save_results_to_json), nên thường chỉ có bài mới
+    ở cuối hoặc vài bài đổi nội dung. Các trường hợp khác (đổi đích, bài bị xóa hoặc đổi thứ tự)
+    trả về None → ghi lại cả ngày.
+
+    Returns:
+        tuple | None: (chỉ số 0-based các bài cần cập nhật, chỉ số các bài mới cần chèn)
+    """
+    if not snapshot or snapshot.get("target") != target:
+        return None
+    published = snapshot.get("papers", [])
+    if len(entries) < len(published):
+        return None
+    if any(old["key"] != new["key"] for old, new in zip(published, entries)):
+        return None
+    updated = [i for i, (old, new) in enumerate(zip(published, entries)) if old["hash"] != new["hash"]]
+    return updated, list(range(len(published), len(entries)))
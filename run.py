@@ -1,14 +1,31 @@
-from scholar_search import run_scholar_search
-from search_api import search_openalex,  search_arxiv, search_crossref
 from dotenv import load_dotenv
-from utils import filter_duplicates, save_results_to_json, save_results_to_database,convert_latest_json_to_gsheet,enrich_with_firecrawl, summarize_filtered_papers, filter_top_papers,convert_latest_json_to_gdoc,innovative_filtered_papers
+from utils import filter_duplicates, save_results_to_json, enrich_with_firecrawl, filter_top_papers, innovative_filtered_papers, LLM_OFFLINE, stream_duplicate_filter, StreamingTopPapers
+from pipeline import Stage, run_pipeline
+from llm_executor import GEMINI_CONCURRENCY
+from run_report import print_run_summary, reset_run_report
+from checkpoint import StageCheckpoints, prune_stage_checkpoints
+from publish_snapshot import prune_snapshots
+from gemini_batch import BatchJobPending, prune_batch_jobs
+from token_budget import write_cost_report, run_budget
+from sinks import Outbox, drain_outbox, publish_all, PUBLISH_SINKS
+from topics import load_topics, SharedSearch, TOPICS_FILE, TOPIC_CONCURRENCY
+from scholar_search import ScholarBrowserPool
+from daemon import serve
+from concurrent.futures import ThreadPoolExecutor
+import argparse
 import os
+import sys
 
 
 RESULTS_DIR = "results"
 DATABASE_DIR = "database"
 DATABASE_FILE = "papers_db.json"
 ENV_PATH = ".env"
+# Các bước có checkpoint (database/checkpoints/stages/<ngày>/<chủ đề>/<bước>.json)
+RUN_STAGES = ["collect", "score", "analyze", "save"]
+# "barrier": xong từng bước mới sang bước sau, pre-rank BM25 trên toàn bộ bài rồi chỉ chấm prerank_top_k bài;
+# "stream": lọc trùng/bổ sung/chấm điểm từng bài ngay khi nguồn trả về (nhanh hơn nhưng chấm mọi bài khớp từ khóa)
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "barrier")
 
 if not os.path.exists(RESULTS_DIR):
     os.makedirs(RESULTS_DIR)
@@ -18,52 +35,184 @@ if not os.path.exists(ENV_PATH):
 
 load_dotenv(ENV_PATH)
 
-keyword_tab1 = "Pulsed Eddy Current (PEC)"
-max_results_tab1 = 30
-
-
-# 1. Gọi các API
-openalex_res = search_openalex(query=keyword_tab1, rows=max_results_tab1)
-arxiv_res = search_arxiv(query=keyword_tab1, rows=max_results_tab1)
-crossref_res = search_crossref(query=keyword_tab1, rows=max_results_tab1)
-
-# Google Scholar
-scholar_data = run_scholar_search(keyword_tab1, max_results_tab1)
-
-# 2. Hợp nhất kết quả
-merged_results = []
-for res in [openalex_res, arxiv_res, crossref_res, scholar_data]:
-    merged_results.extend(res)
-
-# 3. Lọc trùng 
-print("⏳ Đang lọc bài báo trùng...")
-unique_results = filter_duplicates(merged_results)
-
-# 4. Crawl abstract bổ sung bằng Firecrawl
-print("⏳ Đang bổ sung abstract...")
-enriched_results = enrich_with_firecrawl(unique_results)
-
-# 5. Lọc bài không liên quan
-print("⏳ Đang lọc bài báo...")
-top_results = filter_top_papers(enriched_results, keywords=[keyword_tab1])
-
-# # 6. Tóm tắt abstract
-# print("⏳ Đang tóm tắt abstract...")
-# summarized_results = summarize_filtered_papers(top_results)
-
-# 7. Tìm điểm sáng tạo
-print("⏳ Đang tìm điểm sáng tạo về phương pháp...")
-innovative_results = innovative_filtered_papers(top_results)
-
-# 8. Lưu kết quả
-saved_file = save_results_to_json(
-    innovative_results,
-    output_dir=RESULTS_DIR,
-    prefix=f"allapi_scholar_{keyword_tab1.replace(' ', '_')}"
-)
-if saved_file:
-    save_results_to_database(saved_file)
-    print(f"✅ Đã lưu kết quả enriched vào: {saved_file}")
-# 8. Lưu trên gg docs
-#convert_latest_json_to_gsheet()
-convert_latest_json_to_gdoc()
\ No newline at end of file
+
+def collect_papers(topic, search):
+    # 1-2. Gọi các API và hợp nhất kết quả
+    merged_results = []
+    for fetch in search.sources_for(topic).values():
+        merged_results.extend(fetch())
+
+    # 3. Lọc trùng
+    print(f"⏳ [{topic['name']}] Đang lọc bài báo trùng...")
+    unique_results = filter_duplicates(merged_results, prefix=topic["prefix"])
+
+    # 4. Crawl abstract bổ sung bằng Firecrawl
+    print(f"⏳ [{topic['name']}] Đang bổ sung abstract...")
+    return enrich_with_firecrawl(unique_results)
+
+
+def stream_top_papers(topic, search):
+    """
+    Bước 1-5 chạy chồng lên nhau: bài từ nguồn nào về trước được lọc trùng, bổ sung abstract
+    và chấm điểm ngay trong khi các nguồn chậm (Scholar) vẫn đang crawl.
+    Chỉ top-N cần đợi mọi bài chấm xong.
+
+    Returns:
+        tuple: (mọi bài đã bổ sung, top bài đã chấm điểm)
+    """
+    scorer = StreamingTopPapers(keywords=topic["keywords"], top_n=topic["top_n"], synonyms=topic["synonyms"])
+    enriched_results = run_pipeline(search.sources_for(topic), [
+        Stage("dedup", stream_duplicate_filter(topic["prefix"]), batch_size=50, max_wait=0.1),
+        Stage("enrich", enrich_with_firecrawl, batch_size=25, max_wait=2.0),
+        Stage("score", scorer.score, batch_size=scorer.batch_size, max_wait=2.0, workers=GEMINI_CONCURRENCY),
+    ])
+    return enriched_results, scorer.results()
+
+
+def score_papers(topic, search, checkpoints, offline):
+    """Bước 1-5: tìm, lọc trùng, bổ sung abstract ("collect") và chấm điểm chọn top-N ("score")."""
+    done, top_results = checkpoints.load("score")
+    if done:
+        return top_results
+
+    collected, enriched_results = checkpoints.load("collect")
+    if not collected and not offline and PIPELINE_MODE == "stream":
+        print(f"⏳ [{topic['name']}] Đang tìm, lọc và chấm điểm bài báo (streaming)...")
+        enriched_results, top_results = stream_top_papers(topic, search)
+        checkpoints.save("collect", enriched_results)
+    else:
+        if not collected:
+            enriched_results = collect_papers(topic, search)
+            checkpoints.save("collect", enriched_results)
+        # 5. Lọc bài không liên quan
+        print(f"⏳ [{topic['name']}] Đang lọc bài báo...")
+        top_results = filter_top_papers(enriched_results, keywords=topic["keywords"],
+                                        top_n=topic["top_n"], offline=offline, synonyms=topic["synonyms"])
+    checkpoints.save("score", top_results)
+    return top_results
+
+
+def run_topic(topic, search, outbox, offline=LLM_OFFLINE, force=()):
+    """
+    Chạy trọn pipeline cho 1 chủ đề. Đầu ra của từng bước được lưu checkpoint theo ngày + chủ đề:
+    nếu lần chạy lỗi giữa chừng (hoặc batch job chưa xong ở chế độ offline) thì lần chạy lại
+    trong ngày bắt đầu từ bước chưa xong. `force`: các bước phải chạy lại dù đã có checkpoint.
+
+    Returns:
+        str: "done" hoặc "pending" (batch job Gemini chưa xong)
+    """
+    checkpoints = StageCheckpoints(topic["name"], RUN_STAGES, force)
+    try:
+        top_results = score_papers(topic, search, checkpoints, offline)
+
+        # # 6. Tóm tắt abstract
+        # print("⏳ Đang tóm tắt abstract...")
+        # summarized_results = summarize_filtered_papers(top_results, offline=offline)
+
+        # 7. Tìm điểm sáng tạo
+        print(f"⏳ [{topic['name']}] Đang tìm điểm sáng tạo về phương pháp...")
+        innovative_results = checkpoints.run(
+            "analyze", lambda: innovative_filtered_papers(top_results, offline=offline)
+        )
+    except BatchJobPending as e:
+        checkpoints.mark_pending()
+        print(f"⏸️ [{topic['name']}] {e}, lần chạy sau sẽ tiếp tục từ checkpoint.")
+        return "pending"
+
+    # 8. Lưu kết quả
+    saved_file = checkpoints.run("save", lambda: save_results_to_json(
+        innovative_results,
+        output_dir=RESULTS_DIR,
+        prefix=topic["prefix"],
+    ))
+    if saved_file:
+        print(f"✅ [{topic['name']}] Đã lưu kết quả enriched vào: {saved_file}")
+        # 9. Database, Google Docs (và Sheets nếu bật) được ghi song song;
+        # đích lỗi vào outbox, không làm hỏng lần chạy
+        payload = {"file": saved_file, "date": os.path.basename(saved_file).split("_")[0]}
+        for field in ("document_id", "spreadsheet_id"):
+            if topic.get(field):
+                payload[field] = topic[field]
+        publish_all(payload, sinks=topic["sinks"] or PUBLISH_SINKS, outbox=outbox)
+    checkpoints.complete()
+    return "done"
+
+
+def main(offline=LLM_OFFLINE, force=(), topics_file=TOPICS_FILE, only=None, scholar_pool=None):
+    """
+    Chạy mọi chủ đề trong file cấu hình song song (tối đa TOPIC_CONCURRENCY chủ đề cùng lúc).
+    Các chủ đề dùng chung HTTP pool, cache, rate limiter Gemini, pool Chrome cho Scholar;
+    query giống nhau ở cùng 1 nguồn chỉ được gọi 1 lần (SharedSearch).
+    offline=True (chạy định kỳ): prompt chấm điểm/điểm sáng tạo được gửi qua Gemini Batch API.
+    scholar_pool: pool Chrome dùng lại giữa các lần chạy (daemon); None = mở mới và đóng khi xong.
+
+    Returns:
+        dict: {tên chủ đề: "done" | "pending" | "failed"}
+    """
+    reset_run_report()
+    run_budget.reset()
+    topics = load_topics(topics_file)
+    if only:
+        topics = [topic for topic in topics if topic["name"] in only]
+
+    # Giao lại các lần publish lỗi của lần chạy trước
+    outbox = Outbox()
+    drain_outbox(outbox)
+    prune_stage_checkpoints()
+    prune_batch_jobs()
+    prune_snapshots()
+
+    search = SharedSearch(topics, scholar_pool)
+
+    def run(topic):
+        try:
+            return run_topic(topic, search, outbox, offline, force)
+        except Exception as e:
+            print(f"❌ [{topic['name']}] Lỗi: {e}")
+            return "failed"
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(TOPIC_CONCURRENCY, len(topics)))) as pool:
+            statuses = dict(zip((topic["name"] for topic in topics), pool.map(run, topics)))
+    finally:
+        search.close()
+
+    print(f"📋 Kết quả theo chủ đề: {statuses}")
+    write_cost_report()
+    print_run_summary()
+    return statuses
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Thu thập, lọc và lưu bài báo mới cho các chủ đề")
+    arg_parser.add_argument("--offline", action="store_true", default=LLM_OFFLINE,
+                            help="Gửi prompt Gemini qua Batch API (cho lần chạy định kỳ)")
+    arg_parser.add_argument("--force", action="append", default=[], choices=RUN_STAGES + ["all"],
+                            help="Chạy lại bước này (và các bước sau) dù đã có checkpoint; dùng nhiều lần được")
+    arg_parser.add_argument("--topics", default=TOPICS_FILE,
+                            help="File cấu hình chủ đề (JSON)")
+    arg_parser.add_argument("--topic", action="append", default=None,
+                            help="Chỉ chạy chủ đề có tên này; dùng nhiều lần được")
+    arg_parser.add_argument("--daemon", action="store_true",
+                            help="Chạy liên tục theo DAEMON_SCHEDULE, giữ cache/pool giữa các lần chạy")
+    arg_parser.add_argument("--now", action="store_true",
+                            help="Với --daemon: chạy 1 lần ngay khi khởi động")
+    args = arg_parser.parse_args()
+
+    if args.daemon:
+        scholar_pool = ScholarBrowserPool()
+        force = list(args.force)
+
+        def job():
+            # --force chỉ áp dụng cho lần chạy đầu tiên
+            statuses = main(offline=args.offline, force=force, topics_file=args.topics, only=args.topic,
+                            scholar_pool=scholar_pool)
+            force.clear()
+            return statuses
+
+        serve(job, run_now=args.now, on_shutdown=scholar_pool.close)
+        sys.exit(0)
+
+    statuses = main(offline=args.offline, force=args.force, topics_file=args.topics, only=args.topic)
+    if "failed" in statuses.values():
+        sys.exit(1)
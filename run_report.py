@@ -0,0 +1,53 @@
+import time
+import threading
+from contextlib import contextmanager
+
+
+# ==============================
+# Báo cáo tổng kết cho mỗi lần chạy
+# ==============================
+# Dạng {section: {key: value}}, ví dụ {"enrichment": {"wall_time_s": 12.3, "fetched": 8}}
+RUN_REPORT = {}
+_lock = threading.Lock()
+
+
+def reset_run_report():
+    with _lock:
+        RUN_REPORT.clear()
+
+
+def report_set(section, key, value):
+    with _lock:
+        RUN_REPORT.setdefault(section, {})[key] = value
+
+
+def report_add(section, key, amount=1):
+    with _lock:
+        stats = RUN_REPORT.setdefault(section, {})
+        stats[key] = stats.get(key, 0) + amount
+
+
+def report_max(section, key, value):
+    with _lock:
+        stats = RUN_REPORT.setdefault(section, {})
+        stats[key] = max(stats.get(key, value), value)
+
+
+@contextmanager
+def report_timer(section, key="wall_time_s"):
+    """Đo thời gian thực (wall time) của một khối lệnh và cộng dồn vào báo cáo."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        report_add(section, key, round(time.perf_counter() - start, 3))
+
+
+def print_run_summary():
+    if not RUN_REPORT:
+        return
+    print("\n📊 Tổng kết lần chạy:")
+    with _lock:
+        for section, stats in RUN_REPORT.items():
+            details = ", ".join(f"{k}={v}" for k, v in stats.items())
+            print(f"  • {section}: {details}")
@@ -2,13 +2,14 @@ import os
 import json
 import re
 import time
+import queue
+import threading
 from datetime import datetime, timedelta
 from typing import List, Dict
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
+
+
+# Số Chrome tối đa chạy cùng lúc khi nhiều chủ đề dùng chung pool (Scholar dễ chặn nếu crawl song song)
+SCHOLAR_BROWSERS = int(os.getenv("SCHOLAR_BROWSERS", "1"))
 
 
 def get_target_date(days_ago=1):
@@ -21,6 +22,10 @@ class ScholarFinder:
 
     def setup_browser(self):
         """Setup Chrome browser với các tùy chọn an toàn"""
+        # selenium chỉ được import khi thực sự mở Chrome (topics/app import module này khi khởi động)
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+
         options = Options()
         options.add_argument("--headless=new")
         options.add_argument('--no-sandbox')
@@ -64,6 +69,7 @@ class ScholarFinder:
         """
         Mở link bài báo để lấy đầy đủ title và abstract
         """
+        from selenium.webdriver.common.by import By
         print(f"Accessing paper {paper_rank}: {paper_url}")
         try:
             self.driver.execute_script("window.open('');")
@@ -151,6 +157,9 @@ class ScholarFinder:
         Tìm kiếm Google Scholar và trả về danh sách bài báo mới nhất,
         chỉ lấy đúng ngày (nếu có date).
         """
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
         print(f"Searching Google Scholar for: {search_query}")
         self.driver.get("https://scholar.google.com")
         time.sleep(3)
@@ -241,9 +250,63 @@ class ScholarFinder:
                 self.driver.quit()
 
 
-def run_scholar_search(keyword: str, max_papers: int = 100):
-    finder = ScholarFinder()
+class ScholarBrowserPool:
+    """
+    Giữ các Chrome đã mở để dùng lại giữa nhiều lần tìm (nhiều chủ đề trong 1 lần chạy),
+    tối đa `size` trình duyệt làm việc cùng lúc. Gọi close() khi xong.
+    """
+
+    def __init__(self, size=SCHOLAR_BROWSERS):
+        self._slots = threading.Semaphore(max(1, size))
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._finders = []
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            finder = ScholarFinder()
+            finder.setup_browser()
+            with self._lock:
+                self._finders.append(finder)
+            return finder
+
+    def _discard(self, finder):
+        with self._lock:
+            self._finders.remove(finder)
+        try:
+            finder.driver.quit()
+        except Exception:
+            pass
+
+    def search(self, keyword: str, max_papers: int = 100, date: str = None) -> List[Dict]:
+        with self._slots:
+            finder = self._acquire()
+            try:
+                papers = finder.search_google_scholar(keyword, max_papers, date)
+            except Exception:
+                # Trình duyệt có thể đã hỏng → bỏ, lần sau mở cái mới
+                self._discard(finder)
+                raise
+            self._idle.put(finder)
+            return papers
+
+    def close(self):
+        with self._lock:
+            finders, self._finders = self._finders, []
+        for finder in finders:
+            try:
+                finder.driver.quit()
+            except Exception:
+                pass
+
+
+def run_scholar_search(keyword: str, max_papers: int = 100, pool: ScholarBrowserPool = None):
     date_str = get_target_date(days_ago=1)
+    if pool is not None:
+        return pool.search(keyword, max_papers, date=date_str)
+    finder = ScholarFinder()
     return finder.run(keyword, max_papers, date=date_str)
 
 
@@ -1,5 +1,15 @@
+import os
+import re
 import requests
 import xml.etree.ElementTree as ET
+from requests.adapters import HTTPAdapter
+
+
+# 1 connection pool (keep-alive) dùng chung cho mọi lời gọi API, kể cả khi nhiều chủ đề chạy song song
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+http = requests.Session()
+http.mount("https://", HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE))
+http.mount("http://", HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE))
 
 
 
@@ -24,7 +34,7 @@ def search_openalex(query: str, rows: int, date=None):
         params["filter"] = f"from_publication_date:{date},to_publication_date:{date}"
 
     try:
-        response = requests.get(url, params=params, timeout=30)
+        response = http.get(url, params=params, timeout=30)
         response.raise_for_status()
     except requests.exceptions.RequestException:
         return []
@@ -75,7 +85,7 @@ def search_semantic_scholar(query: str, rows : int, date=None):
     }
 
     try:
-        response = requests.get(url, params=params, timeout=30)
+        response = http.get(url, params=params, timeout=30)
         response.raise_for_status()
     except requests.exceptions.RequestException:
         return []
@@ -124,7 +134,7 @@ def search_arxiv(query: str, rows: int, date=None):
     }
 
     try:
-        response = requests.get(url, params=params, timeout=30)
+        response = http.get(url, params=params, timeout=30)
         response.raise_for_status()
     except requests.exceptions.RequestException:
         return []
@@ -175,7 +185,7 @@ def search_crossref(query: str, rows: int, date=None):
         params["filter"] = f"from-pub-date:{date},until-pub-date:{date}"
 
     try:
-        response = requests.get(url, params=params, timeout=30)
+        response = http.get(url, params=params, timeout=30)
         response.raise_for_status()
     except requests.exceptions.RequestException:
         return []
@@ -220,5 +230,108 @@ def search_crossref(query: str, rows: int, date=None):
     return results
 
 
+# ========================
+# 5. Tra cứu metadata theo DOI / arXiv id / title (dùng cho enrichment)
+# ========================
+OPENALEX_MAX_FILTER_VALUES = 50
+
+
+def _openalex_record(item):
+    abstract = decode_openalex_abstract(item.get("abstract_inverted_index"))
+    if abstract and isinstance(abstract, str):
+        abstract = abstract.replace("\n", " ").strip()
+    return {
+        "abstract": abstract,
+        "pub_date": item.get("publication_date") or "Not Available",
+    }
+
+
+def lookup_openalex_by_doi(dois, timeout=30):
+    """
+    Tra nhiều DOI cùng lúc: filter=doi:a|b|c (tối đa 50 DOI mỗi request).
+
+    Returns:
+        dict: {doi viết thường: {"abstract", "pub_date"}}
+    """
+    dois = list(dict.fromkeys(d.lower() for d in dois if d))
+    found = {}
+    for i in range(0, len(dois), OPENALEX_MAX_FILTER_VALUES):
+        chunk = dois[i:i + OPENALEX_MAX_FILTER_VALUES]
+        params = {
+            "filter": "doi:" + "|".join(chunk),
+            "per_page": OPENALEX_MAX_FILTER_VALUES,
+            "select": "doi,publication_date,abstract_inverted_index",
+        }
+        try:
+            response = http.get("https://api.openalex.org/works", params=params, timeout=timeout)
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            continue
+
+        for item in response.json().get("results", []):
+            doi = (item.get("doi") or "").lower().replace("https://doi.org/", "")
+            if doi:
+                found[doi] = _openalex_record(item)
+    return found
+
 
+def lookup_openalex_by_title(title, timeout=30):
+    """
+    Tìm 1 bài theo tiêu đề (filter=title.search), chỉ nhận khi tiêu đề khớp gần như hoàn toàn.
+
+    Returns:
+        dict | None: {"abstract", "pub_date"}
+    """
+    normalized = " ".join(re.findall(r"\w+", (title or "").lower()))
+    if not normalized:
+        return None
+    params = {
+        "filter": f"title.search:{normalized}",
+        "per_page": 5,
+        "select": "title,publication_date,abstract_inverted_index",
+    }
+    try:
+        response = http.get("https://api.openalex.org/works", params=params, timeout=timeout)
+        response.raise_for_status()
+    except requests.exceptions.RequestException:
+        return None
+
+    for item in response.json().get("results", []):
+        candidate = " ".join(re.findall(r"\w+", (item.get("title") or "").lower()))
+        if candidate == normalized:
+            return _openalex_record(item)
+    return None
+
+
+def lookup_arxiv_by_id(arxiv_ids, batch_size=50, timeout=30):
+    """
+    Tra nhiều bài arXiv cùng lúc bằng id_list=a,b,c.
+
+    Returns:
+        dict: {arxiv id (không có version): {"abstract", "pub_date"}}
+    """
+    ids = list(dict.fromkeys(i for i in arxiv_ids if i))
+    found = {}
+    ns = {"arxiv": "http://www.w3.org/2005/Atom"}
+    for i in range(0, len(ids), batch_size):
+        chunk = ids[i:i + batch_size]
+        params = {"id_list": ",".join(chunk), "max_results": len(chunk)}
+        try:
+            response = http.get("http://export.arxiv.org/api/query", params=params, timeout=timeout)
+            response.raise_for_status()
+            root = ET.fromstring(response.content)
+        except (requests.exceptions.RequestException, ET.ParseError):
+            continue
 
+        for entry in root.findall("arxiv:entry", ns):
+            entry_id = entry.find("arxiv:id", ns)
+            summary = entry.find("arxiv:summary", ns)
+            published = entry.find("arxiv:published", ns)
+            if entry_id is None or summary is None:
+                continue
+            arxiv_id = re.sub(r"v\d+$", "", entry_id.text.strip().split("/abs/")[-1])
+            found[arxiv_id] = {
+                "abstract": " ".join(summary.text.split()),
+                "pub_date": published.text[:10] if published is not None else "Not Available",
+            }
+    return found
@@ -0,0 +1,303 @@
+import os
+import re
+import glob
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from paper_schema import normalize_key
+
+
+RESULTS_DIR = "results"
+DATABASE_DIR = "database"
+INDEX_FILE = "papers_index.sqlite"
+
+# Trọng số BM25 theo thứ tự cột của bảng FTS: title, abstract, authors, innovative
+BM25_WEIGHTS = (10.0, 1.0, 2.0, 3.0)
+DATE_FIELDS = ("pub_date", "saved_date")
+_rebuild_lock = threading.Lock()
+
+
+# ==============================
+# Kết nối & khởi tạo index
+# ==============================
+def get_index_path(db_dir=DATABASE_DIR, index_file=INDEX_FILE):
+    return os.path.join(db_dir, index_file)
+
+
+def connect_index(db_dir=DATABASE_DIR, index_file=INDEX_FILE):
+    """
+    Mở (hoặc tạo mới) index SQLite FTS5.
+    - Bảng `papers` giữ metadata để lọc (ngày, nguồn, score).
+    - Bảng ảo `papers_fts` (external content) giữ text để tìm kiếm BM25,
+      được đồng bộ tự động bằng trigger.
+    """
+    os.makedirs(db_dir, exist_ok=True)
+    conn = sqlite3.connect(get_index_path(db_dir, index_file))
+    conn.row_factory = sqlite3.Row
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS papers (
+            rowid INTEGER PRIMARY KEY,
+            key TEXT NOT NULL UNIQUE,
+            title TEXT,
+            abstract TEXT,
+            authors TEXT,
+            innovative TEXT,
+            source TEXT,
+            link TEXT,
+            pub_date TEXT,
+            saved_date TEXT,
+            score REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_papers_pub_date ON papers(pub_date);
+        CREATE INDEX IF NOT EXISTS idx_papers_saved_date ON papers(saved_date);
+        CREATE INDEX IF NOT EXISTS idx_papers_source ON papers(source);
+        CREATE INDEX IF NOT EXISTS idx_papers_score ON papers(score);
+
+        CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(
+            title, abstract, authors, innovative,
+            content='papers', content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2'
+        );
+
+        CREATE TRIGGER IF NOT EXISTS papers_ai AFTER INSERT ON papers BEGIN
+            INSERT INTO papers_fts(rowid, title, abstract, authors, innovative)
+            VALUES (new.rowid, new.title, new.abstract, new.authors, new.innovative);
+        END;
+        CREATE TRIGGER IF NOT EXISTS papers_ad AFTER DELETE ON papers BEGIN
+            INSERT INTO papers_fts(papers_fts, rowid, title, abstract, authors, innovative)
+            VALUES ('delete', old.rowid, old.title, old.abstract, old.authors, old.innovative);
+        END;
+        CREATE TRIGGER IF NOT EXISTS papers_au AFTER UPDATE ON papers BEGIN
+            INSERT INTO papers_fts(papers_fts, rowid, title, abstract, authors, innovative)
+            VALUES ('delete', old.rowid, old.title, old.abstract, old.authors, old.innovative);
+            INSERT INTO papers_fts(rowid, title, abstract, authors, innovative)
+            VALUES (new.rowid, new.title, new.abstract, new.authors, new.innovative);
+        END;
+    """)
+    return conn
+
+
+def ensure_index(results_dir=RESULTS_DIR, db_dir=DATABASE_DIR, index_file=INDEX_FILE):
+    """
+    File index không được commit (.gitignore, file nhị phân đổi sau mỗi lần chạy): checkout mới
+    (GitHub Actions) thì build lại từ các file trong results/ trước lần đọc/ghi đầu tiên.
+    """
+    with _rebuild_lock:
+        if not os.path.exists(get_index_path(db_dir, index_file)) and glob.glob(os.path.join(results_dir, "*.json")):
+            rebuild_index(results_dir, db_dir, index_file)
+
+
+def normalize_date(value):
+    """
+    Chuẩn hóa ngày về dạng YYYY-MM-DD để so sánh chuỗi được:
+    "2025-3-5" → "2025-03-05", "2025" → "2025-01-01". Không đọc được → None.
+    """
+    match = re.match(r"^\s*((?:19|20)\d{2})(?:-(\d{1,2}))?(?:-(\d{1,2}))?", str(value or ""))
+    if not match:
+        return None
+    year, month, day = match.groups()
+    return f"{year}-{int(month or 1):02d}-{int(day or 1):02d}"
+
+
+def _text(value):
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return ", ".join(str(v) for v in value)
+    text = str(value).strip()
+    return "" if text == "Not Available" else text
+
+
+def _score(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# ==============================
+# Cập nhật index (incremental)
+# ==============================
+def index_papers(papers, saved_date=None, db_dir=DATABASE_DIR, index_file=INDEX_FILE):
+    """
+    Thêm/cập nhật các bài báo vào index full-text (upsert theo key chuẩn hóa).
+    Được gọi từ save_results_to_json nên chỉ index phần dữ liệu mới của mỗi lần chạy.
+
+    Returns:
+        int: Số bài báo đã được ghi vào index.
+    """
+    rows = index_rows(papers, saved_date or datetime.now().strftime("%Y-%m-%d"))
+    if not rows:
+        return 0
+
+    ensure_index(db_dir=db_dir, index_file=index_file)
+    return _upsert(rows, db_dir, index_file)
+
+
+def index_rows(papers, saved_date):
+    """Các dòng (theo thứ tự cột của bảng papers) của những bài có key chuẩn hóa."""
+    rows = []
+    for paper in papers:
+        key = normalize_key(paper)
+        if not key:
+            continue
+        rows.append((
+            key,
+            _text(paper.get("title")),
+            _text(paper.get("abstract")),
+            _text(paper.get("authors")),
+            _text(paper.get("innovative")),
+            _text(paper.get("source")),
+            _text(paper.get("link")),
+            normalize_date(paper.get("pub_date")),
+            saved_date,
+            _score(paper.get("score")),
+        ))
+    return rows
+
+
+def _upsert(rows, db_dir, index_file):
+    conn = connect_index(db_dir, index_file)
+    try:
+        with conn:
+            conn.executemany("""
+                INSERT INTO papers (key, title, abstract, authors, innovative, source, link,
+                                    pub_date, saved_date, score)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    title = excluded.title,
+                    abstract = excluded.abstract,
+                    authors = excluded.authors,
+                    innovative = excluded.innovative,
+                    source = excluded.source,
+                    link = excluded.link,
+                    pub_date = excluded.pub_date,
+                    score = excluded.score
+            """, rows)
+    finally:
+        conn.close()
+    return len(rows)
+
+
+def rebuild_index(results_dir=RESULTS_DIR, db_dir=DATABASE_DIR, index_file=INDEX_FILE):
+    """
+    Index lại toàn bộ các file kết quả YYYY-MM-DD_*.json đã lưu (ngày lưu lấy từ tên file).
+    Build ra file tạm rồi đổi tên, nên lần chạy bị ngắt giữa chừng không để lại index thiếu.
+    """
+    tmp_file = f"{index_file}.tmp"
+    tmp_path = get_index_path(db_dir, tmp_file)
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    total = 0
+    for file_path in sorted(glob.glob(os.path.join(results_dir, "*.json"))):
+        saved_date = os.path.basename(file_path).split("_")[0]
+        try:
+            datetime.strptime(saved_date, "%Y-%m-%d")
+            with open(file_path, "r", encoding="utf-8") as f:
+                papers = json.load(f)
+        except Exception as e:
+            print(f"⚠️ Bỏ qua file {file_path}: {e}")
+            continue
+        rows = index_rows(papers, saved_date)
+        if rows:
+            total += _upsert(rows, db_dir, tmp_file)
+
+    conn = connect_index(db_dir, tmp_file)
+    try:
+        conn.execute("INSERT INTO papers_fts(papers_fts) VALUES ('optimize')")
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, get_index_path(db_dir, index_file))
+    print(f"✅ Đã index {total} bài báo từ {results_dir}/")
+    return total
+
+
+# ==============================
+# Truy vấn
+# ==============================
+def build_match_query(query):
+    """
+    Chuyển câu truy vấn tự do thành cú pháp MATCH của FTS5 an toàn:
+    mỗi từ được đặt trong ngoặc kép (AND giữa các từ), từ cuối cho phép tìm theo tiền tố.
+    """
+    tokens = re.findall(r"\w+", query or "")
+    if not tokens:
+        return None
+    terms = [f'"{t}"' for t in tokens[:-1]] + [f'"{tokens[-1]}"*']
+    return " ".join(terms)
+
+
+def search_papers(query, date_from=None, date_to=None, date_field="pub_date", sources=None,
+                  min_score=None, limit=50, db_dir=DATABASE_DIR, index_file=INDEX_FILE):
+    """
+    Tìm kiếm full-text, xếp hạng BM25 (title > innovative > authors > abstract).
+
+    Parameters:
+        query (str): Từ khóa tìm kiếm.
+        date_from, date_to (str): Khoảng ngày YYYY-MM-DD (bao gồm 2 đầu), áp dụng cho `date_field`.
+        date_field (str): "pub_date" (ngày xuất bản) hoặc "saved_date" (ngày thu thập).
+        sources (list): Chỉ lấy các nguồn này (OpenAlex, arXiv, ...).
+        min_score (float): Chỉ lấy bài có score AI >= min_score.
+        limit (int): Số kết quả tối đa.
+
+    Returns:
+        list: Danh sách dict bài báo, kèm `rank` (BM25, càng nhỏ càng liên quan).
+    """
+    match = build_match_query(query)
+    if not match:
+        return []
+    ensure_index(db_dir=db_dir, index_file=index_file)
+    if not os.path.exists(get_index_path(db_dir, index_file)):
+        return []
+    if date_field not in DATE_FIELDS:
+        raise ValueError(f"date_field phải là một trong {DATE_FIELDS}")
+
+    sql = f"""
+        SELECT p.key, p.title, p.abstract, p.authors, p.innovative, p.source, p.link,
+               p.pub_date, p.saved_date, p.score,
+               bm25(papers_fts, {", ".join(str(w) for w in BM25_WEIGHTS)}) AS rank
+        FROM papers_fts
+        JOIN papers p ON p.rowid = papers_fts.rowid
+        WHERE papers_fts MATCH ?
+    """
+    params = [match]
+    if date_from:
+        sql += f" AND p.{date_field} >= ?"
+        params.append(normalize_date(date_from))
+    if date_to:
+        sql += f" AND p.{date_field} <= ?"
+        params.append(normalize_date(date_to))
+    if sources:
+        sql += f" AND p.source IN ({', '.join('?' for _ in sources)})"
+        params.extend(sources)
+    if min_score is not None:
+        sql += " AND p.score >= ?"
+        params.append(min_score)
+    sql += " ORDER BY rank LIMIT ?"
+    params.append(int(limit))
+
+    conn = connect_index(db_dir, index_file)
+    try:
+        return [dict(row) for row in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+
+def list_sources(db_dir=DATABASE_DIR, index_file=INDEX_FILE):
+    """Danh sách các nguồn đã có trong index (dùng cho bộ lọc trên Streamlit)."""
+    ensure_index(db_dir=db_dir, index_file=index_file)
+    if not os.path.exists(get_index_path(db_dir, index_file)):
+        return []
+    conn = connect_index(db_dir, index_file)
+    try:
+        return [row[0] for row in conn.execute(
+            "SELECT DISTINCT source FROM papers WHERE source != '' ORDER BY source"
+        )]
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    rebuild_index()
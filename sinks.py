@@ -0,0 +1,141 @@
+import os
+import time
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from run_report import report_add
+from checkpoint import load_checkpoint, save_checkpoint, clear_checkpoint
+
+
+# Các đích publish kết quả, cách nhau bởi dấu phẩy (đã đăng ký bằng register_sink)
+PUBLISH_SINKS = [name.strip() for name in os.getenv("PUBLISH_SINKS", "database,gdoc").split(",") if name.strip()]
+SINK_MAX_RETRIES = int(os.getenv("SINK_MAX_RETRIES", "3"))
+SINK_BACKOFF = 5
+# Lần giao không thành được lưu ở database/checkpoints/publish_outbox.json, chạy lại ở lần sau
+OUTBOX_CHECKPOINT = "publish_outbox"
+
+SINKS = {}
+
+
+class SinkError(Exception):
+    """Đích publish báo thất bại mà không ném exception riêng."""
+
+
+def register_sink(name, publish):
+    """
+    `publish(payload)` ghi kết quả lên 1 đích; payload = {"file": đường dẫn JSON, "date": ngày}
+    và các đích riêng của chủ đề nếu có ("document_id", "spreadsheet_id").
+    """
+    SINKS[name] = publish
+
+
+# ==============================
+# Outbox: các lần giao chưa thành công
+# ==============================
+class Outbox:
+    """
+    Hàng đợi bền (file JSON) các lần giao lỗi, mỗi (đích, file kết quả) giữ 1 mục: file kết quả
+    của 1 ngày (1 chủ đề) chỉ được nối thêm nên payload mới hơn luôn bao hàm payload cũ.
+    """
+
+    def __init__(self, name=OUTBOX_CHECKPOINT):
+        self.name = name
+        self._lock = threading.Lock()
+        self.entries = (load_checkpoint(name) or {}).get("entries", [])
+
+    def _save(self):
+        if self.entries:
+            save_checkpoint(self.name, {"entries": self.entries})
+        else:
+            clear_checkpoint(self.name)
+
+    def put(self, sink, payload, error, attempts=1):
+        with self._lock:
+            self.entries = [e for e in self.entries
+                            if (e["sink"], e["payload"]["file"]) != (sink, payload["file"])]
+            self.entries.append({
+                "sink": sink,
+                "payload": payload,
+                "attempts": attempts,
+                "last_error": str(error),
+                "queued_at": datetime.now().isoformat(timespec="seconds"),
+            })
+            self._save()
+
+    def remove(self, sink, payload):
+        with self._lock:
+            self.entries = [e for e in self.entries if (e["sink"], e["payload"]) != (sink, payload)]
+            self._save()
+
+    def pending(self):
+        with self._lock:
+            return list(self.entries)
+
+
+# ==============================
+# Giao tới các đích song song
+# ==============================
+def deliver(sink, payload, max_retries=SINK_MAX_RETRIES, backoff=SINK_BACKOFF):
+    """Giao payload tới 1 đích, thử lại với backoff tăng dần; hết lượt thì ném lỗi cuối cùng."""
+    publish = SINKS.get(sink)
+    if publish is None:
+        raise SinkError(f"Chưa đăng ký đích publish '{sink}'")
+    for attempt in range(max_retries + 1):
+        try:
+            if publish(payload) is False:
+                raise SinkError(f"Đích '{sink}' báo thất bại")
+            return
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            print(f"⚠️ Publish {sink} lỗi ({e}), thử lại sau {backoff * (2 ** attempt)}s...")
+            time.sleep(backoff * (2 ** attempt))
+
+
+def _deliver_all(jobs, outbox, max_retries, backoff):
+    """jobs: [(sink, payload, số lần đã thử trước đó)]. Trả về {(sink, file): True/False}."""
+    if not jobs:
+        return {}
+
+    def run(job):
+        sink, payload, attempts = job
+        try:
+            deliver(sink, payload, max_retries, backoff)
+        except Exception as e:
+            outbox.put(sink, payload, e, attempts + 1)
+            report_add("publish", "queued_to_outbox")
+            print(f"📮 Publish {sink} ({payload['date']}) thất bại: {e} → đưa vào outbox")
+            return False
+        outbox.remove(sink, payload)
+        report_add("publish", "delivered")
+        print(f"✅ Đã publish {sink} ({payload['date']})")
+        return True
+
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        results = list(pool.map(run, jobs))
+    return {(sink, payload["file"]): ok for (sink, payload, _), ok in zip(jobs, results)}
+
+
+def drain_outbox(outbox=None, max_retries=SINK_MAX_RETRIES, backoff=SINK_BACKOFF):
+    """Giao lại các mục còn trong outbox từ lần chạy trước."""
+    outbox = outbox or Outbox()
+    pending = outbox.pending()
+    if not pending:
+        return {}
+    print(f"📬 Giao lại {len(pending)} mục trong outbox...")
+    report_add("publish", "outbox_retried", len(pending))
+    return _deliver_all([(e["sink"], e["payload"], e["attempts"]) for e in pending], outbox, max_retries, backoff)
+
+
+def publish_all(payload, sinks=None, outbox=None, max_retries=SINK_MAX_RETRIES, backoff=SINK_BACKOFF):
+    """
+    Publish payload tới mọi đích cùng lúc, mỗi đích tự thử lại; đích lỗi không làm hỏng lần chạy
+    mà được đưa vào outbox để giao lại ở lần chạy sau (drain_outbox).
+
+    Returns:
+        dict: {tên đích: True nếu giao thành công}
+    """
+    outbox = outbox or Outbox()
+    sinks = PUBLISH_SINKS if sinks is None else sinks
+    results = _deliver_all([(sink, payload, 0) for sink in sinks], outbox, max_retries, backoff)
+    return {sink: ok for (sink, _), ok in results.items()}
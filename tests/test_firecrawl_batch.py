@@ -0,0 +1,185 @@
+import pytest
+
+import firecrawl_api
+from firecrawl_api import (
+    batch_fetch_abstract_and_pubdate_firecrawl, fetch_abstract_and_pubdate_firecrawl, extract_abstract_and_pubdate,
+    FALLBACK_SCRAPE_OPTIONS
+)
+
+
+# Trang rút gọn bình thường dài hơn FALLBACK_MIN_CHARS nên không bị scrape lại
+TITLE = "# " + "Pulsed eddy current inspection of layered structures " * 4
+ABSTRACT_PAGE = TITLE + "\nPublished: 2025-01-20\n## Abstract\nText of {url}\n## Introduction\nBody"
+
+
+class FakeFirecrawl:
+    """
+    Giả lập /v1/batch/scrape: mỗi lần poll trả thêm `per_poll` trang, trang của URL lấy từ
+    `pages(url, options)` → document Firecrawl ({"markdown", "metadata"}) hoặc None (không có kết quả).
+    """
+
+    def __init__(self, pages, per_poll=2, final_status="completed", invalid=(), submit=None):
+        self.pages = pages
+        self.per_poll = per_poll
+        self.final_status = final_status
+        self.invalid = list(invalid)
+        self.submit = submit
+        self.jobs = {}
+
+    def route(self, method, path, body):
+        if method == "POST" and path == "/v1/batch/scrape":
+            if self.submit:
+                return self.submit
+            job_id = f"job{len(self.jobs) + 1}"
+            urls = [url for url in body["urls"] if url not in self.invalid]
+            self.jobs[job_id] = {"urls": urls, "options": body, "polls": 0}
+            return 200, {"success": True, "id": job_id, "invalidURLs": [u for u in body["urls"] if u in self.invalid]}
+        if method == "GET" and path.startswith("/v1/batch/scrape/"):
+            job = self.jobs[path.rsplit("/", 1)[1]]
+            job["polls"] += 1
+            ready = job["urls"][:job["polls"] * self.per_poll]
+            data = [page for page in (self.pages(url, job["options"]) for url in ready) if page]
+            done = len(ready) == len(job["urls"])
+            return 200, {"status": self.final_status if done else "scraping", "data": data}
+        return 404, {"error": "not found"}
+
+
+def page(url, markdown, status_code=200, error=None):
+    return {"markdown": markdown, "metadata": {"sourceURL": url, "statusCode": status_code, "error": error}}
+
+
+@pytest.fixture
+def firecrawl(stub_server, monkeypatch):
+    def start(fake):
+        server = stub_server(fake.route)
+        monkeypatch.setattr(firecrawl_api, "FIRECRAWL_API_URL", server.url)
+        monkeypatch.setattr(firecrawl_api, "FIRECRAWL_API_KEY", "test-key")
+        return server
+    return start
+
+
+def run_batch(urls, **kwargs):
+    seen = []
+    results = batch_fetch_abstract_and_pubdate_firecrawl(
+        urls, on_result=lambda url, result: seen.append(url), poll_interval=0.01, job_timeout=5, **kwargs
+    )
+    return results, seen
+
+
+def test_submit_and_poll_collects_pages_as_they_arrive(firecrawl):
+    urls = [f"https://example.org/paper/{i}" for i in range(5)]
+    # sourceURL có thể khác URL gửi lên (dấu / cuối) → khớp theo URL chuẩn hóa
+    server = firecrawl(FakeFirecrawl(lambda url, options: page(url + "/", ABSTRACT_PAGE.format(url=url))))
+
+    results, seen = run_batch(urls + [urls[0]])
+
+    assert list(results) == urls
+    assert seen == urls
+    assert results[urls[3]] == {"abstract": f"Text of {urls[3]}", "pubdate": "2025-01-20"}
+    submits = [body for method, path, body in server.requests if method == "POST"]
+    assert len(submits) == 1 and submits[0]["urls"] == urls
+    polls = [path for method, path, _ in server.requests if method == "GET"]
+    assert len(polls) == 3
+
+
+def test_partial_failure_keeps_status_codes(firecrawl):
+    urls = ["https://example.org/ok", "https://example.org/forbidden", "bad url", "https://example.org/missing"]
+
+    def pages(url, options):
+        if url.endswith("forbidden"):
+            return page(url, "", status_code=403, error="Forbidden")
+        if url.endswith("missing"):
+            return None
+        return page(url, ABSTRACT_PAGE.format(url=url))
+
+    firecrawl(FakeFirecrawl(pages, final_status="failed", invalid=["bad url"]))
+
+    results, seen = run_batch(urls)
+
+    assert sorted(seen) == sorted(urls)
+    assert results[urls[0]]["abstract"] == f"Text of {urls[0]}"
+    assert results[urls[1]]["status_code"] == 403
+    assert results[urls[2]]["status_code"] == 400
+    # Job kết thúc mà không có trang → lỗi tạm thời (không cache lỗi vĩnh viễn)
+    assert results[urls[3]]["status_code"] is None and "error" in results[urls[3]]
+
+
+@pytest.mark.parametrize("submit", [(500, {"error": "boom"}), (200, {"success": False})])
+def test_submit_failure_returns_none_for_per_url_fallback(firecrawl, submit):
+    firecrawl(FakeFirecrawl(lambda url, options: None, submit=submit))
+
+    results, seen = run_batch(["https://example.org/a"])
+
+    assert results is None
+    assert seen == []
+
+
+def test_near_empty_pages_rerun_without_include_tags(firecrawl):
+    urls = ["https://example.org/tagged", "https://example.org/untagged", "https://example.org/paywalled"]
+
+    def pages(url, options):
+        if url.endswith("untagged") and "includeTags" in options:
+            return page(url, "# Title only")
+        if url.endswith("paywalled"):
+            return page(url, TITLE + "\nPurchase this article to read the full text.")
+        return page(url, ABSTRACT_PAGE.format(url=url))
+
+    server = firecrawl(FakeFirecrawl(pages))
+
+    results, seen = run_batch(urls)
+
+    assert results[urls[1]]["abstract"] == f"Text of {urls[1]}"
+    # Trang có nội dung nhưng không có abstract: không trả thêm credit cho lần 2
+    assert results[urls[2]]["abstract"] == ""
+    assert sorted(seen) == sorted(urls)
+    submits = [body for method, path, body in server.requests if method == "POST"]
+    assert [s["urls"] for s in submits] == [urls, [urls[1]]]
+    assert "includeTags" not in submits[1] and submits[1]["excludeTags"] == FALLBACK_SCRAPE_OPTIONS["excludeTags"]
+
+
+def test_single_scrape_reruns_only_near_empty_pages(stub_server, monkeypatch):
+    def route(method, path, body):
+        if body["url"].endswith("untagged") and "includeTags" in body:
+            return 200, {"data": {"markdown": ""}}
+        if body["url"].endswith("paywalled"):
+            return 200, {"data": {"markdown": TITLE + "\nSign in to continue."}}
+        return 200, {"data": {"markdown": ABSTRACT_PAGE.format(url=body["url"])}}
+
+    server = stub_server(route)
+    monkeypatch.setattr(firecrawl_api, "FIRECRAWL_API_URL", server.url)
+    monkeypatch.setattr(firecrawl_api, "FIRECRAWL_API_KEY", "test-key")
+
+    untagged = fetch_abstract_and_pubdate_firecrawl("https://example.org/untagged")
+    paywalled = fetch_abstract_and_pubdate_firecrawl("https://example.org/paywalled")
+
+    assert untagged["abstract"] == "Text of https://example.org/untagged"
+    assert paywalled["abstract"] == ""
+    assert [body["url"].rsplit("/", 1)[1] for _, _, body in server.requests] == ["untagged", "untagged", "paywalled"]
+
+
+@pytest.mark.parametrize("markdown", ["Published:\n2025-01-20", "Published\n\n20 Jan 2025", "Published: 2025-01-20"])
+def test_pubdate_label_and_date_on_separate_lines(markdown):
+    assert extract_abstract_and_pubdate(markdown + "\n## Abstract\nText\n## Keywords")["pubdate"] == "2025-01-20"
+
+
+def test_enrich_falls_back_to_per_url_scrape(firecrawl, tmp_path, monkeypatch):
+    import utils
+    from cache_store import PersistentCache
+
+    monkeypatch.setattr(utils, "_firecrawl_cache", PersistentCache(str(tmp_path / "firecrawl_cache.json")))
+
+    def route(method, path, body):
+        if path == "/v1/batch/scrape":
+            return 503, {"error": "unavailable"}
+        return 200, {"data": {"markdown": ABSTRACT_PAGE.format(url=body["url"])}}
+
+    fake = FakeFirecrawl(None)
+    fake.route = route
+    server = firecrawl(fake)
+    papers = [{"title": f"P{i}", "link": f"https://example.org/p{i}", "abstract": "Not Available",
+               "pub_date": "Not Available"} for i in range(2)]
+
+    utils.enrich_with_firecrawl(papers, max_workers=2, mode="batch", cheap_first=False)
+
+    assert [p["abstract"] for p in papers] == [f"Text of {p['link']}" for p in papers]
+    assert [path for _, path, _ in server.requests].count("/v1/scrape") == 2
@@ -0,0 +1,279 @@
+import itertools
+
+import pytest
+
+import gdoc_publisher
+from gdoc_publisher import (
+    publish_day_to_gdoc, build_day_block, render_paper, day_range_name, paper_range_name, utf16_len, END_RANGE_NAME
+)
+
+
+class Call:
+    def __init__(self, fn):
+        self.fn = fn
+
+    def execute(self):
+        return self.fn()
+
+
+class FakeDocs:
+    """
+    Tài liệu Docs trong bộ nhớ: áp các request batchUpdate lên văn bản với chỉ số UTF-16 bắt đầu
+    từ 1, và dịch chỉ số named range như Docs (chèn đúng mép cuối không mở rộng range).
+    """
+
+    def __init__(self, text="\n"):
+        self.text = text
+        self.ranges = {}  # id → (name, start, end)
+        self.styled = []  # văn bản được updateTextStyle
+        self.calls = []
+        self.requests = []
+        self._ids = itertools.count(1)
+
+    def documents(self):
+        return self
+
+    # ---- chỉ số UTF-16 ----
+    def _units(self):
+        return self.text.encode("utf-16-le")
+
+    def _slice(self, start, end):
+        return self._units()[2 * (start - 1):2 * (end - 1)].decode("utf-16-le")
+
+    def range_text(self, name):
+        spans = [(start, end) for n, start, end in self.ranges.values() if n == name]
+        assert len(spans) == 1, f"{name}: {spans}"
+        return self._slice(*spans[0])
+
+    def _content(self):
+        content, index = [], 1
+        for line in self.text.splitlines(keepends=True):
+            end = index + utf16_len(line)
+            content.append({"startIndex": index, "endIndex": end,
+                            "paragraph": {"elements": [{"textRun": {"content": line}}]}})
+            index = end
+        return content
+
+    # ---- API ----
+    def get(self, documentId, fields=None):
+        def run():
+            self.calls.append("get")
+            named = {}
+            for range_id, (name, start, end) in self.ranges.items():
+                named.setdefault(name, {"name": name, "namedRanges": []})["namedRanges"].append(
+                    {"namedRangeId": range_id, "name": name, "ranges": [{"startIndex": start, "endIndex": end}]}
+                )
+            return {"namedRanges": named, "body": {"content": self._content()}}
+        return Call(run)
+
+    def batchUpdate(self, documentId, body):
+        def run():
+            self.calls.append("batchUpdate")
+            self.requests = body["requests"]
+            for request in body["requests"]:
+                (kind, args), = request.items()
+                getattr(self, "_" + kind)(**args)
+            return {}
+        return Call(run)
+
+    def _insertText(self, location, text):
+        index = location["index"]
+        length = utf16_len(self.text)
+        assert 1 <= index <= length, f"chèn ngoài tài liệu: {index}"
+        units = self._units()
+        self.text = (units[:2 * (index - 1)] + text.encode("utf-16-le") + units[2 * (index - 1):]).decode("utf-16-le")
+        n = utf16_len(text)
+        for range_id, (name, start, end) in self.ranges.items():
+            self.ranges[range_id] = (name, start + n if start >= index else start, end + n if end > index else end)
+
+    def _deleteContentRange(self, range):
+        start, end = range["startIndex"], range["endIndex"]
+        assert 1 <= start < end <= utf16_len(self.text), "không được xóa ký tự xuống dòng cuối cùng"
+        units = self._units()
+        self.text = (units[:2 * (start - 1)] + units[2 * (end - 1):]).decode("utf-16-le")
+
+        def shift(i):
+            return i if i <= start else (start if i <= end else i - (end - start))
+
+        for range_id, (name, a, b) in list(self.ranges.items()):
+            self.ranges[range_id] = (name, shift(a), shift(b))
+
+    def _createNamedRange(self, name, range):
+        assert range["startIndex"] < range["endIndex"] <= utf16_len(self.text)
+        self.ranges[str(next(self._ids))] = (name, range["startIndex"], range["endIndex"])
+
+    def _deleteNamedRange(self, namedRangeId=None, name=None):
+        assert namedRangeId in self.ranges
+        del self.ranges[namedRangeId]
+
+    def _updateTextStyle(self, range, textStyle, fields):
+        self.styled.append(self._slice(range["startIndex"], range["endIndex"]))
+
+
+DOC_ID = "doc-test"
+
+
+def paper(i, title=None, innovative=""):
+    return {"title": title or f"Paper {i}", "authors": [f"Author {i}"], "pub_date": "2026-10-01",
+            "link": f"https://example.org/{i}", "innovative": innovative}
+
+
+def day_text(papers, date_str):
+    return build_day_block(papers, date_str, 1)[0]
+
+
+def assert_day(docs, papers, date_str):
+    """Vùng của ngày và của từng bài khớp đúng văn bản sẽ được ghi khi ghi lại cả ngày."""
+    assert docs.range_text(day_range_name(date_str)) == day_text(papers, date_str)
+    for i, p in enumerate(papers, 1):
+        assert docs.range_text(paper_range_name(date_str, i)) == render_paper(i, p)
+
+
+@pytest.fixture(autouse=True)
+def snapshot_dir(tmp_path, monkeypatch):
+    # Snapshot được ghi vào database/published/... theo thư mục hiện tại
+    monkeypatch.chdir(tmp_path)
+    # Các ngày trong test chưa chốt, không phụ thuộc ngày chạy test
+    monkeypatch.setattr(gdoc_publisher, "open_days_cutoff", lambda: "2026-10-01")
+
+
+def test_first_publish_appends_day_with_named_ranges():
+    docs = FakeDocs("Giới thiệu\n")
+    papers = [paper(1, "🔬 Pulsed eddy current — thép"), paper(2)]
+
+    publish_day_to_gdoc(docs, DOC_ID, papers, "2026-10-18")
+
+    assert docs.text == "Giới thiệu" + day_text(papers, "2026-10-18") + "\n"
+    assert_day(docs, papers, "2026-10-18")
+    assert "🔬 Pulsed eddy current — thép" in docs.styled
+    # Tài liệu chưa có named range ngày nào → đọc thêm nội dung 1 lần để tìm block kiểu cũ
+    assert docs.calls == ["get", "get", "batchUpdate"]
+
+
+def test_unchanged_day_makes_no_api_call():
+    docs = FakeDocs()
+    papers = [paper(1), paper(2)]
+    publish_day_to_gdoc(docs, DOC_ID, papers, "2026-10-18")
+    docs.calls.clear()
+
+    assert publish_day_to_gdoc(docs, DOC_ID, [dict(p) for p in papers], "2026-10-18") == 0
+    assert docs.calls == []
+
+
+def test_incremental_update_matches_full_rewrite():
+    date_str = "2026-10-18"
+    docs = FakeDocs("Giới thiệu\n")
+    papers = [paper(1, "🧲 Emoji title"), paper(2), paper(3)]
+    publish_day_to_gdoc(docs, DOC_ID, papers, date_str)
+    docs.calls.clear()
+
+    # Sửa bài 1 (ký tự ngoài BMP làm lệch chỉ số UTF-16) và bài 3, thêm 2 bài mới ở cuối
+    changed = [dict(p) for p in papers]
+    changed[0]["innovative"] = "Cảm biến mới 🚀 đo độ dày"
+    changed[2]["title"] = "Paper 3 (revised)"
+    changed += [paper(4, "𝛼-phase 🔭"), paper(5)]
+    count = publish_day_to_gdoc(docs, DOC_ID, changed, date_str)
+
+    assert docs.calls == ["get", "batchUpdate"]
+    assert docs.text == "Giới thiệu" + day_text(changed, date_str) + "\n"
+    assert_day(docs, changed, date_str)
+    assert {"🧲 Emoji title", "Paper 3 (revised)", "𝛼-phase 🔭", "Paper 5"} <= set(docs.styled)
+    # Chỉ các bài đổi/mới được gửi: bài 2 không đổi thì không bị xóa/chèn lại
+    inserted = "".join(r["insertText"]["text"] for r in docs.requests if "insertText" in r)
+    assert "Paper 2" not in inserted and "Ngày 2026" not in inserted
+    assert count == len(docs.requests)
+
+
+def test_update_keeps_neighbouring_days_intact():
+    docs = FakeDocs()
+    day1, day2 = [paper(1), paper(2)], [paper(3)]
+    publish_day_to_gdoc(docs, DOC_ID, day1, "2026-10-17")
+    publish_day_to_gdoc(docs, DOC_ID, day2, "2026-10-18")
+
+    day1 = day1 + [paper(6, "Late 🕑 addition")]
+    day1[0] = dict(day1[0], innovative="Updated")
+    publish_day_to_gdoc(docs, DOC_ID, day1, "2026-10-17")
+
+    assert docs.text == day_text(day1, "2026-10-17") + day_text(day2, "2026-10-18") + "\n"
+    assert_day(docs, day1, "2026-10-17")
+    assert_day(docs, day2, "2026-10-18")
+    # Điểm chèn ngày mới vẫn ở cuối block ngày cuối cùng sau khi ngày trước nó dài ra
+    ends = {name: end for name, _, end in docs.ranges.values()}
+    assert ends[END_RANGE_NAME] == ends[day_range_name("2026-10-18")]
+
+
+def test_removed_or_reordered_papers_rewrite_the_day():
+    date_str = "2026-10-18"
+    docs = FakeDocs()
+    papers = [paper(1), paper(2), paper(3)]
+    publish_day_to_gdoc(docs, DOC_ID, papers, date_str)
+
+    reordered = [papers[2], papers[0]]
+    publish_day_to_gdoc(docs, DOC_ID, reordered, date_str)
+
+    assert docs.text == day_text(reordered, date_str) + "\n"
+    assert_day(docs, reordered, date_str)
+    # Named range của bài thứ 3 cũ không còn sót lại
+    assert not [r for r in docs.ranges.values() if r[0] == paper_range_name(date_str, 3)]
+
+
+def test_manually_edited_document_falls_back_to_rewrite():
+    date_str = "2026-10-18"
+    docs = FakeDocs()
+    papers = [paper(1), paper(2)]
+    publish_day_to_gdoc(docs, DOC_ID, papers, date_str)
+    # Ai đó xóa named range của 1 bài trên tài liệu
+    docs.ranges = {k: v for k, v in docs.ranges.items() if v[0] != paper_range_name(date_str, 2)}
+
+    changed = [papers[0], dict(papers[1], innovative="Edited")]
+    publish_day_to_gdoc(docs, DOC_ID, changed, date_str)
+
+    assert docs.text == day_text(changed, date_str) + "\n"
+    assert_day(docs, changed, date_str)
+
+
+def test_legacy_day_without_named_ranges_is_replaced():
+    date_str = "2026-10-18"
+    old = [paper(1)]
+    docs = FakeDocs(day_text([paper(7)], "2026-10-17") + day_text(old, date_str) + "\n")
+
+    publish_day_to_gdoc(docs, DOC_ID, [paper(1), paper(2)], date_str)
+
+    assert docs.text == day_text([paper(7)], "2026-10-17") + day_text([paper(1), paper(2)], date_str) + "\n"
+    assert_day(docs, [paper(1), paper(2)], date_str)
+
+
+def test_new_day_is_appended_without_reading_the_body():
+    docs = FakeDocs("Giới thiệu\n")
+    publish_day_to_gdoc(docs, DOC_ID, [paper(1)], "2026-10-17")
+    docs.calls.clear()
+
+    publish_day_to_gdoc(docs, DOC_ID, [paper(2), paper(3)], "2026-10-18")
+
+    assert docs.calls == ["get", "batchUpdate"]
+    assert docs.text == "Giới thiệu" + day_text([paper(1)], "2026-10-17") + day_text([paper(2), paper(3)], "2026-10-18") + "\n"
+    assert docs.range_text(END_RANGE_NAME) == "\n"
+    assert_day(docs, [paper(2), paper(3)], "2026-10-18")
+
+
+def test_finalized_days_drop_their_named_ranges(monkeypatch):
+    docs = FakeDocs()
+    old_day = [paper(1), paper(2)]
+    publish_day_to_gdoc(docs, DOC_ID, old_day, "2026-10-15")
+    publish_day_to_gdoc(docs, DOC_ID, [paper(3)], "2026-10-16")
+
+    monkeypatch.setattr(gdoc_publisher, "open_days_cutoff", lambda: "2026-10-17")
+    publish_day_to_gdoc(docs, DOC_ID, [paper(4)], "2026-10-18")
+
+    # Chỉ còn named range của ngày chưa chốt + điểm cuối: lần đọc sau không lớn dần theo tài liệu
+    assert sorted({name for name, _, _ in docs.ranges.values()}) == sorted(
+        [END_RANGE_NAME, day_range_name("2026-10-18"), paper_range_name("2026-10-18", 1)]
+    )
+
+    # Ghi lại ngày đã chốt: tìm block bằng header, thay đúng chỗ
+    changed = [old_day[0], dict(old_day[1], innovative="Late edit")]
+    publish_day_to_gdoc(docs, DOC_ID, changed, "2026-10-15")
+
+    assert docs.text == (day_text(changed, "2026-10-15") + day_text([paper(3)], "2026-10-16")
+                         + day_text([paper(4)], "2026-10-18") + "\n")
+    assert docs.range_text(END_RANGE_NAME) == "\n"
@@ -0,0 +1,188 @@
+import time
+import asyncio
+
+import pytest
+
+import llm_executor
+from llm_executor import GeminiExecutor, RateBudget
+
+
+class RateLimitError(Exception):
+    code = 429
+
+    def __str__(self):
+        return "429 RESOURCE_EXHAUSTED {'retryDelay': '0.05s'}"
+
+
+class FakeResponse:
+    def __init__(self, text, tokens=0):
+        self.text = text
+
+        class Usage:
+            prompt_token_count = tokens
+            candidates_token_count = 0
+
+        self.usage_metadata = Usage()
+
+
+class FakeModels:
+    """
+    Thay cho client.aio.models: `delays[contents]` giây trước khi trả lời, `failures[contents]`
+    lỗi lần lượt ném ra trước khi thành công. Ghi lại thời điểm gọi và số request đang chạy.
+    """
+
+    def __init__(self, delays=None, failures=None, tokens=0):
+        self.delays = delays or {}
+        self.failures = {key: list(errors) for key, errors in (failures or {}).items()}
+        self.tokens = tokens
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def generate_content(self, model, contents, config=None):
+        self.calls.append((contents, time.monotonic()))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delays.get(contents, 0.01))
+            if self.failures.get(contents):
+                raise self.failures[contents].pop(0)
+            return FakeResponse(f"answer {contents}", self.tokens)
+        finally:
+            self.in_flight -= 1
+
+
+class FakeClient:
+    def __init__(self, models):
+        class Aio:
+            pass
+
+        self.aio = Aio()
+        self.aio.models = models
+
+
+@pytest.fixture(autouse=True)
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(llm_executor.random, "uniform", lambda a, b: 0)
+
+
+def requests_for(*contents, tokens=10):
+    return [{"id": i, "contents": text, "tokens": tokens} for i, text in enumerate(contents)]
+
+
+# ==============================
+# RateBudget
+# ==============================
+def test_rate_budget_waits_for_rpm_window():
+    budget = RateBudget(rpm=2, tpm=10_000, window=0.3)
+
+    async def acquire_three():
+        start = time.monotonic()
+        stamps = []
+        for _ in range(3):
+            await budget.acquire(1)
+            stamps.append(time.monotonic() - start)
+        return stamps
+
+    stamps = asyncio.run(acquire_three())
+    assert stamps[1] < 0.1
+    assert stamps[2] >= 0.25
+
+
+def test_rate_budget_waits_for_tpm_and_uses_settled_tokens():
+    budget = RateBudget(rpm=100, tpm=100, window=0.3)
+
+    async def scenario():
+        entry = await budget.acquire(90)
+        # Số token thật nhỏ hơn ước lượng → request sau được chạy ngay
+        budget.settle(entry, 20)
+        start = time.monotonic()
+        await budget.acquire(70)
+        quick = time.monotonic() - start
+        start = time.monotonic()
+        await budget.acquire(50)
+        return quick, time.monotonic() - start
+
+    quick, throttled = asyncio.run(scenario())
+    assert quick < 0.1
+    assert throttled >= 0.25
+
+
+def test_rate_budget_lets_oversized_request_run_when_window_is_empty():
+    budget = RateBudget(rpm=10, tpm=100, window=0.3)
+    start = time.monotonic()
+    asyncio.run(budget.acquire(500))
+    assert time.monotonic() - start < 0.1
+
+
+def test_executor_respects_rpm_budget():
+    models = FakeModels()
+    executor = GeminiExecutor(FakeClient(models), "model", rpm=2, tpm=10_000, max_concurrency=4)
+    executor.budget.window = 0.3
+
+    executor.run(requests_for("a", "b", "c"))
+
+    times = sorted(t for _, t in models.calls)
+    assert times[2] - times[0] >= 0.25
+
+
+# ==============================
+# GeminiExecutor
+# ==============================
+def test_results_keep_ids_and_arrive_in_completion_order():
+    models = FakeModels(delays={"slow": 0.2, "medium": 0.1, "fast": 0.01})
+    executor = GeminiExecutor(FakeClient(models), "model", rpm=100, max_concurrency=3)
+    order = []
+
+    results = executor.run(requests_for("slow", "medium", "fast"), lambda i, response, error: order.append(i))
+
+    assert order == [2, 1, 0]
+    assert {i: response.text for i, (response, error) in results.items()} == {
+        0: "answer slow", 1: "answer medium", 2: "answer fast"
+    }
+
+
+def test_concurrency_never_exceeds_limit():
+    models = FakeModels(delays={str(i): 0.05 for i in range(8)})
+    executor = GeminiExecutor(FakeClient(models), "model", rpm=100, max_concurrency=2)
+
+    executor.run(requests_for(*[str(i) for i in range(8)]))
+
+    assert models.max_in_flight == 2
+
+
+def test_rate_limited_request_is_retried_after_cooldown_and_halves_concurrency():
+    models = FakeModels(failures={"a": [RateLimitError(), RateLimitError()]})
+    executor = GeminiExecutor(FakeClient(models), "model", rpm=100, max_concurrency=4, backoff=0.05)
+
+    results = executor.run(requests_for("a"))
+
+    response, error = results[0]
+    assert error is None and response.text == "answer a"
+    calls = [t for contents, t in models.calls if contents == "a"]
+    assert len(calls) == 3
+    # retryDelay của server (0.05s) được tôn trọng giữa các lần thử
+    assert all(later - earlier >= 0.05 for earlier, later in zip(calls, calls[1:]))
+    # 4 → 2 → 1 sau 2 lần 429, rồi +1 sau lần thành công (AIMD)
+    assert executor.limit == 2
+
+
+def test_rate_limited_request_gives_up_after_max_retries():
+    models = FakeModels(failures={"a": [RateLimitError()] * 5})
+    executor = GeminiExecutor(FakeClient(models), "model", rpm=100, max_retries=2, backoff=0.01)
+
+    response, error = executor.run(requests_for("a"))[0]
+
+    assert response is None and isinstance(error, RateLimitError)
+    assert len(models.calls) == 3
+
+
+def test_other_errors_are_not_retried():
+    models = FakeModels(failures={"bad": [ValueError("invalid request")]})
+    executor = GeminiExecutor(FakeClient(models), "model", rpm=100)
+
+    results = executor.run(requests_for("bad", "good"))
+
+    assert isinstance(results[0][1], ValueError)
+    assert results[1][0].text == "answer good"
+    assert [contents for contents, _ in models.calls].count("bad") == 1
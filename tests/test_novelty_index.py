@@ -0,0 +1,41 @@
+import os
+import threading
+
+import numpy as np
+
+from novelty_index import NoveltyIndex, NOVELTY_META_FILE, text_vectors, paper_text
+
+
+def papers(prefix, n):
+    return [{"title": f"{prefix} eddy current paper {i}", "abstract": f"{prefix} sensor {i} thickness",
+             "doi": f"10.1/{prefix}{i}"} for i in range(n)]
+
+
+def test_parallel_adds_keep_vectors_aligned_with_keys(tmp_path):
+    index = NoveltyIndex(str(tmp_path), dim=64)
+    errors = []
+
+    def add(prefix):
+        try:
+            for i in range(20):
+                index.add(papers(f"{prefix}{i}-", 3))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=add, args=(name,)) for name in "abcd"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(index) == 4 * 20 * 3
+    assert os.path.getsize(index.vectors_path) == len(index) * 64 * 4
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".tmp")] == []
+    # Mỗi dòng vector đúng là của bài có key ở cùng vị trí
+    reloaded = NoveltyIndex(str(tmp_path), dim=64)
+    assert reloaded.keys == index.keys
+    by_key = {p["doi"]: p for name in "abcd" for i in range(20) for p in papers(f"{name}{i}-", 3)}
+    expected = text_vectors([paper_text(by_key[key]) for key in reloaded.keys], 64)
+    assert np.allclose(np.asarray(reloaded._matrix(len(reloaded))), expected)
+    assert os.path.exists(tmp_path / NOVELTY_META_FILE)
@@ -0,0 +1,180 @@
+import os
+import re
+import glob
+import json
+import threading
+from datetime import datetime
+from run_report import RUN_REPORT, report_add, report_set
+from llm_executor import estimate_tokens, RESPONSE_TOKEN_ALLOWANCE
+
+
+DATABASE_DIR = "database"
+COST_REPORT_DIR = "cost_reports"
+# Chỉ giữ N báo cáo chi phí gần nhất (database/ được commit sau mỗi lần chạy định kỳ)
+COST_REPORT_KEEP = int(os.getenv("COST_REPORT_KEEP", "30"))
+
+# Số token tối đa của 1 abstract đưa vào prompt (phần thừa bị cắt ở cuối câu gần nhất)
+ABSTRACT_TOKEN_CAP = int(os.getenv("ABSTRACT_TOKEN_CAP", "600"))
+# Ngân sách token cho cả lần chạy (input + output, 0 = không giới hạn)
+LLM_TOKEN_BUDGET = int(os.getenv("LLM_TOKEN_BUDGET", "0"))
+# Giá Gemini (USD / 1 triệu token), Batch API được giảm giá theo BATCH_DISCOUNT
+GEMINI_PRICE_INPUT = float(os.getenv("GEMINI_PRICE_INPUT", "0.30"))
+GEMINI_PRICE_OUTPUT = float(os.getenv("GEMINI_PRICE_OUTPUT", "2.50"))
+BATCH_DISCOUNT = 0.5
+
+
+class TokenBudgetExceeded(Exception):
+    """Request bị bỏ qua vì vượt LLM_TOKEN_BUDGET của lần chạy."""
+
+
+# ==============================
+# Làm sạch & cắt abstract trước khi đưa vào prompt
+# ==============================
+MARKDOWN_NOISE = [
+    (re.compile(r"!\[[^\]]*\]\([^)]*\)"), " "),            # ảnh markdown
+    (re.compile(r"\[([^\]]*)\]\([^)]*\)"), r"\1"),         # link markdown → chỉ giữ chữ
+    (re.compile(r"<[^>]+>"), " "),                         # thẻ HTML còn sót
+    (re.compile(r"https?://\S+"), " "),                    # URL trần
+    (re.compile(r"^\s*#+\s*", re.MULTILINE), ""),          # tiêu đề markdown
+    (re.compile(r"\[\d+(?:[,–-]\s*\d+)*\]"), ""),          # trích dẫn [1], [2-4]
+    (re.compile(r"\*{1,3}|_{2,3}|`+"), ""),                # in đậm/nghiêng, code
+    (re.compile(r"^\s*>\s?", re.MULTILINE), ""),           # blockquote
+    (re.compile(r"^\s*(?:abstract|tóm tắt)\s*[:.\-]?\s*", re.IGNORECASE), ""),
+]
+
+
+def clean_abstract(text):
+    """Bỏ nhiễu markdown/HTML (thường gặp ở abstract lấy bằng Firecrawl) và khoảng trắng thừa."""
+    text = (text or "").strip()
+    for pattern, replacement in MARKDOWN_NOISE:
+        text = pattern.sub(replacement, text)
+    text = re.sub(r"\s+", " ", text)
+    return re.sub(r"\s+([,.;:])", r"\1", text).strip()
+
+
+def trim_to_token_cap(text, cap=ABSTRACT_TOKEN_CAP):
+    """Cắt văn bản về tối đa `cap` token (ước lượng), ưu tiên cắt ở cuối câu."""
+    if not cap or estimate_tokens(text) <= cap:
+        return text
+    cut = text[:cap * 4]
+    sentence_end = cut.rfind(". ")
+    if sentence_end > len(cut) // 2:
+        cut = cut[:sentence_end + 1]
+    return cut.rstrip()
+
+
+def prepare_abstract(text, cap=ABSTRACT_TOKEN_CAP):
+    """Làm sạch rồi cắt abstract; ghi lại số token tiết kiệm được vào báo cáo."""
+    prepared = trim_to_token_cap(clean_abstract(text), cap)
+    saved = estimate_tokens(text) - estimate_tokens(prepared)
+    if saved > 0:
+        report_add("llm_cost", "abstract_tokens_trimmed", saved)
+    return prepared
+
+
+# ==============================
+# Ngân sách token của lần chạy
+# ==============================
+class TokenBudget:
+    """
+    Giữ chỗ token ước lượng trước khi gửi; khi có usage_metadata thì thay bằng số thật.
+    limit = 0: không giới hạn (chỉ đếm).
+    """
+
+    def __init__(self, limit=LLM_TOKEN_BUDGET):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def try_reserve(self, tokens):
+        with self._lock:
+            if self.limit and self.used + tokens > self.limit:
+                return False
+            self.used += tokens
+            return True
+
+    def settle(self, reserved, actual):
+        with self._lock:
+            self.used += actual - reserved
+
+    def reset(self):
+        """Bắt đầu lần chạy mới (daemon chạy nhiều lần trong 1 process)."""
+        with self._lock:
+            self.used = 0
+
+
+run_budget = TokenBudget()
+
+
+def request_tokens(request):
+    """Số token ước lượng của 1 request (prompt + phần trả lời dự phòng)."""
+    return request.get("tokens") or estimate_tokens(request["contents"]) + RESPONSE_TOKEN_ALLOWANCE
+
+
+# ==============================
+# Ghi nhận token & chi phí theo từng bước
+# ==============================
+def usage_tokens(response):
+    """(input, output) token của 1 response; output gồm cả thinking token (được tính phí như output)."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return 0, 0
+    output = (getattr(usage, "candidates_token_count", 0) or 0) + (getattr(usage, "thoughts_token_count", 0) or 0)
+    return getattr(usage, "prompt_token_count", 0) or 0, output
+
+
+def record_usage(stage, response, batch=False):
+    """
+    Cộng token input/output và chi phí ước tính của 1 lời gọi vào báo cáo
+    (section "llm_cost.<stage>" và tổng "llm_cost").
+
+    Returns:
+        int: Tổng token của lời gọi.
+    """
+    input_tokens, output_tokens = usage_tokens(response)
+    cost = (input_tokens * GEMINI_PRICE_INPUT + output_tokens * GEMINI_PRICE_OUTPUT) / 1e6
+    if batch:
+        cost *= BATCH_DISCOUNT
+    for section in (f"llm_cost.{stage}", "llm_cost"):
+        report_add(section, "calls")
+        report_add(section, "input_tokens", input_tokens)
+        report_add(section, "output_tokens", output_tokens)
+        report_add(section, "cost_usd", cost)
+    return input_tokens + output_tokens
+
+
+def write_cost_report(db_dir=DATABASE_DIR):
+    """Ghi báo cáo token/chi phí theo từng bước của lần chạy ra database/cost_reports/<thời điểm>.json."""
+    stages = {
+        section.split(".", 1)[1]: dict(stats)
+        for section, stats in RUN_REPORT.items() if section.startswith("llm_cost.")
+    }
+    if not stages:
+        return None
+    for stats in stages.values():
+        stats["cost_usd"] = round(stats["cost_usd"], 6)
+    total = dict(RUN_REPORT.get("llm_cost", {}))
+    total["cost_usd"] = round(total.get("cost_usd", 0), 6)
+    report_set("llm_cost", "cost_usd", total["cost_usd"])
+
+    os.makedirs(os.path.join(db_dir, COST_REPORT_DIR), exist_ok=True)
+    path = os.path.join(db_dir, COST_REPORT_DIR, f"{datetime.now().strftime('%Y-%m-%d_%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({
+            "token_budget": run_budget.limit or None,
+            "total": total,
+            "stages": stages,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"💰 Chi phí LLM ước tính: ${total['cost_usd']:.4f} "
+          f"({total.get('input_tokens', 0)} input + {total.get('output_tokens', 0)} output token) → {path}")
+    prune_cost_reports(db_dir=db_dir)
+    return path
+
+
+def prune_cost_reports(keep=COST_REPORT_KEEP, db_dir=DATABASE_DIR):
+    """Xóa các báo cáo chi phí cũ, chỉ giữ `keep` file mới nhất (tên file theo thời điểm nên sắp xếp được)."""
+    paths = sorted(glob.glob(os.path.join(db_dir, COST_REPORT_DIR, "*.json")))
+    stale = paths[:-keep] if keep > 0 else []
+    for path in stale:
+        os.remove(path)
+    return len(stale)
@@ -0,0 +1,135 @@
+import os
+import json
+import copy
+import threading
+from concurrent.futures import Future
+from search_api import search_openalex, search_arxiv, search_crossref, search_semantic_scholar
+from scholar_search import run_scholar_search, ScholarBrowserPool
+from run_report import report_add
+from sinks import PUBLISH_SINKS
+
+
+TOPICS_FILE = os.getenv("TOPICS_FILE", "topics.json")
+# Số chủ đề chạy song song (mọi chủ đề dùng chung HTTP pool, cache, rate limiter Gemini và pool Chrome)
+TOPIC_CONCURRENCY = int(os.getenv("TOPIC_CONCURRENCY", "2"))
+
+# Chủ đề mặc định khi không có file cấu hình (giống run.py trước đây)
+DEFAULT_TOPIC = {
+    "name": "pec",
+    "keywords": ["Pulsed Eddy Current (PEC)"],
+    "sources": ["openalex", "arxiv", "crossref", "scholar"],
+    "max_results": 30,
+    "top_n": 10,
+}
+
+# Nguồn tìm kiếm: fn(query, rows, scholar_pool) → list bài báo
+SOURCES = {
+    "openalex": lambda query, rows, pool: search_openalex(query=query, rows=rows),
+    "arxiv": lambda query, rows, pool: search_arxiv(query=query, rows=rows),
+    "crossref": lambda query, rows, pool: search_crossref(query=query, rows=rows),
+    "semantic_scholar": lambda query, rows, pool: search_semantic_scholar(query=query, rows=rows),
+    "scholar": lambda query, rows, pool: run_scholar_search(query, rows, pool=pool),
+}
+
+
+# ==============================
+# Đọc cấu hình chủ đề
+# ==============================
+def normalize_topic(raw):
+    """Điền giá trị mặc định và kiểm tra 1 chủ đề trong file cấu hình."""
+    topic = {**DEFAULT_TOPIC, "sinks": None, "synonyms": None, **raw}
+    if isinstance(topic["keywords"], str):
+        topic["keywords"] = [topic["keywords"]]
+    if not topic["keywords"]:
+        raise ValueError(f"Chủ đề '{topic['name']}' không có keywords")
+    # Từ đồng nghĩa/viết tắt cho pre-rank BM25; không khai báo → prerank.TOPIC_SYNONYMS
+    if isinstance(topic["synonyms"], str):
+        topic["synonyms"] = [topic["synonyms"]]
+    if topic["synonyms"] is not None and (
+        not isinstance(topic["synonyms"], list)
+        or not all(isinstance(s, str) and s.strip() for s in topic["synonyms"])
+    ):
+        raise ValueError(f"Chủ đề '{topic['name']}': \"synonyms\" phải là danh sách chuỗi không rỗng")
+    unknown = set(topic["sources"]) - set(SOURCES)
+    if unknown:
+        raise ValueError(f"Chủ đề '{topic['name']}': nguồn không hỗ trợ {', '.join(sorted(unknown))}")
+    # Tên file kết quả giữ như cũ: <ngày>_allapi_scholar_<keyword đầu tiên>.json
+    topic.setdefault("prefix", f"allapi_scholar_{topic['keywords'][0].replace(' ', '_')}")
+    return topic
+
+
+def load_topics(path=TOPICS_FILE):
+    """
+    Danh sách chủ đề từ file JSON {"topics": [{name, keywords, synonyms, sources, max_results, top_n,
+    sinks, document_id, spreadsheet_id}, ...]}; không có file thì dùng DEFAULT_TOPIC.
+    """
+    if not os.path.exists(path):
+        return [normalize_topic({})]
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    topics = [normalize_topic(raw) for raw in config.get("topics", [])]
+    names = [topic["name"] for topic in topics]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Tên chủ đề bị trùng trong {path}")
+    prefixes = [topic["prefix"] for topic in topics]
+    if len(set(prefixes)) != len(prefixes):
+        raise ValueError(f"Các chủ đề có cùng keyword đầu tiên cần \"prefix\" riêng cho file kết quả ({path})")
+    # Mỗi ngày chỉ có 1 vùng trên 1 tài liệu/sheet → các chủ đề không được ghi chung đích
+    for sink, field in (("gdoc", "document_id"), ("gsheet", "spreadsheet_id")):
+        targets = [topic.get(field) for topic in topics if sink in (topic["sinks"] or PUBLISH_SINKS)]
+        if len(set(targets)) != len(targets):
+            raise ValueError(f"Mỗi chủ đề publish lên {sink} cần {field} riêng ({path})")
+    return topics
+
+
+# ==============================
+# Tìm kiếm dùng chung giữa các chủ đề
+# ==============================
+class SharedSearch:
+    """
+    Mỗi (nguồn, query) chỉ được gọi 1 lần cho cả lần chạy, với số kết quả lớn nhất mà các chủ đề
+    cần; chủ đề nào dùng cùng query thì nhận bản sao (đã cắt theo max_results của mình).
+    Chủ đề gọi sau khi query đang chạy thì đợi kết quả của lần gọi đó.
+    """
+
+    def __init__(self, topics, scholar_pool=None):
+        self.rows = {}
+        for topic in topics:
+            for source in topic["sources"]:
+                for query in topic["keywords"]:
+                    key = (source, query)
+                    self.rows[key] = max(self.rows.get(key, 0), topic["max_results"])
+        # Pool truyền từ ngoài (daemon) được giữ lại giữa các lần chạy, chỉ đóng pool tự tạo
+        self._owns_pool = scholar_pool is None
+        self.scholar_pool = ScholarBrowserPool() if self._owns_pool else scholar_pool
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, source, query, rows):
+        key = (source, query)
+        with self._lock:
+            future = self._futures.get(key)
+            owner = future is None
+            if owner:
+                future = self._futures[key] = Future()
+        if owner:
+            try:
+                future.set_result(SOURCES[source](query, self.rows.get(key, rows), self.scholar_pool))
+                report_add("search", "queries")
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            report_add("search", "queries_shared")
+        return copy.deepcopy(future.result()[:rows])
+
+    def sources_for(self, topic):
+        """{tên: hàm không tham số} cho pipeline/collect của 1 chủ đề."""
+        return {
+            f"{source}:{query}": (lambda source=source, query=query: self.fetch(source, query, topic["max_results"]))
+            for source in topic["sources"]
+            for query in topic["keywords"]
+        }
+
+    def close(self):
+        if self._owns_pool:
+            self.scholar_pool.close()
@@ -0,0 +1,81 @@
+import os
+import heapq
+from run_report import report_add
+
+
+MAX_SCORE = 10
+# Điểm từ ngưỡng này trở lên coi là "đủ tốt": đã có top_n bài như vậy thì ngừng gọi LLM (0 = tắt dừng sớm)
+TOPN_SCORE_THRESHOLD = int(os.getenv("TOPN_SCORE_THRESHOLD", "8"))
+
+
+class TopNSelector:
+    """
+    Heap kích thước top_n nhận kết quả chấm điểm theo từng đợt, theo thứ tự ưu tiên của bài.
+
+    Heap xếp theo (điểm thật, ưu tiên): bằng điểm thì bài đến trước thắng, bài điểm cao hơn
+    luôn thay được bài thấp nhất. `threshold` chỉ dùng để dừng sớm: heap đã đủ top_n bài và
+    bài thấp nhất đạt ≥ threshold (`saturated`) → coi là đủ tốt, ngừng chấm các bài phía sau.
+    threshold = 0: chỉ dừng khi cả heap đạt MAX_SCORE.
+    """
+
+    def __init__(self, top_n, threshold=TOPN_SCORE_THRESHOLD):
+        self.top_n = top_n
+        self.threshold = threshold or MAX_SCORE
+        self.heap = []
+        self.papers = []
+
+    @property
+    def saturated(self):
+        return len(self.heap) >= self.top_n and self.heap[0][0] >= self.threshold
+
+    def offer(self, papers, evaluations, on_rejected=None):
+        """Đưa 1 đợt (bài, kết quả {"related", "score", ...}) vào heap."""
+        for paper, evaluation in zip(papers, evaluations):
+            index = len(self.papers)
+            self.papers.append(paper)
+            if not evaluation["related"]:
+                if on_rejected:
+                    on_rejected(paper)
+                continue
+            entry = (evaluation["score"], -index, index, evaluation)
+            if len(self.heap) < self.top_n:
+                heapq.heappush(self.heap, entry)
+            elif entry[:2] > self.heap[0][:2]:
+                heapq.heapreplace(self.heap, entry)
+
+    def selected(self):
+        """Tối đa top_n cặp (bài báo, kết quả), sắp theo score giảm dần (bằng điểm thì theo ưu tiên)."""
+        selected = sorted(self.heap, key=lambda entry: entry[2])
+        selected.sort(key=lambda entry: entry[3]["score"], reverse=True)
+        return [(self.papers[index], evaluation) for _, _, index, evaluation in selected]
+
+
+def report_skipped(selector, skipped):
+    report_add("topn", "evaluated", len(selector.papers))
+    report_add("topn", "evaluations_skipped", skipped)
+    if skipped:
+        print(f"⏹️ Đã đủ {selector.top_n} bài đạt ≥ {selector.threshold} điểm, bỏ qua {skipped} bài chưa chấm")
+
+
+def select_top_n(candidates, evaluate, top_n, threshold=TOPN_SCORE_THRESHOLD, wave_size=20, on_rejected=None):
+    """
+    Chọn top_n bài theo điểm LLM, chấm lần lượt từng đợt (wave) theo thứ tự ưu tiên của
+    `candidates`; dừng khi TopNSelector đã bão hòa.
+
+    Parameters:
+        candidates (list): Bài báo đã sắp theo thứ tự ưu tiên giảm dần.
+        evaluate (callable): evaluate(list bài) → list kết quả {"related", "score", ...} cùng thứ tự.
+        on_rejected (callable): Gọi với từng bài không liên quan.
+
+    Returns:
+        list: Tối đa top_n cặp (bài báo, kết quả), sắp theo score giảm dần (bằng điểm thì theo ưu tiên).
+    """
+    selector = TopNSelector(top_n, threshold)
+    for start in range(0, len(candidates), max(1, wave_size)):
+        if selector.saturated:
+            break
+        wave = candidates[start:start + wave_size]
+        selector.offer(wave, evaluate(wave), on_rejected)
+
+    report_skipped(selector, len(candidates) - len(selector.papers))
+    return selector.selected()
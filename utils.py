@@ -1,32 +1,95 @@
 import os
 import glob
 import json
-import time
-import requests
 import re
-from dateutil import parser
+import threading
 from datetime import datetime, timedelta
-import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
-from gspread_formatting import (
-    CellFormat, Color, TextFormat, format_cell_range, set_column_width
-)
-from googleapiclient.discovery import build
 from dotenv import load_dotenv
-from google.genai import Client
-from google.genai.types import GenerateContentConfig
+from paper_schema import normalize_key, canonicalize_url
+from search_index import index_papers, normalize_date
+from enrichment import (
+    EnrichmentExecutor, plan_enrichment, apply_enrichment, firecrawl_values,
+    run_enrichment_cascade, mark_satisfied
+)
+from cache_store import PersistentCache
+from run_report import report_add, report_set, report_timer
+from prerank import prerank_papers, PRERANK_TOP_K
+from novelty_index import add_to_novelty_index, score_novelty, strip_novelty_fields, NOVELTY_ENABLED
+from topn_selector import select_top_n, TopNSelector, report_skipped, TOPN_SCORE_THRESHOLD
+from llm_executor import GEMINI_CONCURRENCY
+from llm_executor import GeminiExecutor, estimate_tokens, response_tokens
+from gemini_batch import run_batch_job
+from token_budget import prepare_abstract, run_budget, request_tokens, record_usage, TokenBudgetExceeded
+from llm_cache import llm_cache_key, get_cached_llm_result, store_llm_result, save_llm_cache
+from gdoc_publisher import publish_day_to_gdoc
+from gsheet_publisher import publish_day_to_gsheet
+from sinks import register_sink
+from firecrawl_api import (
+    FIRECRAWL_TIMEOUT, fetch_abstract_and_pubdate_firecrawl, batch_fetch_abstract_and_pubdate_firecrawl
+)
 load_dotenv()
-FIRECRAWL_API_KEY = os.getenv("FIRECRAWL_API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-
-client = Client(api_key=GOOGLE_API_KEY)
+FIRECRAWL_CONCURRENCY = int(os.getenv("FIRECRAWL_CONCURRENCY", "4"))
+# "auto": dùng batch scrape khi số URL >= FIRECRAWL_BATCH_MIN, "batch": luôn batch, "scrape": từng URL
+FIRECRAWL_MODE = os.getenv("FIRECRAWL_MODE", "auto")
+FIRECRAWL_BATCH_MIN = int(os.getenv("FIRECRAWL_BATCH_MIN", "5"))
+# Tra OpenAlex/arXiv theo DOI, arXiv id, tiêu đề trước khi dùng Firecrawl
+ENRICH_CHEAP_FIRST = os.getenv("ENRICH_CHEAP_FIRST", "1") != "0"
+GEMINI_MODEL = "gemini-2.5-flash"
+# Chấm điểm theo lô: số abstract tối đa và ngân sách token (ước lượng) cho mỗi request
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "10"))
+LLM_BATCH_TOKEN_BUDGET = int(os.getenv("LLM_BATCH_TOKEN_BUDGET", "6000"))
+# "combined": chấm điểm + điểm sáng tạo trong cùng 1 request; "separate": 2 lượt riêng như trước
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "combined")
+# combined: chỉ bài đạt từ điểm này mới được viết điểm sáng tạo ngay (thường là các bài vào top-N);
+# bài thấp hơn mà vẫn lọt top-N được innovative_filtered_papers bổ sung sau bằng 1 request riêng.
+# 0 = mọi bài liên quan (tốn token output cho cả những bài sẽ bị loại)
+ANALYSIS_MIN_SCORE = int(os.getenv("ANALYSIS_MIN_SCORE", str(TOPN_SCORE_THRESHOLD)))
+# Nhiệt độ khi chấm điểm: giữ 0 để điểm ổn định và cache key luôn cùng nghĩa
+SCORING_TEMPERATURE = 0
+LLM_ANALYSIS_BATCH_SIZE = int(os.getenv("LLM_ANALYSIS_BATCH_SIZE", "5"))
+# "batch": gom prompt vào 1 Gemini batch job (chạy định kỳ, không cần trả lời ngay); "online": gọi trực tiếp
+LLM_OFFLINE = os.getenv("LLM_MODE", "online") == "batch"
+
+# pandas, googleapiclient và google.genai chỉ được import khi dùng tới (import google.genai
+# mất vài trăm ms): test.py, app.py và các lệnh chỉ publish không phải trả chi phí này.
+# Đo bằng: python bench_imports.py
+_gemini_client = None
+_gemini_executor = None
+_gemini_lock = threading.Lock()
+
+
+def get_gemini_client():
+    """Client Gemini dùng chung, tạo ở lần gọi đầu tiên."""
+    global _gemini_client
+    with _gemini_lock:
+        if _gemini_client is None:
+            from google.genai import Client
+            _gemini_client = Client(api_key=GOOGLE_API_KEY)
+        return _gemini_client
+
+
+def get_gemini_executor():
+    """Mọi lời gọi Gemini đi qua executor bất đồng bộ (giới hạn RPM/TPM, tự giảm tải khi gặp 429)."""
+    global _gemini_executor
+    client = get_gemini_client()
+    with _gemini_lock:
+        if _gemini_executor is None:
+            _gemini_executor = GeminiExecutor(client, GEMINI_MODEL)
+        return _gemini_executor
+
+
+def generate_config(**kwargs):
+    """GenerateContentConfig cho 1 request Gemini."""
+    from google.genai.types import GenerateContentConfig
+    return GenerateContentConfig(**kwargs)
 
 
 
 RESULTS_DIR = "results"
 DATABASE_DIR = "database"
 DATABASE_FILE = "papers_db.json"
+FIRECRAWL_CACHE_FILE = "firecrawl_cache.json"
 SPREADSHEET_ID = "1snMFj6e4X3YUK_48xXJlb8VhLwcS4vSxb69LgoBcDO4"
 DOCUMENT_ID = "19S3OprOCXXxmo8FjkivBtz_t2t5isenYg-AVqqzA2-U"
 creds_path = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
@@ -36,6 +99,8 @@ def get_creds():
     scopes = ["https://www.googleapis.com/auth/spreadsheets",
               "https://www.googleapis.com/auth/documents"]
 
+    from google.oauth2.service_account import Credentials
+
     # Dành cho GitHub Actions
     creds_path = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
     if creds_path and os.path.exists(creds_path):
@@ -48,33 +113,16 @@ def get_creds():
 
     raise FileNotFoundError("❌ Không tìm thấy file Google credential nào hợp lệ.")
 
-def normalize_key(paper):
-    """
-    Chuẩn hóa key để so sánh trùng lặp:
-    - Ưu tiên DOI (lowercase, bỏ khoảng trắng).
-    - Nếu không có DOI → dùng link.
-    - Nếu không có link → dùng title.
-    """
-    doi = (paper.get("doi") or "").strip().lower()
-    link = (paper.get("link") or "").strip().lower()
-    title = (paper.get("title") or "").strip().lower()
-
-    if doi:
-        return doi
-    elif link:
-        return link
-    elif title:
-        return title
-    return ""
-
 # ==============================
 # Lấy file JSON mới nhất
 # ==============================
-def get_latest_json():
+def get_latest_json(prefix=None):
     """
     Lấy file JSON mới nhất theo ngày có dạng: YYYY-MM-DD_allapi_scholar_ndt.json
+    prefix: chỉ xét file của 1 chủ đề (YYYY-MM-DD_<prefix>.json).
     """
-    pattern = os.path.join(RESULTS_DIR, "*_allapi_scholar_*.json")
+    name = f"*_{glob.escape(prefix)}.json" if prefix else "*_allapi_scholar_*.json"
+    pattern = os.path.join(RESULTS_DIR, name)
     json_files = glob.glob(pattern)
 
     if not json_files:
@@ -135,9 +183,9 @@ def save_results_to_json(data, output_dir=RESULTS_DIR, prefix="allapi_scholar_nd
         filename = f"{timestamp}_{prefix}.json"
         existing_file = os.path.join(output_dir, filename)
 
-    # Merge dữ liệu (lọc trùng theo key chuẩn hóa)
+    # Merge dữ liệu (lọc trùng theo key chuẩn hóa); field novelty chỉ dùng nội bộ, không lưu
     existing_keys = {normalize_key(item) for item in merged_data if normalize_key(item)}
-    new_filtered = [p for p in data if normalize_key(p) not in existing_keys]
+    new_filtered = [strip_novelty_fields(p) for p in data if normalize_key(p) not in existing_keys]
 
     if not new_filtered:
         print("⏩ Không có dữ liệu mới để thêm.")
@@ -149,15 +197,29 @@ def save_results_to_json(data, output_dir=RESULTS_DIR, prefix="allapi_scholar_nd
         with open(existing_file, "w", encoding="utf-8") as f:
             json.dump(merged_data, f, ensure_ascii=False, indent=2)
         print(f"💾 Đã cập nhật file: {existing_file} (thêm {len(new_filtered)} bài báo)")
-        return existing_file
     except Exception as e:
         print(f"❌ Lỗi khi lưu file JSON: {e}")
         return None
 
+    # Cập nhật index full-text (chỉ các bài mới), lỗi index không làm hỏng file kết quả
+    try:
+        indexed = index_papers(new_filtered, saved_date=os.path.basename(existing_file).split("_")[0])
+        print(f"🔎 Đã index {indexed} bài báo mới")
+    except Exception as e:
+        print(f"⚠️ Lỗi khi cập nhật index tìm kiếm: {e}")
+    try:
+        add_to_novelty_index(new_filtered)
+    except Exception as e:
+        print(f"⚠️ Lỗi khi cập nhật novelty index: {e}")
+    return existing_file
+
 
 # ==============================
 # Load Database DOI
 # ==============================
+_database_lock = threading.Lock()
+
+
 def load_database(db_dir=DATABASE_DIR, db_file=DATABASE_FILE):
     os.makedirs(db_dir, exist_ok=True)
     db_path = os.path.join(db_dir, db_file)
@@ -203,20 +265,22 @@ def save_results_to_database(result_file, db_dir=DATABASE_DIR, db_file=DATABASE_
         print(f"❌ Lỗi khi đọc file kết quả {result_file}: {e}")
         return False
 
-    db_data = load_database(db_dir, db_file)
-    db_dict = {normalize_key(item): item for item in db_data if normalize_key(item)}
-
-    new_count = 0
-    for paper in results:
-        key = normalize_key(paper)
-        if key and key not in db_dict:
-            db_dict[key] = {
-                "title": paper.get("title", "Untitled"),
-                "doi": paper.get("doi", paper.get("link", ""))
-            }
-            new_count += 1
-
-    save_database(list(db_dict.values()), db_dir, db_file)
+    # Các chủ đề publish song song: đọc-sửa-ghi papers_db.json từng chủ đề một để không mất cập nhật
+    with _database_lock:
+        db_data = load_database(db_dir, db_file)
+        db_dict = {normalize_key(item): item for item in db_data if normalize_key(item)}
+
+        new_count = 0
+        for paper in results:
+            key = normalize_key(paper)
+            if key and key not in db_dict:
+                db_dict[key] = {
+                    "title": paper.get("title", "Untitled"),
+                    "doi": paper.get("doi", paper.get("link", ""))
+                }
+                new_count += 1
+
+        save_database(list(db_dict.values()), db_dir, db_file)
     print(f"✅ Đã thêm {new_count} bài báo mới vào database từ {result_file}")
     return True
 
@@ -225,447 +289,197 @@ def save_results_to_database(result_file, db_dir=DATABASE_DIR, db_file=DATABASE_
 # ==============================
 # Lọc bài báo trùng 
 # ==============================
-def filter_duplicates(new_results, results_dir=RESULTS_DIR, db_dir=DATABASE_DIR, db_file=DATABASE_FILE):
+def history_keys(results_dir=RESULTS_DIR, db_dir=DATABASE_DIR, db_file=DATABASE_FILE, prefix=None):
     """
-    Lọc trùng các bài báo mới bằng key chuẩn hóa (doi/link/title).
-    - Nếu file mới nhất là hôm nay → không lọc.
+    Tập key chuẩn hóa (doi/link/title) dùng để lọc trùng bài mới:
+    - Nếu file mới nhất là hôm nay → không lọc (None).
     - Nếu file mới nhất là hôm qua → lọc theo hôm qua.
     - Nếu không phải hôm nay và không phải hôm qua → lọc theo database.
     """
     today_str = datetime.now().strftime("%Y-%m-%d")
     yesterday_str = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
 
-    # 🔹 Lấy file JSON mới nhất
-    latest_file = get_latest_json()
+    # 🔹 Lấy file JSON mới nhất (của chủ đề nếu có prefix)
+    latest_file = get_latest_json(prefix)
     if not latest_file:
-        return new_results
+        return None
 
-    # 🔹 Đọc dữ liệu file mới nhất
+    # 🔹 Đọc dữ liệu file mới nhất (chỉ parse lại khi file đã đổi)
     try:
-        with open(latest_file, "r", encoding="utf-8") as f:
-            old_results = json.load(f)
+        latest_keys, old_dates = _file_keys(latest_file)
     except Exception as e:
         print(f"❌ Lỗi khi đọc file {latest_file}: {e}")
-        return new_results
-
-    old_dates = {paper.get("pub_date", "") for paper in old_results}
+        return None
 
     # ✅ File hôm nay → không lọc
     if today_str in old_dates:
         print("⏩ File mới nhất đã là hôm nay -> Không lọc trùng.")
-        return new_results
+        return None
 
     # ✅ Không phải hôm nay → lọc
     # Nếu là hôm qua → lọc theo hôm qua
     if yesterday_str in old_dates:
-        old_keys = {normalize_key(p) for p in old_results if normalize_key(p)}
-        filtered_results = [p for p in new_results if normalize_key(p) not in old_keys]
-        removed_count = len(new_results) - len(filtered_results)
-        print(f"🗑️ Đã loại bỏ {removed_count} bài báo trùng với hôm qua.")
-        return filtered_results
+        return set(latest_keys)
 
     # ✅ Không phải hôm qua → lọc theo database
     db_path = os.path.join(db_dir, db_file)
     if not os.path.exists(db_path):
         print("⚠️ Không tìm thấy database -> Trả về toàn bộ dữ liệu mới.")
-        return new_results
+        return None
 
     try:
-        with open(db_path, "r", encoding="utf-8") as f:
-            db_data = json.load(f)
-            db_keys = {normalize_key(item) for item in db_data if normalize_key(item)}
+        return set(_file_keys(db_path)[0])
     except Exception as e:
         print(f"❌ Lỗi khi đọc database {db_path}: {e}")
-        return new_results
-
-    filtered_results = [p for p in new_results if normalize_key(p) not in db_keys]
-    removed_count = len(new_results) - len(filtered_results)
-    print(f"🗑️ Đã loại bỏ {removed_count} bài báo trùng với database.")
-    return filtered_results
-
-
-def tidy_up_sheet_auto(spreadsheet_id, sheet_name=None):
-    # 1. Kết nối Google Sheets API
-    creds = get_creds()
-    service = build("sheets", "v4", credentials=creds)
-
-    # 2. Lấy metadata sheet
-    sheet_metadata = service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
-    sheets = sheet_metadata.get("sheets", [])
-
-    if not sheets:
-        print("⚠️ File Google Sheets trống, không có sheet nào.")
-        return
-
-    # 3. Xác định sheet_id
-    sheet_id = None
-    if sheet_name:
-        for s in sheets:
-            if s["properties"]["title"] == sheet_name:
-                sheet_id = s["properties"]["sheetId"]
-                break
-    if not sheet_id:
-        sheet_id = sheets[0]["properties"]["sheetId"]
-        sheet_name = sheets[0]["properties"]["title"]
-        print(f"⚠️ Không tìm thấy sheet bạn chỉ định. Sử dụng sheet đầu tiên: '{sheet_name}'")
-
-    # 4. Lấy dữ liệu hiện tại để xác định số hàng và cột
-    result = service.spreadsheets().values().get(
-        spreadsheetId=spreadsheet_id, range=sheet_name
-    ).execute()
-    values = result.get("values", [])
-    num_rows = len(values) if values else 1
-    num_cols = max(len(row) for row in values) if values else 1
-
-    # 5. Tính chiều rộng cột dựa trên nội dung
-    column_widths = [0] * num_cols
-    for row in values:
-        for col_index in range(num_cols):
-            cell_value = row[col_index] if col_index < len(row) else ""
-            column_widths[col_index] = max(column_widths[col_index], len(str(cell_value)))
-
-    # 6. Tạo danh sách requests
-    requests = [
-        # Căn giữa header
-        {
-            "repeatCell": {
-                "range": {
-                    "sheetId": sheet_id,
-                    "startRowIndex": 0,
-                    "endRowIndex": 1
-                },
-                "cell": {
-                    "userEnteredFormat": {
-                        "horizontalAlignment": "CENTER",
-                        "textFormat": {"bold": True}
-                    }
-                },
-                "fields": "userEnteredFormat(textFormat,horizontalAlignment)"
-            }
-        },
-        # Bật wrap text toàn sheet
-        {
-            "repeatCell": {
-                "range": {"sheetId": sheet_id},
-                "cell": {"userEnteredFormat": {"wrapStrategy": "WRAP"}},
-                "fields": "userEnteredFormat.wrapStrategy"
-            }
-        },
-        # Bo viền toàn bảng
-        {
-            "updateBorders": {
-                "range": {
-                    "sheetId": sheet_id,
-                    "startRowIndex": 0,
-                    "endRowIndex": num_rows,
-                    "startColumnIndex": 0,
-                    "endColumnIndex": num_cols
-                },
-                "top": {"style": "SOLID", "width": 1},
-                "bottom": {"style": "SOLID", "width": 1},
-                "left": {"style": "SOLID", "width": 1},
-                "right": {"style": "SOLID", "width": 1},
-                "innerHorizontal": {"style": "SOLID", "width": 1},
-                "innerVertical": {"style": "SOLID", "width": 1}
-            }
-        }
-    ]
-
-    # 7. Resize cột dựa trên nội dung
-    for col_index, max_len in enumerate(column_widths):
-        width_pixels = max(80, min(max_len * 10, 400))  # min 80px, max 400px
-        requests.append({
-            "updateDimensionProperties": {
-                "range": {
-                    "sheetId": sheet_id,
-                    "dimension": "COLUMNS",
-                    "startIndex": col_index,
-                    "endIndex": col_index + 1
-                },
-                "properties": {"pixelSize": width_pixels},
-                "fields": "pixelSize"
-            }
-        })
-
-    # 8. Đặt chiều cao tất cả hàng ~10cm (10cm ≈ 378px)
-    requests.append({
-        "updateDimensionProperties": {
-            "range": {
-                "sheetId": sheet_id,
-                "dimension": "ROWS",
-                "startIndex": 0,
-                "endIndex": num_rows
-            },
-            "properties": {"pixelSize": 378},
-            "fields": "pixelSize"
-        }
-    })
-
-    # 9. Gửi batchUpdate
-    body = {"requests": requests}
-    service.spreadsheets().batchUpdate(spreadsheetId=spreadsheet_id, body=body).execute()
-
-    print(f"✅ Đã căn chỉnh và định dạng sheet '{sheet_name}' thành công!")
-
-
-
-def append_json_to_gsheet(df, date_str):
-    """Thêm hoặc ghi đè dữ liệu JSON vào Google Sheet, không đè sang ngày khác"""
-    creds = get_creds()
-    client = gspread.authorize(creds)
-    sheet = client.open_by_key(SPREADSHEET_ID).sheet1
+        return None
 
-    all_values = sheet.get_all_values()
-    last_col = chr(ord('A') + len(df.columns) - 1)
 
-    # Tìm xem ngày đã tồn tại chưa
-    existing_row = None
-    for idx, row in enumerate(all_values):
-        if row and row[0].startswith(f"📅 Ngày {date_str}"):
-            existing_row = idx + 1  # gspread index từ 1
-            break
+_keys_cache = {}
 
-    if existing_row:
-        print(f"ℹ️ Ngày {date_str} đã tồn tại trên sheet. Ghi đè dữ liệu.")
-        start_row = existing_row
 
-        # Tìm row cuối cùng của dữ liệu ngày hôm nay
-        end_row = start_row + 1
-        while end_row <= len(all_values):
-            if all_values[end_row-1] and all_values[end_row-1][0].startswith("📅 Ngày"):
-                break
-            end_row += 1
-
-        # Xóa toàn bộ vùng dữ liệu cũ
-        sheet.delete_rows(start_row, end_row - 1)
+def _file_keys(path):
+    """
+    Key chuẩn hóa và tập pub_date của mọi bài trong 1 file JSON, giữ trong bộ nhớ theo
+    (mtime, size): daemon chạy nhiều lần chỉ đọc lại file khi file đã đổi.
 
-        next_row = start_row
-    else:
-        next_row = len(all_values) + 3 if len(all_values) > 0 else 1  # thêm 2 dòng trống
+    Returns:
+        tuple: (frozenset key, frozenset pub_date)
+    """
+    stat = os.stat(path)
+    cached = _keys_cache.get(path)
+    if cached and cached[0] == (stat.st_mtime_ns, stat.st_size):
+        return cached[1]
+    with open(path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    keys = frozenset(normalize_key(item) for item in items if normalize_key(item))
+    dates = frozenset(item.get("pub_date", "") for item in items)
+    _keys_cache[path] = ((stat.st_mtime_ns, stat.st_size), (keys, dates))
+    return keys, dates
+
+
+def filter_duplicates(new_results, results_dir=RESULTS_DIR, db_dir=DATABASE_DIR, db_file=DATABASE_FILE, prefix=None):
+    """Lọc trùng các bài báo mới theo history_keys (hôm qua hoặc database)."""
+    old_keys = history_keys(results_dir, db_dir, db_file, prefix)
+    if old_keys is None:
+        return new_results
 
-    # 🗓️ Ghi tiêu đề ngày
-    sheet.update_cell(next_row, 1, f"📅 Ngày {date_str}")
-    try:
-        sheet.merge_cells(next_row, 1, next_row, len(df.columns))
-    except Exception:
-        pass
+    filtered_results = [p for p in new_results if normalize_key(p) not in old_keys]
+    removed_count = len(new_results) - len(filtered_results)
+    print(f"🗑️ Đã loại bỏ {removed_count} bài báo trùng với lịch sử.")
+    return filtered_results
 
-    # Format tiêu đề ngày
-    try:
-        day_fmt = CellFormat(
-            textFormat=TextFormat(bold=True, foregroundColor=Color(1, 0, 0), fontSize=13),
-            horizontalAlignment='CENTER',
-            backgroundColor=Color(0.85, 0.93, 1.0)
-        )
-        format_cell_range(sheet, f"A{next_row}:{last_col}{next_row}", day_fmt)
-    except Exception:
-        pass
 
-    # 🧩 Ghi header và dữ liệu
-    data_to_insert = [df.columns.values.tolist()] + df.values.tolist()
-    sheet.update(f"A{next_row + 1}", data_to_insert)
+def stream_duplicate_filter(prefix=None):
+    """
+    Bản dùng cho pipeline streaming: tải history_keys 1 lần, mỗi lô chỉ giữ bài chưa gặp
+    (cả trong lịch sử lẫn ở các nguồn khác đã tới trước trong lần chạy này).
+    """
+    seen = history_keys(prefix=prefix) or set()
+    lock = threading.Lock()
+
+    def dedup(batch):
+        kept = []
+        with lock:
+            for paper in batch:
+                key = normalize_key(paper)
+                if key and key in seen:
+                    report_add("pipeline", "duplicates_dropped")
+                    continue
+                if key:
+                    seen.add(key)
+                kept.append(paper)
+        return kept
+    return dedup
+
+
+def get_google_service(api, version):
+    """Service Google API (googleapiclient chỉ được import khi cần publish)."""
+    from googleapiclient.discovery import build
+    return build(api, version, credentials=get_creds())
+
+
+def append_json_to_gsheet(df, date_str, spreadsheet_id=SPREADSHEET_ID):
+    """
+    Thêm hoặc ghi đè dữ liệu JSON vào Google Sheet, không đè sang ngày khác.
+    Vị trí block của mỗi ngày được lưu trong developer metadata nên không phải đọc cả sheet;
+    giá trị và toàn bộ định dạng đi chung 1 batchUpdate (xem gsheet_publisher).
+    Chỉ các hàng mới/đổi so với snapshot lần publish trước được gửi lên.
+    """
+    service = get_google_service("sheets", "v4")
+    publish_day_to_gsheet(service, spreadsheet_id, df.to_dict("records"), date_str)
+    print(f"✅ Đã thêm/ghi đè dữ liệu ngày {date_str} vào Google Sheet")
 
-    # Format header
-    try:
-        header_fmt = CellFormat(
-            textFormat=TextFormat(bold=True),
-            horizontalAlignment='CENTER',
-            backgroundColor=Color(0.95, 0.95, 0.95)
-        )
-        format_cell_range(sheet, f"A{next_row + 1}:{last_col}{next_row + 1}", header_fmt)
-    except Exception:
-        pass
 
-    # Căn giữa dữ liệu
-    try:
-        data_end_row = next_row + len(df) + 1
-        center_fmt = CellFormat(
-            textFormat=TextFormat(bold=False),
-            horizontalAlignment='CENTER'
-        )
-        format_cell_range(sheet, f"A{next_row + 2}:{last_col}{data_end_row}", center_fmt)
-    except Exception:
-        pass
+def load_day_results(path):
+    """Đọc file kết quả JSON của 1 ngày thành DataFrame."""
+    import pandas as pd
+    with open(path, "r", encoding="utf-8") as f:
+        return pd.DataFrame(json.load(f))
 
-    # Auto-width cho các cột
-    try:
-        for i in range(1, len(df.columns) + 1):
-            set_column_width(sheet, i, 160)
-    except Exception:
-        pass
 
-    print(f"✅ Đã thêm/ghi đè dữ liệu ngày {date_str} vào Google Sheet")
-
-
-def convert_latest_json_to_gsheet():
-    """Đọc file JSON mới nhất (hôm nay) và nối vào sheet"""
+def get_today_json():
+    """File JSON mới nhất nếu là của hôm nay, ngược lại None."""
     latest_file = get_latest_json()
     if not latest_file:
         print("⚠️ Không tìm thấy file JSON.")
-        return
+        return None
 
     today_str = datetime.now().strftime("%Y-%m-%d")
-    base = os.path.basename(latest_file)
-    file_date = base.split("_")[0]
-
+    file_date = os.path.basename(latest_file).split("_")[0]
     if file_date != today_str:
         print("ℹ️ File JSON mới nhất không phải của hôm nay.")
-        return
+        return None
+    return latest_file
 
-    with open(latest_file, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    df = pd.DataFrame(data)
-    append_json_to_gsheet(df, today_str)
-    tidy_up_sheet_auto(SPREADSHEET_ID)
- 
-    
-def append_json_to_gdoc(df, date_str):
-    """Thêm hoặc thay thế nội dung JSON của ngày hôm nay vào Google Docs."""
-    creds = get_creds()
-    service = build("docs", "v1", credentials=creds)
-    doc = service.documents().get(documentId=DOCUMENT_ID).execute()
-    doc_content = doc.get('body', {}).get('content', [])
-
-    day_header = f" Ngày {date_str}"
-    insert_requests = []
-    style_requests = []
-
-    # --- Tìm chỉ số đầu & cuối của ngày hiện có ---
-    start_index, end_index = None, None
-    for i, el in enumerate(doc_content):
-        text = el.get('paragraph', {}).get('elements', [{}])[0].get('textRun', {}).get('content', '')
-        if day_header in text:
-            start_index = el.get('startIndex', 1)
-            # tìm ngày tiếp theo
-            for j in range(i + 1, len(doc_content)):
-                next_text = doc_content[j].get('paragraph', {}).get('elements', [{}])[0].get('textRun', {}).get('content', '')
-                if next_text.strip().startswith("Ngày "):
-                    end_index = doc_content[j].get('startIndex', doc_content[-1]['endIndex'])
-                    break
-            break
 
-    # Nếu không tìm thấy ngày hôm nay → chèn vào cuối
-    if start_index is None:
-        end_index = doc_content[-1]['endIndex'] if doc_content else 1
-    else:
-        # Nếu tìm thấy mà không có ngày tiếp theo, thì lấy đến cuối tài liệu
-        if end_index is None:
-            end_index = doc_content[-1]['endIndex']
-
-        # --- Xóa toàn bộ vùng ngày hôm nay ---
-        delete_req = [{
-            "deleteContentRange": {
-                "range": {"startIndex": start_index, "endIndex": end_index - 1}
-            }
-        }]
-        service.documents().batchUpdate(documentId=DOCUMENT_ID, body={"requests": delete_req}).execute()
-        print(f"🗑️ Đã xóa nội dung cũ của ngày {date_str}")
-        # Sau khi xóa, vị trí chèn sẽ là start_index
-        end_index = start_index
-
-    # --- Thêm header ngày ---
-    insert_requests.append({
-        "insertText": {
-            "location": {"index": end_index - 1},
-            "text": f"\n{day_header}\n\n"
-        }
-    })
-    header_start = end_index
-    header_end = header_start + len(day_header)
-
-    style_requests.append({
-        "updateTextStyle": {
-            "range": {
-                "startIndex": header_start,
-                "endIndex": header_end
-            },
-            "textStyle": {
-                "bold": True,
-                "foregroundColor": {"color": {"rgbColor": {"red": 1, "green": 0, "blue": 0}}}
-            },
-            "fields": "bold,foregroundColor"
-        }
-    })
-
-    end_index += len(day_header) + 3
-
-    # --- Ghi từng bài báo ---
-    for i, row in df.iterrows():
-        title = row.get('title', 'Không có tiêu đề')
-        authors = row.get('authors', 'Không rõ tác giả')
-        pubdate = row.get('pub_date', 'Không rõ ngày')
-        #summary = row.get('summary', '').strip()
-        innovative = row.get('innovative', '').strip()
-
-        text_block = (
-            f"{i+1}. {title}\n"
-            f"Tác giả: {authors}\n"
-            f"Ngày xuất bản: {pubdate}\n\n"
-            #f"Summary: {summary}\n\n"
-            f"Innovative: {innovative}\n\n"
-        )
+def convert_latest_json_to_gsheet():
+    """Đọc file JSON mới nhất (hôm nay) và nối vào sheet"""
+    latest_file = get_today_json()
+    if latest_file:
+        append_json_to_gsheet(load_day_results(latest_file), datetime.now().strftime("%Y-%m-%d"))
 
-        insert_requests.append({
-            "insertText": {
-                "location": {"index": end_index - 1},
-                "text": text_block
-            }
-        })
-
-        # In đậm tiêu đề bài báo
-        title_start = end_index - 1 + len(f"{i+1}. ")
-        title_end = title_start + len(title)
-        style_requests.append({
-            "updateTextStyle": {
-                "range": {"startIndex": title_start, "endIndex": title_end},
-                "textStyle": {
-                    "bold": True,
-                    "foregroundColor": {"color": {"rgbColor": {"red": 0, "green": 0, "blue": 0}}}
-                },
-                "fields": "bold,foregroundColor"
-            }
-        })
-
-        end_index += len(text_block)
-
-    # --- 1️⃣ Chèn text ---
-    service.documents().batchUpdate(
-        documentId=DOCUMENT_ID, body={"requests": insert_requests}
-    ).execute()
-
-    # --- 2️⃣ Định dạng ---
-    if style_requests:
-        service.documents().batchUpdate(
-            documentId=DOCUMENT_ID, body={"requests": style_requests}
-        ).execute()
 
+def append_json_to_gdoc(df, date_str, document_id=DOCUMENT_ID):
+    """
+    Thêm hoặc thay thế nội dung JSON của ngày hôm nay vào Google Docs.
+    Vùng của mỗi ngày được đánh dấu bằng named range nên không phải đọc/quét cả tài liệu;
+    xóa, chèn và định dạng đi chung 1 batchUpdate (xem gdoc_publisher).
+    Chỉ các bài mới/đổi so với snapshot lần publish trước được gửi lên.
+    """
+    service = get_google_service("docs", "v1")
+    publish_day_to_gdoc(service, document_id, df.to_dict("records"), date_str)
     print(f"✅ Đã cập nhật nội dung ngày {date_str} vào Google Docs.")
 
 
-
 def convert_latest_json_to_gdoc():
     """Đọc file JSON hôm nay và ghi vào Google Docs."""
-    latest_file = get_latest_json()  # hàm này bạn đã có sẵn
-    if not latest_file:
-        print("⚠️ Không tìm thấy file JSON.")
-        return
+    latest_file = get_today_json()
+    if latest_file:
+        append_json_to_gdoc(load_day_results(latest_file), datetime.now().strftime("%Y-%m-%d"))
 
-    today_str = datetime.now().strftime("%Y-%m-%d")
-    base = os.path.basename(latest_file)
-    file_date = base.split("_")[0]
 
-    if file_date != today_str:
-        print("ℹ️ File JSON mới nhất không phải của hôm nay.")
-        return
+# ==============================
+# Các đích publish (xem sinks.py)
+# ==============================
+def publish_to_database(payload):
+    return save_results_to_database(payload["file"])
+
+
+def publish_to_gdoc(payload):
+    append_json_to_gdoc(load_day_results(payload["file"]), payload["date"],
+                        payload.get("document_id") or DOCUMENT_ID)
+
+
+def publish_to_gsheet(payload):
+    append_json_to_gsheet(load_day_results(payload["file"]), payload["date"],
+                          payload.get("spreadsheet_id") or SPREADSHEET_ID)
+
+
+register_sink("database", publish_to_database)
+register_sink("gdoc", publish_to_gdoc)
+register_sink("gsheet", publish_to_gsheet)
 
-    with open(latest_file, "r", encoding="utf-8") as f:
-        data = json.load(f)
 
-    df = pd.DataFrame(data)
-    append_json_to_gdoc(df, today_str)
-    
-    
 # ========================
 # Merge & Save to One File
 # ========================
@@ -691,85 +505,195 @@ def merge_and_save(all_results, filename):
 
     print(f"Saved {len(final_results)} unique papers to {filepath}")
 
-def fetch_abstract_and_pubdate_firecrawl(url):
+# Lỗi gắn với chính URL (paywall, không tồn tại...) → cache lỗi để không scrape lại mãi
+PERMANENT_FAILURE_CODES = {403, 404, 410, 451}
+_firecrawl_cache = None
+_firecrawl_lock = threading.Lock()
+
+
+def get_firecrawl_cache():
+    """Cache kết quả Firecrawl theo URL chuẩn hóa, lưu ở database/firecrawl_cache.json."""
+    global _firecrawl_cache
+    with _firecrawl_lock:
+        if _firecrawl_cache is None:
+            _firecrawl_cache = PersistentCache(
+                os.path.join(DATABASE_DIR, FIRECRAWL_CACHE_FILE),
+                ttl=90 * 86400,          # abstract/ngày xuất bản hầu như không đổi
+                failure_ttl=86400,       # lỗi: thử lại sau 1, 2, 4, ... ngày
+                max_failure_ttl=30 * 86400,
+                max_entries=5000,
+            )
+        return _firecrawl_cache
+
+
+def cache_firecrawl_result(cache, url, data):
     """
-    Dùng Firecrawl Scrape API, trích xuất toàn bộ abstract và pubdate.
+    Lưu kết quả scrape vào cache:
+    - Lấy được abstract hoặc pubdate → cache thành công.
+    - Trang tải được nhưng không có gì, hoặc lỗi 403/404/410/451 → cache lỗi (backoff).
+    - Lỗi tạm thời (429, 5xx, timeout, hết credit) → không cache.
     """
-    if not FIRECRAWL_API_KEY:
-        raise ValueError("Thiếu FIRECRAWL_API_KEY, hãy set trong biến môi trường.")
+    key = canonicalize_url(url)
+    if not key:
+        return
+    if "error" in data:
+        if data.get("status_code") in PERMANENT_FAILURE_CODES:
+            cache.set_failure(key, data["error"])
+        return
+    found_abstract = data["abstract"] and data["abstract"] != "Not Available"
+    found_pubdate = data["pubdate"] != "Not Available"
+    if found_abstract or found_pubdate:
+        cache.set(key, {"abstract": data["abstract"], "pubdate": data["pubdate"]})
+    else:
+        cache.set_failure(key, "Không trích xuất được abstract/pubdate")
 
-    api_url = "https://api.firecrawl.dev/v1/scrape"
-    headers = {"Authorization": f"Bearer {FIRECRAWL_API_KEY}"}
-    payload = {
-        "url": url,
-        "formats": ["markdown"],  
-    }
 
-    try:
-        resp = requests.post(api_url, json=payload, headers=headers, timeout=60)
-        resp.raise_for_status()
-        data = resp.json()
-    except requests.exceptions.RequestException as e:
-        print(f"[Firecrawl Error] {e}")
-        return {"abstract": "Not Available", "pubdate": "Not Available"}
-
-    content = data.get("data", {}).get("markdown", "")
-    if not content:
-        return {"abstract": "Not Available", "pubdate": "Not Available"}
-
-    lines = content.splitlines()
-    abstract_lines = []
-    capture = False
-
-    for line in lines:
-        low = line.lower().strip()
-        # Bắt đầu từ Abstract / Tóm tắt
-        if "abstract" in low or "tóm tắt" in low:
-            capture = True
-            continue
-        # Nếu gặp Keywords / Introduction thì dừng lại
-        if capture and ("keywords" in low or "introduction" in low or "references" in low):
-            break
-        if capture:
-            abstract_lines.append(line.strip())
-
-    abstract = " ".join(abstract_lines).strip()
-    
-    # --- Trích xuất pubdate từ markdown ---
-    pubdate = "Not Available"
-    # tìm các mẫu như "Published: 2025-01-20" hoặc "Ngày xuất bản: 20 Jan 2025"
-    date_patterns = [
-        r'published[:\s]+(\d{4}-\d{2}-\d{2})',  # YYYY-MM-DD
-        r'published[:\s]+(\d{1,2}\s\w+\s\d{4})', # DD Month YYYY
-        r'ngày xuất bản[:\s]+(\d{1,2}\s\w+\s\d{4})',
-    ]
-    for pattern in date_patterns:
-        match = re.search(pattern, content, re.IGNORECASE)
-        if match:
-            try:
-                pubdate = str(parser.parse(match.group(1)).date())
-                break
-            except:
-                continue
-    return {"abstract": abstract, "pubdate": pubdate}
-
-
-def enrich_with_firecrawl(results):
+def enrich_with_firecrawl(results, max_workers=FIRECRAWL_CONCURRENCY, deadline=FIRECRAWL_TIMEOUT,
+                          mode=FIRECRAWL_MODE, cheap_first=ENRICH_CHEAP_FIRST):
     """
     Nhận danh sách results (các bài báo đã crawl từ OpenAlex, Arxiv, etc.)
-    Nếu abstract = 'Not Available' hoặc pubdate = 'Not Available' thì dùng Firecrawl lấy.
+    Chỉ bài còn thiếu abstract hoặc pub_date mới được bổ sung, và chỉ các field
+    còn thiếu được ghi lại (không ghi đè dữ liệu sẵn có).
+
+    Thứ tự bổ sung (cascade), bài đã đủ dữ liệu ở tier nào thì dừng ở tier đó:
+        1. OpenAlex theo DOI (50 DOI/request)  2. arXiv theo id_list  3. OpenAlex theo tiêu đề
+        4. Cache Firecrawl  5. Firecrawl (chỉ cho bài vẫn còn thiếu)
+    `cheap_first=False` bỏ qua 3 tier đầu.
+
+    mode:
+        "scrape": scrape song song từng URL (tối đa `max_workers` luồng, tự giảm khi gặp 429),
+                  mỗi request có deadline `deadline` giây.
+        "batch":  gửi tất cả URL thành 1 batch scrape job, trích xuất từng trang khi có kết quả.
+        "auto":   dùng "batch" khi có từ FIRECRAWL_BATCH_MIN URL trở lên, ngược lại "scrape".
+    Kết quả được ghi lại đúng thứ tự.
     """
-    for paper in results:
-        needs_fetch = (
-            (not paper.get("abstract") or paper["abstract"] == "Not Available") or
-            (not paper.get("pubdate") or paper["pubdate"] == "Not Available")
-        )
-        if needs_fetch and paper.get("link") != "Not Available":
-            print(f"Fetching abstract & pubdate with Firecrawl for: {paper['title']}")
-            data = fetch_abstract_and_pubdate_firecrawl(paper["link"])
-            paper["abstract"] = data["abstract"]
-            paper["pubdate"] = data["pubdate"]
-            time.sleep(6)  # tránh bị rate-limit
+    plan = plan_enrichment(results)
+    if cheap_first:
+        plan = run_enrichment_cascade(plan)
+
+    # Tra cache trước: chỉ scrape những URL chưa từng gặp (hoặc đã hết hạn)
+    cache = get_firecrawl_cache()
+    to_fetch = []
+    for paper, fields in plan:
+        entry = cache.lookup(canonicalize_url(paper["link"]))
+        if entry is None:
+            to_fetch.append((paper, fields))
+        elif entry["ok"]:
+            if apply_enrichment(paper, fields, firecrawl_values(entry["value"])):
+                mark_satisfied(paper, "firecrawl_cache")
+            report_add("enrichment", "cache_hits")
+        else:
+            report_add("enrichment", "cache_negative_hits")
+    report_add("enrichment", "scrapes_avoided", len(results) - len(to_fetch))
+
+    if not to_fetch:
+        cache.save()
+        return results
+
+    links = [paper["link"] for paper, _ in to_fetch]
+    use_batch = mode == "batch" or (mode == "auto" and len(links) >= FIRECRAWL_BATCH_MIN)
+    with report_timer("enrichment"), report_timer("enrichment_tiers", "firecrawl_latency_s"):
+        fetched = None
+        if use_batch:
+            print(f"Fetching abstract & pubdate with Firecrawl batch scrape for {len(links)} papers")
+            by_url = batch_fetch_abstract_and_pubdate_firecrawl(links, job_timeout=max(deadline, 10 * len(links)))
+            if by_url is not None:
+                fetched = [by_url[link] for link in links]
+                report_set("enrichment", "mode", "batch")
+            else:
+                print("⚠️ Batch scrape thất bại → chuyển sang scrape từng URL")
+        if fetched is None:
+            print(f"Fetching abstract & pubdate with Firecrawl for {len(links)} papers ({max_workers} luồng)")
+            executor = EnrichmentExecutor(max_workers=max_workers, deadline=deadline)
+            fetched = executor.map(fetch_abstract_and_pubdate_firecrawl, links)
+            report_set("enrichment", "mode", "scrape")
+
+    for (paper, fields), data in zip(to_fetch, fetched):
+        if apply_enrichment(paper, fields, firecrawl_values(data)):
+            mark_satisfied(paper, "firecrawl")
+        cache_firecrawl_result(cache, paper["link"], data)
+        report_add("enrichment", "failed" if "error" in data else "fetched")
+
+    cache.save()
+    return results
+
+
+# =========================================
+# Gọi Gemini song song (có cache)
+# =========================================
+def run_llm_requests(requests, on_result, offline=False, stage="llm"):
+    """
+    Chạy các request Gemini: online qua gemini_executor, hoặc offline gom thành 1 batch job
+    (Gemini Batch API). Batch job lỗi/thất bại thì chạy lại online.
+    Job chưa xong sau GEMINI_BATCH_TIMEOUT → BatchJobPending (lần chạy sau sẽ poll tiếp).
+
+    Token của mỗi request được ước lượng và giữ chỗ trong run_budget trước khi gửi; request
+    vượt LLM_TOKEN_BUDGET bị bỏ qua (on_result nhận TokenBudgetExceeded). Token thật từ
+    usage_metadata được ghi vào báo cáo chi phí theo `stage`.
+    """
+    allowed, reserved = [], {}
+    for request in requests:
+        request["tokens"] = request_tokens(request)
+        if run_budget.try_reserve(request["tokens"]):
+            allowed.append(request)
+            reserved[request["id"]] = request["tokens"]
+        else:
+            report_add(f"llm_cost.{stage}", "skipped_over_budget")
+            on_result(request["id"], None, TokenBudgetExceeded(f"Vượt ngân sách {run_budget.limit} token"))
+
+    def tracked(batch):
+        def callback(request_id, response, error):
+            used = record_usage(stage, response, batch) if response is not None else 0
+            run_budget.settle(reserved.pop(request_id, 0), used)
+            on_result(request_id, response, error)
+        return callback
+
+    if offline and allowed:
+        results = run_batch_job(get_gemini_client(), GEMINI_MODEL, allowed, tracked(batch=True))
+        if results is not None:
+            return results
+        print("↩️ Gemini batch job thất bại → chạy online")
+    return get_gemini_executor().run(allowed, tracked(batch=False))
+
+
+def run_text_prompts(items, temperature, parse=None, label="Gemini", offline=False, stage="text"):
+    """
+    Chạy nhiều prompt văn bản cùng lúc qua gemini_executor; kết quả đã cache thì không gọi lại.
+
+    Parameters:
+        items (list): [(id, prompt, abstract)], abstract dùng để tính key cache.
+        parse (callable): Chuyển response.text thành giá trị cần lưu (mặc định: text đã strip).
+        offline (bool): Chạy qua Gemini Batch API (xem run_llm_requests).
+        stage (str): Tên bước trong báo cáo chi phí.
+
+    Returns:
+        dict: {id: giá trị}; request lỗi không có trong kết quả.
+    """
+    parse = parse or (lambda text: text.strip())
+    results, requests, keys = {}, [], {}
+    for item_id, prompt, abstract in items:
+        keys[item_id] = llm_cache_key(GEMINI_MODEL, prompt, abstract, temperature)
+        cached = get_cached_llm_result(keys[item_id])
+        if cached is not None:
+            results[item_id] = cached
+        else:
+            requests.append({
+                "id": item_id,
+                "contents": prompt,
+                "config": generate_config(temperature=temperature),
+            })
+
+    def on_result(item_id, response, error):
+        try:
+            if error is not None:
+                raise error
+            results[item_id] = parse(response.text)
+        except Exception as e:
+            print(f"[Gemini Error - {label}] {e}")
+            return
+        store_llm_result(keys[item_id], results[item_id], response_tokens(response))
+
+    run_llm_requests(requests, on_result, offline, stage)
     return results
 
 
@@ -783,6 +707,7 @@ def evaluate_paper_combined(abstract, keywords):
             "score": int (0-10)
         }
     """
+    abstract = prepare_abstract(abstract)
     prompt = f"""
     You are an expert in scientific paper evaluation.
 
@@ -796,67 +721,396 @@ def evaluate_paper_combined(abstract, keywords):
     {abstract}
     """
 
-    try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-            config=GenerateContentConfig(temperature=0)
-        )
-        text = response.text.strip().upper()
-        related = "YES" in text
+    def parse(text):
+        text = text.strip().upper()
         score_match = re.search(r'\d+', text)
         score = int(score_match.group()) if score_match else 0
-        score = min(max(score, 0), 10)
-        return {"related": related, "score": score}
+        return {"related": "YES" in text, "score": min(max(score, 0), 10)}
+
+    results = run_text_prompts([(0, prompt, abstract)], 0, parse, "Combined Evaluation", stage="combined_evaluation")
+    return results.get(0, {"related": False, "score": 0})
+
+
+# =========================================
+# Chấm điểm nhiều bài trong 1 request (JSON có schema)
+# =========================================
+EVALUATION_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "id": {"type": "INTEGER"},
+            "related": {"type": "BOOLEAN"},
+            "score": {"type": "INTEGER"},
+        },
+        "required": ["id", "related", "score"],
+    },
+}
+
+INNOVATION_GUIDELINES = """
+    Follow this reasoning process silently before answering:
+
+    Understand what general topic or goal the research addresses (but do not include this in the answer).
+
+    Examine what method, technique, framework, model, or experimental process is used.
+
+    Compare it mentally with common or traditional approaches in the same field.
+
+    Identify what is new, improved, or distinctive about the method or process.
+
+    Then, write the final output clearly and concisely:
+
+    Focus only on the methodological innovation (not findings or topic).
+
+    Write 2–4 sentences in simple academic English.
+
+    Avoid vague terms like “novel,” “innovative,” or “unique” unless you explain how.
+"""
+
+
+def build_evaluation_schema(analyze=False, with_summary=False):
+    """Schema JSON cho kết quả chấm điểm, thêm "innovative"/"summary" khi phân tích kết hợp."""
+    properties = dict(EVALUATION_SCHEMA["items"]["properties"])
+    if analyze:
+        properties["innovative"] = {"type": "STRING"}
+    if with_summary:
+        properties["summary"] = {"type": "STRING"}
+    return {"type": "ARRAY", "items": {**EVALUATION_SCHEMA["items"], "properties": properties}}
+
+
+def split_into_batches(items, max_tokens=LLM_BATCH_TOKEN_BUDGET, max_size=LLM_BATCH_SIZE):
+    """
+    Chia [(id, abstract)] thành các lô sao cho tổng token ước lượng <= max_tokens
+    và mỗi lô tối đa max_size abstract. Abstract quá dài vẫn được đi 1 mình 1 lô.
+    """
+    batches, current, current_tokens = [], [], 0
+    for item_id, abstract in items:
+        tokens = estimate_tokens(abstract)
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_size):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append((item_id, abstract))
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def build_batch_prompt(batch, keywords, analyze=False, with_summary=False):
+    """Prompt chấm điểm cho 1 lô [(id, abstract)] (dùng chung khi gọi API và khi tính key cache)."""
+    papers_text = "\n\n".join(f"[id={item_id}]\n{abstract}" for item_id, abstract in batch)
+    fields = 'its id, "related" (true/false) and "score" (integer 0-10)'
+    extra_tasks = ""
+    condition = f"its score is at least {ANALYSIS_MIN_SCORE}" if ANALYSIS_MIN_SCORE else "it is related"
+    if analyze:
+        fields += f', "innovative" (methodological innovation, empty string unless {condition})'
+        extra_tasks += f"""
+    3. Only if {condition}, identify the methodological innovation of the study.
+    {INNOVATION_GUIDELINES}"""
+    if with_summary:
+        fields += f', "summary" (3-4 concise sentences in simple academic English, empty unless {condition})'
+        extra_tasks += f"""
+    4. Only if {condition}, summarize the abstract in 3-4 concise sentences."""
+
+    return f"""
+    You are an expert in scientific paper evaluation.
+
+    For EACH abstract below:
+    1. Determine if it is related to the topic: {", ".join(keywords)}.
+    2. If it is related, rate its quality on a scale from 0 (very poor) to 10 (excellent).
+       If it is not related, give a score of 0.{extra_tasks}
+    Return one object per abstract with {fields}.
+
+    Abstracts:
+    {papers_text}
+    """
+
+
+def batch_item_cache_key(abstract, keywords, analyze=False, with_summary=False):
+    """Key cache cho kết quả chấm điểm của 1 abstract trong prompt theo lô."""
+    template = build_batch_prompt([(0, "{abstract}")], keywords, analyze, with_summary)
+    return llm_cache_key(GEMINI_MODEL, template, abstract, SCORING_TEMPERATURE)
+
+
+def build_batch_request(request_id, batch, keywords, analyze=False, with_summary=False):
+    """
+    Request cho gemini_executor: 1 lô [(id, abstract)] trong 1 request, trả về JSON theo schema.
+    analyze=True: trả về luôn điểm sáng tạo về phương pháp ("innovative") cho bài đạt
+    ANALYSIS_MIN_SCORE, with_summary=True: thêm tóm tắt 3-4 câu ("summary").
+    Luôn chấm ở SCORING_TEMPERATURE, kể cả khi có phần phân tích.
+    """
+    prompt = build_batch_prompt(batch, keywords, analyze, with_summary)
+    return {
+        "id": request_id,
+        "contents": prompt,
+        "config": generate_config(
+            temperature=SCORING_TEMPERATURE,
+            response_mime_type="application/json",
+            response_schema=build_evaluation_schema(analyze, with_summary),
+        ),
+    }
+
+
+def parse_batch_response(batch, response, keywords, analyze=False, with_summary=False):
+    """
+    Đọc kết quả JSON của 1 lô và cache từng bài hợp lệ.
+
+    Returns:
+        dict: {id: {"related": bool, "score": int, ["innovative"], ["summary"]}} cho các id hợp lệ.
+    """
+    try:
+        items = json.loads(response.text)
     except Exception as e:
-        print(f"[Gemini Error - Combined Evaluation] {e}")
-        return {"related": False, "score": 0}
+        print(f"[Gemini Error - Batch Evaluation] {e}")
+        return {}
+
+    expected_ids = {item_id for item_id, _ in batch}
+    evaluations = {}
+    for item in items if isinstance(items, list) else []:
+        try:
+            item_id = int(item["id"])
+            score = min(max(int(item["score"]), 0), 10)
+            related = bool(item["related"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if item_id not in expected_ids:
+            continue
+        required = [key for key, wanted in (("innovative", analyze), ("summary", with_summary)) if wanted]
+        texts = {key: (item.get(key) or "").strip() for key in required}
+        # Bài cần phân tích (xem ANALYSIS_MIN_SCORE) mà thiếu phần phân tích → coi như lỗi để thử lại
+        if related and score >= ANALYSIS_MIN_SCORE and not all(texts.values()):
+            continue
+        evaluations[item_id] = {"related": related, "score": score if related else 0, **texts}
+
+    # Cache từng bài; số token của cả lô được chia đều cho các bài
+    tokens_per_item = response_tokens(response) // max(len(batch), 1)
+    for item_id, abstract in batch:
+        if item_id in evaluations:
+            store_llm_result(
+                batch_item_cache_key(abstract, keywords, analyze, with_summary),
+                evaluations[item_id],
+                tokens_per_item,
+            )
+    return evaluations
+
+
+def evaluate_papers_batch(abstracts, keywords, max_tokens=LLM_BATCH_TOKEN_BUDGET,
+                          max_size=LLM_BATCH_SIZE, max_retries=2, analyze=False, with_summary=False,
+                          offline=False):
+    """
+    Chấm điểm nhiều abstract với ít request nhất (analyze/with_summary: xem build_batch_request).
+    Các abstract bị thiếu/lỗi trong kết quả được gom lại và thử lại (chỉ những abstract đó),
+    tối đa `max_retries` lần; sau cùng vẫn lỗi thì coi như không liên quan.
+    offline=True: lượt đầu chạy qua Gemini Batch API, các lượt thử lại chạy online.
+
+    Parameters:
+        abstracts (list): [(id, abstract)]
+
+    Returns:
+        dict: {id: {"related": bool, "score": int}} cho mọi id đầu vào.
+    """
+    results = {}
+    pending = []
+    for item_id, abstract in abstracts:
+        cached = get_cached_llm_result(batch_item_cache_key(abstract, keywords, analyze, with_summary))
+        if cached is not None:
+            results[item_id] = cached
+        else:
+            pending.append((item_id, abstract))
+
+    def on_result(batch_index, response, error):
+        report_add("llm_scoring", "calls")
+        if error is not None:
+            print(f"[Gemini Error - Batch Evaluation] {error}")
+            return
+        results.update(parse_batch_response(batches[batch_index], response, keywords, analyze, with_summary))
+
+    for attempt in range(max_retries + 1):
+        if not pending:
+            break
+        # Lần thử lại dùng lô nhỏ hơn để giảm khả năng lỗi cả lô
+        size = max(1, max_size >> attempt)
+        batches = split_into_batches(pending, max_tokens, size)
+        # Các lô được gửi song song, mỗi lô được xử lý ngay khi có kết quả
+        run_llm_requests(
+            [build_batch_request(i, batch, keywords, analyze, with_summary) for i, batch in enumerate(batches)],
+            on_result,
+            offline and attempt == 0,
+            stage="scoring",
+        )
+        pending = [(i, a) for i, a in pending if i not in results]
+        if pending and attempt < max_retries:
+            print(f"🔁 Thử lại {len(pending)} bài chấm điểm lỗi")
+
+    for item_id, _ in pending:
+        results[item_id] = {"related": False, "score": 0}
+        report_add("llm_scoring", "failed")
+    save_llm_cache()
+    return results
 
 
 # =========================================
 # Hàm lọc bài báo không có abstract hoặc không liên quan
 # =========================================
-def filter_top_papers(results, keywords:list, top_n=10):
+def filter_top_papers(results, keywords:list, top_n=10, mode=ANALYSIS_MODE, with_summary=False,
+                      prerank_top_k=PRERANK_TOP_K, novelty=NOVELTY_ENABLED, offline=LLM_OFFLINE,
+                      threshold=TOPN_SCORE_THRESHOLD, synonyms=None):
     """
     Lọc các bài báo liên quan và chọn ra top N bài báo hay nhất dựa trên score AI.
+    Các abstract được chấm theo lô (nhiều bài/request) bằng evaluate_papers_batch, từng đợt
+    theo thứ tự ưu tiên (điểm pre-rank, hoặc bài mới nhất trước nếu không pre-rank);
+    đủ top_n bài đạt `threshold` thì dừng, không chấm các bài còn lại (xem select_top_n).
 
     Parameters:
         results (list): Danh sách bài báo, mỗi bài báo là dict với 'abstract' và 'title'.
         keywords (list): Danh sách từ khóa liên quan đến chủ đề nghiên cứu.
         top_n (int): Số bài báo muốn giữ lại (mặc định 10).
+        mode (str): "combined" → cùng request trả về luôn 'innovative' (và 'summary' nếu
+            with_summary) cho bài đạt ANALYSIS_MIN_SCORE, innovative_filtered_papers sẽ bỏ qua
+            các bài đã có;
+            "separate" → chỉ chấm điểm.
+        prerank_top_k (int): Trước khi gọi LLM, xếp hạng cục bộ bằng BM25 và chỉ gửi tối đa
+            prerank_top_k bài khớp từ khóa/từ đồng nghĩa (None hoặc 0 = không pre-rank).
+        novelty (bool): So với các bài đã lưu; bài gần trùng lịch sử bị xếp xuống cuối
+            nên thường bị pre-rank cắt trước khi gọi LLM.
+        offline (bool): Chấm điểm qua Gemini Batch API thay vì gọi trực tiếp
+            (gửi tất cả trong 1 job nên không dừng sớm).
+        threshold (int): Điểm coi là "đủ tốt" cho việc dừng sớm (0 = chấm hết).
+        synonyms (list): Từ đồng nghĩa/viết tắt của chủ đề cho pre-rank (None = TOPIC_SYNONYMS).
 
     Returns:
         list: Danh sách bài báo đã lọc và sắp xếp theo chất lượng.
     """
-    scored_papers = []
-
+    analyze = mode == "combined"
+    batch_size = LLM_ANALYSIS_BATCH_SIZE if analyze else LLM_BATCH_SIZE
+    candidates = prepare_candidates(results, keywords, batch_size, novelty, prerank_top_k, synonyms)
+    if not prerank_top_k:
+        candidates = sorted(candidates, key=lambda p: normalize_date(p.get("pub_date")) or "", reverse=True)
+
+    def evaluate(wave):
+        return evaluate_candidates(wave, keywords, batch_size, analyze, with_summary, offline)
+
+    print(f"Checking relevance and quality for {len(candidates)} papers (mode={mode})")
+    # Mỗi đợt vừa đủ cho các request chạy song song; offline gửi tất cả trong 1 batch job
+    wave_size = len(candidates) if offline else batch_size * GEMINI_CONCURRENCY
+    selected = select_top_n(candidates, evaluate, top_n, threshold, wave_size, reject_paper)
+    return [apply_evaluation(paper, evaluation) for paper, evaluation in selected]
+
+
+def prepare_candidates(results, keywords, batch_size, novelty=NOVELTY_ENABLED, prerank_top_k=PRERANK_TOP_K,
+                       synonyms=None):
+    """Bỏ bài không có abstract, đánh dấu novelty, rồi pre-rank BM25 (nếu bật)."""
+    candidates = []
     for paper in results:
-        title = paper.get("title", "Untitled")
-        abstract = paper.get("abstract", "").strip()
-
+        abstract = (paper.get("abstract") or "").strip()
         if not abstract or abstract.lower() == "not available":
             continue
+        candidates.append(paper)
 
-        print(f"Checking relevance and quality for: {title}")
-        # Gọi hàm đánh giá kết hợp liên quan + điểm chất lượng
-        evaluation = evaluate_paper_combined(abstract, keywords)
+    if novelty and candidates:
+        try:
+            candidates = score_novelty(candidates)
+        except Exception as e:
+            print(f"⚠️ Lỗi khi tính novelty: {e}")
+    if prerank_top_k:
+        candidates = prerank_papers(candidates, keywords, top_k=prerank_top_k, synonyms=synonyms,
+                                    batch_size=batch_size)
+    return candidates
 
-        if evaluation["related"]:
-            paper["score"] = evaluation["score"]
-            scored_papers.append(paper)
-        else:
-            print(f"❌ Paper '{title}' is not relevant.")
 
-        time.sleep(16)  # tránh bị rate-limit Gemini API
+def evaluate_candidates(papers, keywords, batch_size, analyze=False, with_summary=False, offline=False):
+    """Kết quả chấm điểm của từng bài, cùng thứ tự với `papers`."""
+    evaluations = evaluate_papers_batch(
+        [(i, prepare_abstract(paper["abstract"])) for i, paper in enumerate(papers)],
+        keywords,
+        max_size=batch_size,
+        analyze=analyze,
+        with_summary=with_summary,
+        offline=offline,
+    )
+    return [evaluations[i] for i in range(len(papers))]
+
+
+def apply_evaluation(paper, evaluation):
+    paper["score"] = evaluation["score"]
+    for key in ("innovative", "summary"):
+        if evaluation.get(key):
+            paper[key] = evaluation[key]
+    return paper
+
+
+def reject_paper(paper):
+    print(f"❌ Paper '{paper.get('title', 'Untitled')}' is not relevant.")
+
 
-    # Sắp xếp theo score giảm dần và chỉ lấy top N
-    top_papers = sorted(scored_papers, key=lambda x: x["score"], reverse=True)[:top_n]
-    return top_papers
+class StreamingTopPapers:
+    """
+    Chấm điểm cho pipeline streaming: mỗi lô bài vừa bổ sung xong được lọc novelty/BM25 và chấm
+    ngay, kết quả dồn vào 1 TopNSelector. Khác filter_top_papers:
+    - pre-rank chỉ loại bài không khớp từ khóa (điểm BM25 > 0 không phụ thuộc các lô khác);
+      không cắt theo prerank_top_k vì thứ tự BM25 chỉ có nghĩa trên toàn bộ các bài, cắt theo
+      thứ tự tới sẽ giữ bài của nguồn nhanh thay vì bài khớp nhất → mọi bài khớp đều được chấm;
+    - selector bão hòa (đủ top_n bài ≥ threshold) thì các lô sau không được chấm nữa.
+    Vì vậy chế độ này tốn nhiều request LLM hơn filter_top_papers (PIPELINE_MODE mặc định là "barrier").
+    """
+
+    def __init__(self, keywords, top_n=10, mode=ANALYSIS_MODE, with_summary=False,
+                 prerank_top_k=PRERANK_TOP_K, novelty=NOVELTY_ENABLED, threshold=TOPN_SCORE_THRESHOLD,
+                 synonyms=None):
+        self.keywords = keywords
+        self.synonyms = synonyms
+        self.analyze = mode == "combined"
+        self.with_summary = with_summary
+        self.batch_size = LLM_ANALYSIS_BATCH_SIZE if self.analyze else LLM_BATCH_SIZE
+        self.prerank = bool(prerank_top_k)
+        self.novelty = novelty
+        self.selector = TopNSelector(top_n, threshold)
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def score(self, batch):
+        """
+        Stage function: chấm 1 lô rồi trả lại nguyên lô, để cuối pipeline có đủ các bài đã bổ sung
+        (lưu checkpoint); top-N chỉ biết khi hết luồng, lấy bằng results().
+        """
+        if self.selector.saturated:
+            with self._lock:
+                self.skipped += len(batch)
+            return batch
+        candidates = prepare_candidates(batch, self.keywords, self.batch_size, self.novelty, prerank_top_k=None)
+        if self.prerank and candidates:
+            candidates = prerank_papers(candidates, self.keywords, top_k=None, synonyms=self.synonyms,
+                                        batch_size=self.batch_size)
+        if self.selector.saturated:
+            with self._lock:
+                self.skipped += len(candidates)
+            return batch
+        if not candidates:
+            return batch
+        evaluations = evaluate_candidates(candidates, self.keywords, self.batch_size,
+                                          self.analyze, self.with_summary)
+        with self._lock:
+            self.selector.offer(candidates, evaluations, reject_paper)
+        return batch
+
+    def results(self):
+        report_skipped(self.selector, self.skipped)
+        return [apply_evaluation(paper, evaluation) for paper, evaluation in self.selector.selected()]
 
 
 # =========================================
 # Hàm tóm tắt abstract
 # =========================================
+def summary_prompt(abstract):
+    return f"""
+    Summarize the following abstract in 3-4 concise sentences.
+    Use simple and clear academic English.
+
+    Abstract:
+    {abstract}
+    """
+
+
 def summarize_with_genai(abstract):
     """
     Dùng Gemini API để tóm tắt abstract thành 3-4 câu.
@@ -867,50 +1121,54 @@ def summarize_with_genai(abstract):
     Returns:
         str: Tóm tắt abstract.
     """
-    prompt = f"""
-    Summarize the following abstract in 3-4 concise sentences.
-    Use simple and clear academic English.
-
-    Abstract:
-    {abstract}
-    """
 
-    try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",  # Model chất lượng cao
-            contents=prompt,
-            config=GenerateContentConfig(temperature=0.3)
-        )
-        return response.text.strip()
-    except Exception as e:
-        print(f"[Gemini Error - Summarization] {e}")
-        return "Tóm tắt không thành công"
+    abstract = prepare_abstract(abstract)
+    results = run_text_prompts([(0, summary_prompt(abstract), abstract)], 0.3, label="Summarization", stage="summary")
+    return results.get(0, "Tóm tắt không thành công")
 
 
 # =========================================
 # Hàm tóm tắt toàn bộ danh sách bài đã lọc
 # =========================================
-def summarize_filtered_papers(filtered_papers):
+def summarize_filtered_papers(filtered_papers, offline=LLM_OFFLINE):
     """
     Tóm tắt abstract của tất cả các bài báo đã lọc.
 
     Parameters:
         filtered_papers (list): Danh sách bài báo đã lọc, mỗi bài chứa 'abstract' và 'title'.
+        offline (bool): Chạy qua Gemini Batch API thay vì gọi trực tiếp.
 
     Returns:
         list: Danh sách bài báo với key 'summary' chứa tóm tắt abstract.
     """
-    for paper in filtered_papers:
+    items = []
+    for i, paper in enumerate(filtered_papers):
         abstract = paper.get("abstract", "").strip()
         title = paper.get("title", "Untitled")
         
         if abstract:
             print(f"Summarizing abstract for: {title}")
-            paper["summary"] = summarize_with_genai(abstract)
-            time.sleep(16)  
+            abstract = prepare_abstract(abstract)
+            items.append((i, summary_prompt(abstract), abstract))
 
+    # Tóm tắt mọi bài cùng lúc (song song, hoặc 1 batch job khi offline)
+    summaries = run_text_prompts(items, 0.3, label="Summarization", offline=offline, stage="summary")
+    for i, _, _ in items:
+        filtered_papers[i]["summary"] = summaries.get(i, "Tóm tắt không thành công")
+
+    save_llm_cache()
     return filtered_papers
 
+def innovation_prompt(abstract):
+    return f"""
+    You are an experienced academic reviewer evaluating research abstracts.
+    Your task is to identify the methodological innovation in the study described below.
+    {INNOVATION_GUIDELINES}
+    Abstract:
+    {abstract}
+    """
+
+
 def innovative_with_genai(abstract):
     """
     Dùng Gemini API để phân tích và tìm điểm sáng tạo về phương pháp (methodological innovation)
@@ -922,42 +1180,9 @@ def innovative_with_genai(abstract):
     Returns:
         str: Mô tả ngắn gọn điểm sáng tạo về phương pháp hoặc kỹ thuật được sử dụng.
     """
-    prompt = f"""
-    You are an experienced academic reviewer evaluating research abstracts.
-    Your task is to identify the methodological innovation in the study described below.
-
-    Follow this reasoning process silently before answering:
-
-    Understand what general topic or goal the research addresses (but do not include this in the answer).
-
-    Examine what method, technique, framework, model, or experimental process is used.
-
-    Compare it mentally with common or traditional approaches in the same field.
-
-    Identify what is new, improved, or distinctive about the method or process.
-
-    Then, write the final output clearly and concisely:
-
-    Focus only on the methodological innovation (not findings or topic).
-
-    Write 2–4 sentences in simple academic English.
-
-    Avoid vague terms like “novel,” “innovative,” or “unique” unless you explain how.
-
-    Abstract:
-    {abstract}
-    """
-
-    try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-            config=GenerateContentConfig(temperature=0.3)
-        )
-        return response.text.strip()
-    except Exception as e:
-        print(f"[Gemini Error - Innovation] {e}")
-        return "Tìm điểm sáng tạo về phương pháp không thành công"
+    abstract = prepare_abstract(abstract)
+    results = run_text_prompts([(0, innovation_prompt(abstract), abstract)], 0.3, label="Innovation", stage="innovation")
+    return results.get(0, "Tìm điểm sáng tạo về phương pháp không thành công")
 
 
 
@@ -965,23 +1190,36 @@ def innovative_with_genai(abstract):
 # =========================================
 # Hàm tóm tắt toàn bộ danh sách bài đã lọc
 # =========================================
-def innovative_filtered_papers(filtered_papers):
+def innovative_filtered_papers(filtered_papers, offline=LLM_OFFLINE):
     """
     Tìm điểm sáng tạo của tất cả các bài báo đã lọc.
+    Bài đã có 'innovative' (từ chế độ combined của filter_top_papers) được bỏ qua.
 
     Parameters:
         filtered_papers (list): Danh sách bài báo đã lọc, mỗi bài chứa 'abstract' và 'title'.
+        offline (bool): Chạy qua Gemini Batch API thay vì gọi trực tiếp.
 
     Returns:
         list: Danh sách bài báo với key 'innovative' chứa điểm sáng tạo của tất cả các bài báo.
     """
-    for paper in filtered_papers:
+    items = []
+    for i, paper in enumerate(filtered_papers):
         abstract = paper.get("abstract", "").strip()
         title = paper.get("title", "Untitled")
-        
+
+        if paper.get("innovative"):
+            report_add("llm_innovation", "skipped_combined")
+            continue
         if abstract:
             print(f"Innovating for: {title}")
-            paper["innovative"] = innovative_with_genai(abstract)
-            time.sleep(16)  
+            abstract = prepare_abstract(abstract)
+            items.append((i, innovation_prompt(abstract), abstract))
+            report_add("llm_innovation", "calls")
+
+    # Phân tích mọi bài cùng lúc (song song, hoặc 1 batch job khi offline)
+    innovations = run_text_prompts(items, 0.3, label="Innovation", offline=offline, stage="innovation")
+    for i, _, _ in items:
+        filtered_papers[i]["innovative"] = innovations.get(i, "Tìm điểm sáng tạo về phương pháp không thành công")
 
+    save_llm_cache()
     return filtered_papers
\ No newline at end of file